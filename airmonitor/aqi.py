@@ -0,0 +1,182 @@
+"""
+Cálculo vetorizado do AQI (padrão EPA) para vários poluentes.
+
+As tabelas de breakpoints usam as unidades da EPA:
+    pm25, pm10 -> µg/m³
+    o3, co     -> ppm
+    no2, so2   -> ppb
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# (conc_min, conc_max, aqi_min, aqi_max) por faixa
+_BREAKPOINTS = {
+    "pm25": [
+        (0.0, 12.0, 0, 50),
+        (12.1, 35.4, 51, 100),
+        (35.5, 55.4, 101, 150),
+        (55.5, 150.4, 151, 200),
+        (150.5, 250.4, 201, 300),
+        (250.5, 350.4, 301, 400),
+        (350.5, 500.4, 401, 500),
+    ],
+    "pm10": [
+        (0, 54, 0, 50),
+        (55, 154, 51, 100),
+        (155, 254, 101, 150),
+        (255, 354, 151, 200),
+        (355, 424, 201, 300),
+        (425, 504, 301, 400),
+        (505, 604, 401, 500),
+    ],
+    # Média de 8h até 0.200 ppm; acima disso, faixas da média de 1h
+    "o3": [
+        (0.000, 0.054, 0, 50),
+        (0.055, 0.070, 51, 100),
+        (0.071, 0.085, 101, 150),
+        (0.086, 0.105, 151, 200),
+        (0.106, 0.200, 201, 300),
+        (0.405, 0.504, 301, 400),
+        (0.505, 0.604, 401, 500),
+    ],
+    "no2": [
+        (0, 53, 0, 50),
+        (54, 100, 51, 100),
+        (101, 360, 101, 150),
+        (361, 649, 151, 200),
+        (650, 1249, 201, 300),
+        (1250, 1649, 301, 400),
+        (1650, 2049, 401, 500),
+    ],
+    "so2": [
+        (0, 35, 0, 50),
+        (36, 75, 51, 100),
+        (76, 185, 101, 150),
+        (186, 304, 151, 200),
+        (305, 604, 201, 300),
+        (605, 804, 301, 400),
+        (805, 1004, 401, 500),
+    ],
+    "co": [
+        (0.0, 4.4, 0, 50),
+        (4.5, 9.4, 51, 100),
+        (9.5, 12.4, 101, 150),
+        (12.5, 15.4, 151, 200),
+        (15.5, 30.4, 201, 300),
+        (30.5, 40.4, 301, 400),
+        (40.5, 50.4, 401, 500),
+    ],
+}
+
+
+@lru_cache(maxsize=None)
+def _tabela(poluente: str) -> np.ndarray:
+    """Tabela do poluente como array (uma coluna por campo) para uso com np.searchsorted"""
+    import numpy as np  # importação adiada: numpy pesa no tempo de inicialização
+    return np.array(_BREAKPOINTS[poluente], dtype=np.float64).T
+
+
+POLUENTES = tuple(_BREAKPOINTS)
+
+_ALIASES = {"pm2.5": "pm25", "pm2_5": "pm25"}
+
+# Fatores µg/m³ -> ppb a 25°C (ppb = µg/m³ / fator)
+_UG_M3_POR_PPB = {"o3": 1.96, "no2": 1.88, "so2": 2.62, "co": 1.145}
+
+# Unidade da tabela de cada poluente
+_UNIDADE_TABELA = {"pm25": "ug", "pm10": "ug", "o3": "ppm", "co": "ppm", "no2": "ppb", "so2": "ppb"}
+
+
+def normalizar_poluente(nome: str) -> str:
+    nome = (nome or "").lower()
+    return _ALIASES.get(nome, nome)
+
+
+def converter_unidade(poluente: str, valor: float, unidade: str) -> float:
+    """Converte uma medição da OpenAQ para a unidade da tabela EPA do poluente"""
+    poluente = normalizar_poluente(poluente)
+    destino = _UNIDADE_TABELA[poluente]
+    unidade = (unidade or "").lower().replace("µ", "u").replace("³", "3")
+
+    if destino == "ug" or not unidade:
+        return valor
+
+    if unidade.startswith("ug/m3"):
+        ppb = valor / _UG_M3_POR_PPB[poluente]
+    elif unidade.startswith("mg/m3"):
+        ppb = valor * 1000 / _UG_M3_POR_PPB[poluente]
+    elif unidade == "ppm":
+        ppb = valor * 1000
+    else:
+        ppb = valor
+
+    return ppb / 1000 if destino == "ppm" else ppb
+
+
+def calcular_aqi(poluente: str, concentracoes) -> np.ndarray:
+    """
+    Calcula o AQI de um array de concentrações de um poluente.
+    Valores NaN (sem medição) resultam em NaN.
+    """
+    import numpy as np
+
+    c_min, c_max, i_min, i_max = _tabela(normalizar_poluente(poluente))
+    c = np.clip(np.asarray(concentracoes, dtype=np.float64), 0.0, None)
+
+    # Primeira faixa cujo limite superior é >= concentração; acima da tabela,
+    # extrapola pela última faixa
+    faixa = np.minimum(np.searchsorted(c_max, c, side="left"), len(c_max) - 1)
+
+    aqi = (i_max[faixa] - i_min[faixa]) / (c_max[faixa] - c_min[faixa]) * (c - c_min[faixa]) + i_min[faixa]
+    # Concentrações no intervalo entre duas faixas ficam no topo da anterior
+    aqi = np.maximum(aqi, i_min[faixa] - 1)
+    return np.floor(aqi)
+
+
+def calcular_aqi_multipoluente(concentracoes: Dict[str, Iterable[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula o AQI para N pontos a partir das concentrações de cada poluente
+    (arrays de mesmo tamanho, NaN onde não há medição).
+
+    Retorna (aqi, dominante): o AQI final é o maior entre os poluentes e
+    `dominante` indica o poluente responsável (None se não houver medição).
+    """
+    import numpy as np
+
+    poluentes = [normalizar_poluente(p) for p in concentracoes]
+    indices = np.vstack([calcular_aqi(p, v) for p, v in zip(poluentes, concentracoes.values())])
+
+    validos = ~np.isnan(indices)
+    possui_medicao = validos.any(axis=0)
+    posicao = np.argmax(np.where(validos, indices, -np.inf), axis=0)
+
+    aqi = np.where(possui_medicao, indices[posicao, np.arange(indices.shape[1])], np.nan)
+    dominante = np.where(possui_medicao, np.array(poluentes, dtype=object)[posicao], None)
+    return aqi, dominante
+
+
+def aqi_das_estacoes(estacoes: list) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula o AQI de uma lista de estações da OpenAQ em uma única chamada,
+    a partir das medições de cada estação.
+    """
+    import numpy as np
+
+    if not estacoes:
+        return np.array([]), np.array([], dtype=object)
+
+    concentracoes = {p: np.full(len(estacoes), np.nan) for p in POLUENTES}
+
+    for i, location in enumerate(estacoes):
+        for measurement in location.get("measurements", []):
+            poluente = normalizar_poluente(measurement.get("parameter"))
+            valor = measurement.get("value")
+            if poluente in concentracoes and valor is not None:
+                concentracoes[poluente][i] = converter_unidade(poluente, valor, measurement.get("unit"))
+
+    return calcular_aqi_multipoluente(concentracoes)
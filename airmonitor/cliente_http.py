@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, Optional
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    import httpx
+
+load_dotenv()
+
+# Limites do pool de conexões compartilhado
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Limite padrão de requisições simultâneas por host
+HTTP_HOST_CONCURRENCY = int(os.getenv("HTTP_HOST_CONCURRENCY", "10"))
+# Limites específicos por host, ex: "api.openaq.org=8,api.openweathermap.org=16"
+HTTP_HOST_LIMITS = os.getenv("HTTP_HOST_LIMITS", "")
+
+logger = logging.getLogger(__name__)
+
+
+def _ler_limites_hosts(valor: str) -> Dict[str, int]:
+    limites = {}
+    for item in valor.split(","):
+        if "=" not in item:
+            continue
+        host, limite = item.split("=", 1)
+        try:
+            limites[host.strip()] = int(limite)
+        except ValueError:
+            logger.warning(f"Limite inválido para o host '{host.strip()}': {limite}")
+    return limites
+
+
+class PoolHTTP:
+    """
+    Cliente HTTP assíncrono compartilhado, com conexões persistentes
+    (keep-alive) e limite de requisições simultâneas por host.
+    """
+
+    def __init__(
+        self,
+        max_conexoes: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        limite_por_host: int = HTTP_HOST_CONCURRENCY,
+        limites_hosts: Optional[Dict[str, int]] = None,
+    ):
+        import httpx  # importação adiada: httpx pesa no tempo de inicialização
+
+        self._limites = httpx.Limits(
+            max_connections=max_conexoes,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._limite_por_host = limite_por_host
+        self._limites_hosts = dict(limites_hosts or {})
+        self._semaforos: Dict[str, asyncio.Semaphore] = {}
+        self._cliente: Optional[httpx.AsyncClient] = None
+
+    def _obter_cliente(self) -> httpx.AsyncClient:
+        import httpx
+
+        # Criado sob demanda para ficar associado ao event loop em execução
+        if self._cliente is None or self._cliente.is_closed:
+            self._cliente = httpx.AsyncClient(limits=self._limites)
+        return self._cliente
+
+    def _semaforo(self, host: str) -> asyncio.Semaphore:
+        semaforo = self._semaforos.get(host)
+        if semaforo is None:
+            semaforo = asyncio.Semaphore(self._limites_hosts.get(host, self._limite_por_host))
+            self._semaforos[host] = semaforo
+        return semaforo
+
+    async def get(self, url: str, *, params=None, headers=None, timeout: Optional[float] = None) -> httpx.Response:
+        """Faz um GET respeitando o limite de concorrência do host de destino."""
+        host = urlsplit(url).netloc
+        async with self._semaforo(host):
+            return await self._obter_cliente().get(url, params=params, headers=headers, timeout=timeout)
+
+    async def fechar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+        self._semaforos.clear()
+
+
+_pool: Optional[PoolHTTP] = None
+
+
+def obter_pool_http() -> PoolHTTP:
+    """Singleton para reutilizar o pool entre as requisições"""
+    global _pool
+    if _pool is None:
+        _pool = PoolHTTP(limites_hosts=_ler_limites_hosts(HTTP_HOST_LIMITS))
+    return _pool
+
+
+async def fechar_pool_http():
+    """Fecha as conexões abertas (usado no shutdown da aplicação)"""
+    global _pool
+    if _pool is not None:
+        await _pool.fechar()
+        _pool = None
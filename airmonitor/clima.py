@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from airqualityapp.cache import CacheTTL, CACHE_ACERTO, CACHE_CONSULTA, CACHE_OBSOLETO, CACHE_PADRAO
+from airqualityapp.singleflight import SingleFlight
+from .cliente_http import obter_pool_http
+from .geotile import geotile, centro_geotile
+
+load_dotenv()
+
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "d7850b94e00a68bac75067fb77e0b177")
+OPENWEATHER_API_URL = os.getenv("OPENWEATHER_API_URL") or "https://api.openweathermap.org/data/2.5/weather"
+OPENWEATHER_TIMEOUT = float(os.getenv("OPENWEATHER_TIMEOUT", "5"))
+
+# O clima muda em escala de ~10 minutos e de alguns quilômetros
+CLIMA_CACHE_TTL = float(os.getenv("CLIMA_CACHE_TTL", "600"))
+CLIMA_CACHE_PRECISAO = int(os.getenv("CLIMA_CACHE_PRECISAO", "5"))
+CLIMA_CACHE_MAX_ENTRADAS = int(os.getenv("CLIMA_CACHE_MAX_ENTRADAS", "20000"))
+# Por quanto tempo o último clima conhecido pode ser servido se a OpenWeather falhar
+CLIMA_CACHE_OBSOLETO = float(os.getenv("CLIMA_CACHE_OBSOLETO", "3600"))
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_resposta_openweather(data: dict) -> dict:
+    """Extrai os campos usados pela API da resposta da OpenWeather"""
+    # Precipitação: chuva ou neve
+    chuva = 0.0
+    if "rain" in data:
+        chuva = data["rain"].get("1h") or data["rain"].get("3h") or 0.0
+
+    neve = 0.0
+    if "snow" in data:
+        neve = data["snow"].get("1h") or data["snow"].get("3h") or 0.0
+
+    return {
+        "cidade": data.get("name"),
+        "temperatura": data["main"]["temp"],
+        "umidade": data["main"]["humidity"],
+        "vento": data["wind"]["speed"],
+        "descricao": data["weather"][0]["description"],
+        "chuva_mm": chuva,
+        "neve_mm": neve
+    }
+
+
+class ClienteClima:
+    """
+    Cliente da OpenWeather com pool de conexões compartilhado, cache TTL por
+    geotile ou cidade e agrupamento de chamadas simultâneas.
+    """
+
+    def __init__(self, api_key: str = OPENWEATHER_API_KEY, url: str = OPENWEATHER_API_URL,
+                 ttl: float = CLIMA_CACHE_TTL, precisao: int = CLIMA_CACHE_PRECISAO):
+        self.api_key = api_key
+        self.url = url
+        self.precisao = precisao
+        self.cache = CacheTTL(ttl=ttl, max_entradas=CLIMA_CACHE_MAX_ENTRADAS, tempo_obsoleto=CLIMA_CACHE_OBSOLETO)
+        self.voos = SingleFlight()
+        self.chamadas_upstream = 0
+        self.falhas_upstream = 0
+        self._latencias = deque(maxlen=1000)
+
+    async def _buscar(self, params: dict) -> Optional[dict]:
+        if not self.api_key:
+            logger.error("Chave da OpenWeather não encontrada no ambiente")
+            return None
+
+        params = {**params, "units": "metric", "appid": self.api_key, "lang": "pt_br"}
+        inicio = time.monotonic()
+        self.chamadas_upstream += 1
+        import httpx  # importação adiada: httpx pesa no tempo de inicialização
+
+        try:
+            resp = await obter_pool_http().get(self.url, params=params, timeout=OPENWEATHER_TIMEOUT)
+            resp.raise_for_status()
+            return normalizar_resposta_openweather(resp.json())
+        except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+            self.falhas_upstream += 1
+            logger.error(f"Erro ao buscar dados do OpenWeather: {e}")
+            return None
+        finally:
+            self._latencias.append(time.monotonic() - inicio)
+
+    async def _obter_com_status(self, chave: tuple, params: dict,
+                                prazo: Optional[float] = None) -> Tuple[Optional[dict], str]:
+        clima = self.cache.obter(chave)
+        if clima is not None:
+            return clima, CACHE_ACERTO
+
+        async def consultar():
+            clima = await self._buscar(params)
+            if clima is not None:
+                self.cache.definir(chave, clima)
+            return clima
+
+        try:
+            # Ao estourar o prazo a consulta continua e preenche o cache
+            clima = await asyncio.wait_for(self.voos.executar(chave, consultar), timeout=prazo)
+        except asyncio.TimeoutError:
+            logger.warning(f"OpenWeather não respondeu em {prazo}s para {chave[1]}")
+            clima = None
+
+        if clima is not None:
+            return clima, CACHE_CONSULTA
+        obsoleto = self.cache.obter_obsoleto(chave)
+        if obsoleto is not None:
+            return obsoleto, CACHE_OBSOLETO
+        return None, CACHE_PADRAO
+
+    async def _obter(self, chave: tuple, params: dict) -> Optional[dict]:
+        clima, _ = await self._obter_com_status(chave, params)
+        return clima
+
+    async def obter_por_geotile(self, tile: str) -> Optional[dict]:
+        """Clima no centro do geotile (truncado para a precisão do cache)"""
+        tile = tile[:self.precisao]
+        lat, lon = centro_geotile(tile)
+        return await self._obter(("tile", tile), {"lat": lat, "lon": lon})
+
+    async def obter_por_coordenadas(self, lat: float, lon: float) -> Optional[dict]:
+        return await self.obter_por_geotile(geotile(lat, lon, self.precisao))
+
+    async def obter_por_cidade(self, cidade: str) -> Optional[dict]:
+        clima, _ = await self.obter_por_cidade_com_status(cidade)
+        return clima
+
+    async def obter_por_cidade_com_status(self, cidade: str,
+                                          prazo: Optional[float] = None) -> Tuple[Optional[dict], str]:
+        """Clima da cidade e a origem do valor (CACHE_ACERTO, CACHE_CONSULTA, ...)"""
+        return await self._obter_com_status(("cidade", cidade.strip().lower()), {"q": cidade}, prazo)
+
+    async def prefetch(self, tiles: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """
+        Carrega de uma vez o clima de vários geotiles (em paralelo) e retorna
+        um dicionário geotile -> clima com as chaves originais.
+        """
+        tiles = list(dict.fromkeys(tiles))
+        resultados = await asyncio.gather(*(self.obter_por_geotile(t) for t in tiles))
+        return dict(zip(tiles, resultados))
+
+    def estatisticas(self) -> dict:
+        latencias = sorted(self._latencias)
+        return {
+            "cache": self.cache.estatisticas(),
+            "chamadas_upstream": self.chamadas_upstream,
+            "falhas_upstream": self.falhas_upstream,
+            "latencia_media_ms": round(sum(latencias) / len(latencias) * 1000, 1) if latencias else None,
+            "latencia_p95_ms": round(latencias[int(len(latencias) * 0.95) - 1] * 1000, 1) if latencias else None
+        }
+
+
+cliente_clima = ClienteClima()
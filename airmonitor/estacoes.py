@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import os
+import math
+import time
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+from dotenv import load_dotenv
+
+from .openaq import obter_cliente_openaq
+from .aqi import aqi_das_estacoes
+
+if TYPE_CHECKING:
+    import numpy as np
+
+load_dotenv()
+
+# Catálogo local de estações da OpenAQ
+OPENAQ_CATALOGO_ATIVO = os.getenv("OPENAQ_CATALOGO_ATIVO", "true").lower() == "true"
+OPENAQ_CATALOGO_INTERVALO = float(os.getenv("OPENAQ_CATALOGO_INTERVALO", "1800"))
+OPENAQ_CATALOGO_MAX_PAGINAS = int(os.getenv("OPENAQ_CATALOGO_MAX_PAGINAS", "20"))
+OPENAQ_CATALOGO_LIMITE = int(os.getenv("OPENAQ_CATALOGO_LIMITE", "1000"))
+# Regiões cobertas, separadas por ";" no formato "min_lon,min_lat,max_lon,max_lat".
+# Vazio = sem restrição de região.
+OPENAQ_CATALOGO_BBOXES = [b.strip() for b in os.getenv("OPENAQ_CATALOGO_BBOXES", "").split(";") if b.strip()]
+
+RAIO_TERRA_M = 6371000.0
+
+logger = logging.getLogger(__name__)
+
+
+def para_cartesiano(lat, lon) -> np.ndarray:
+    """Converte lat/lon (graus) em pontos na esfera unitária, shape (n, 3)"""
+    import numpy as np  # importação adiada: numpy pesa no tempo de inicialização
+
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype=np.float64)))
+    lon = np.radians(np.atleast_1d(np.asarray(lon, dtype=np.float64)))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def distancia_para_corda(metros: float) -> float:
+    """Distância sobre a superfície -> distância euclidiana na esfera unitária"""
+    return 2.0 * math.sin(min(metros / RAIO_TERRA_M, math.pi) / 2.0)
+
+
+class CatalogoEstacoes:
+    """
+    Catálogo em memória das estações e suas últimas medições, indexado por
+    uma KD-tree sobre coordenadas 3D para buscas por vizinhança em O(log n).
+    """
+
+    def __init__(self):
+        # (arvore, estacoes, aqi) é trocado de uma vez a cada atualização
+        self._indice = (None, [], None)
+        self.atualizado_em: Optional[float] = None
+        # Funções chamadas (em uma thread) após cada atualização do catálogo
+        self.ouvintes: List[Callable[["CatalogoEstacoes"], None]] = []
+
+    @property
+    def pronto(self) -> bool:
+        return self._indice[0] is not None
+
+    @property
+    def estacoes(self) -> List[dict]:
+        return self._indice[1]
+
+    def carregar(self, resultados: List[dict]):
+        """Reconstrói o índice a partir dos resultados de /locations"""
+        from scipy.spatial import cKDTree
+
+        estacoes = []
+        for location in resultados:
+            coords = location.get("coordinates") or {}
+            lat, lon = coords.get("latitude"), coords.get("longitude")
+            if lat is None or lon is None:
+                continue
+            estacoes.append(location)
+
+        if not estacoes:
+            logger.warning("Catálogo de estações vazio, mantendo o índice anterior")
+            return
+
+        lats = [e["coordinates"]["latitude"] for e in estacoes]
+        lons = [e["coordinates"]["longitude"] for e in estacoes]
+        arvore = cKDTree(para_cartesiano(lats, lons))
+        # AQI de todas as estações calculado de uma vez
+        aqi, _ = aqi_das_estacoes(estacoes)
+
+        self._indice = (arvore, estacoes, aqi)
+        self.atualizado_em = time.time()
+        logger.info(f"Catálogo de estações atualizado: {len(estacoes)} estações")
+
+    def _indices_proximos(self, lat: float, lon: float, raio_em_metros: int, k: int) -> np.ndarray:
+        import numpy as np
+
+        arvore, estacoes, _ = self._indice
+        if arvore is None:
+            return np.array([], dtype=np.intp)
+
+        _, indices = arvore.query(
+            para_cartesiano(lat, lon)[0], k=min(k, len(estacoes)),
+            distance_upper_bound=distancia_para_corda(raio_em_metros)
+        )
+        indices = np.atleast_1d(indices)
+
+        # Índices iguais a len(estacoes) indicam vizinhos fora do raio
+        return indices[indices < len(estacoes)]
+
+    def proximas(self, lat: float, lon: float, raio_em_metros: int = 25000, k: int = 10) -> List[dict]:
+        """Estações dentro do raio, ordenadas da mais próxima para a mais distante"""
+        estacoes = self._indice[1]
+        return [estacoes[i] for i in self._indices_proximos(lat, lon, raio_em_metros, k)]
+
+    def aqi_proximo(self, lat: float, lon: float, raio_em_metros: int = 25000, k: int = 10) -> Optional[int]:
+        """AQI da estação mais próxima (dentro do raio) que possui medição válida"""
+        aqi = self._indice[2]
+        for i in self._indices_proximos(lat, lon, raio_em_metros, k):
+            if not math.isnan(aqi[i]):
+                return int(aqi[i])
+        return None
+
+    def pontos_com_aqi(self):
+        """Arrays (lats, lons, aqi) das estações que possuem AQI válido"""
+        import numpy as np
+
+        _, estacoes, aqi = self._indice
+        if not estacoes:
+            vazio = np.array([])
+            return vazio, vazio, vazio
+        validos = ~np.isnan(aqi)
+        lats = np.array([e["coordinates"]["latitude"] for e in estacoes], dtype=np.float64)
+        lons = np.array([e["coordinates"]["longitude"] for e in estacoes], dtype=np.float64)
+        return lats[validos], lons[validos], aqi[validos]
+
+    def estatisticas(self) -> dict:
+        return {
+            "estacoes": len(self.estacoes),
+            "atualizado_em": self.atualizado_em
+        }
+
+
+catalogo_estacoes = CatalogoEstacoes()
+
+
+async def atualizar_catalogo(catalogo: CatalogoEstacoes = catalogo_estacoes):
+    """Baixa todas as estações das regiões configuradas e reconstrói o índice"""
+    cliente = obter_cliente_openaq()
+    resultados = []
+
+    for bbox in OPENAQ_CATALOGO_BBOXES or [None]:
+        for pagina in range(1, OPENAQ_CATALOGO_MAX_PAGINAS + 1):
+            data = await cliente.listar_estacoes(bbox=bbox, pagina=pagina, limite=OPENAQ_CATALOGO_LIMITE)
+            pagina_resultados = data.get("results", [])
+            resultados.extend(pagina_resultados)
+            if len(pagina_resultados) < OPENAQ_CATALOGO_LIMITE:
+                break
+
+    catalogo.carregar(resultados)
+
+    for ouvinte in catalogo.ouvintes:
+        try:
+            await asyncio.to_thread(ouvinte, catalogo)
+        except Exception as e:
+            logger.error(f"Erro ao processar atualização do catálogo: {e}")
+
+
+async def _loop_atualizacao(intervalo: float):
+    while True:
+        try:
+            await atualizar_catalogo()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao atualizar catálogo de estações: {e}")
+        await asyncio.sleep(intervalo)
+
+
+_tarefa_atualizacao: Optional[asyncio.Task] = None
+
+
+async def iniciar_atualizacao_catalogo():
+    """Inicia a atualização periódica do catálogo em segundo plano"""
+    global _tarefa_atualizacao
+    if not OPENAQ_CATALOGO_ATIVO or _tarefa_atualizacao is not None:
+        return
+    _tarefa_atualizacao = asyncio.create_task(_loop_atualizacao(OPENAQ_CATALOGO_INTERVALO))
+
+
+async def parar_atualizacao_catalogo():
+    global _tarefa_atualizacao
+    if _tarefa_atualizacao is not None:
+        _tarefa_atualizacao.cancel()
+        try:
+            await _tarefa_atualizacao
+        except asyncio.CancelledError:
+            pass
+        _tarefa_atualizacao = None
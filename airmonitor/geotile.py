@@ -0,0 +1,121 @@
+"""
+Quantização de coordenadas em geotiles (geohash).
+
+Precisão aproximada de cada célula:
+    5 -> 4.9km x 4.9km
+    6 -> 1.2km x 0.6km
+    7 -> 153m x 153m
+"""
+import math
+from typing import List, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_INDICE = {c: i for i, c in enumerate(_BASE32)}
+_METROS_POR_GRAU = 111320.0
+
+
+def geotile(lat: float, lon: float, precisao: int = 6) -> str:
+    """Retorna o geohash da coordenada com `precisao` caracteres"""
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    resultado = []
+    bits = 0
+    valor = 0
+    usar_lon = True
+
+    while len(resultado) < precisao:
+        if usar_lon:
+            meio = (lon_min + lon_max) / 2
+            if lon >= meio:
+                valor = (valor << 1) | 1
+                lon_min = meio
+            else:
+                valor <<= 1
+                lon_max = meio
+        else:
+            meio = (lat_min + lat_max) / 2
+            if lat >= meio:
+                valor = (valor << 1) | 1
+                lat_min = meio
+            else:
+                valor <<= 1
+                lat_max = meio
+        usar_lon = not usar_lon
+        bits += 1
+        if bits == 5:
+            resultado.append(_BASE32[valor])
+            bits = 0
+            valor = 0
+
+    return "".join(resultado)
+
+
+def geotile_valido(tile: str) -> bool:
+    return bool(tile) and all(c in _INDICE for c in tile)
+
+
+def limites_geotile(tile: str) -> Tuple[float, float, float, float]:
+    """Retorna (lat_min, lon_min, lat_max, lon_max) da célula"""
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    usar_lon = True
+
+    for c in tile:
+        valor = _INDICE[c]
+        for deslocamento in range(4, -1, -1):
+            bit = (valor >> deslocamento) & 1
+            if usar_lon:
+                meio = (lon_min + lon_max) / 2
+                if bit:
+                    lon_min = meio
+                else:
+                    lon_max = meio
+            else:
+                meio = (lat_min + lat_max) / 2
+                if bit:
+                    lat_min = meio
+                else:
+                    lat_max = meio
+            usar_lon = not usar_lon
+
+    return lat_min, lon_min, lat_max, lon_max
+
+
+def centro_geotile(tile: str) -> Tuple[float, float]:
+    """Retorna (lat, lon) do centro da célula"""
+    lat_min, lon_min, lat_max, lon_max = limites_geotile(tile)
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+
+def vizinhos_geotile(tile: str) -> List[str]:
+    """Retorna a célula e suas 8 vizinhas (sem repetições nos polos)"""
+    lat_min, lon_min, lat_max, lon_max = limites_geotile(tile)
+    altura, largura = lat_max - lat_min, lon_max - lon_min
+    lat, lon = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+    vizinhos = []
+    for dy in (-1, 0, 1):
+        lat_vizinho = lat + dy * altura
+        if not -90.0 < lat_vizinho < 90.0:
+            continue
+        for dx in (-1, 0, 1):
+            lon_vizinho = (lon + dx * largura + 180.0) % 360.0 - 180.0
+            vizinho = geotile(lat_vizinho, lon_vizinho, len(tile))
+            if vizinho not in vizinhos:
+                vizinhos.append(vizinho)
+    return vizinhos
+
+
+def precisao_para_raio(raio_em_metros: float, lat: float = 0.0, precisao_max: int = 12) -> int:
+    """
+    Maior precisão cujas células têm lados >= raio, de modo que a célula do
+    ponto e suas 8 vizinhas cobrem todo o círculo.
+    """
+    for precisao in range(precisao_max, 0, -1):
+        bits_lat = (5 * precisao) // 2
+        bits_lon = 5 * precisao - bits_lat
+        altura = 180.0 / 2 ** bits_lat * _METROS_POR_GRAU
+        largura = 360.0 / 2 ** bits_lon * _METROS_POR_GRAU * math.cos(math.radians(lat))
+        if min(altura, largura) >= raio_em_metros:
+            return precisao
+    return 1
@@ -0,0 +1,205 @@
+"""
+Histórico de AQI por localização particionado por mês.
+
+Cada mês é gravado em uma tabela própria (`aqi_local_historico_AAAAMM`) com
+índices em (usuario_id, data_hora) e (geotile, data_hora). A rotação cria
+as partições do mês atual e do próximo e remove as mais antigas que a
+retenção configurada. Consultas "ao redor deste ponto neste período" usam
+apenas as partições do período e o índice de geotile.
+"""
+import os
+import math
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import inspect, select, or_
+from sqlalchemy.orm import Session
+
+from airqualityapp.database import Base, engine
+from airqualityapp.exclusao import registrar_fonte_exclusao
+from airqualityapp.historico import buffer_historico
+from airqualityapp.tarefas import TarefaPeriodica
+from .geotile import geotile, vizinhos_geotile, precisao_para_raio
+from .models import definir_tabela_historico_local
+
+load_dotenv()
+
+# Precisão do geotile gravado em cada linha (8 -> ~38m x 19m)
+HISTORICO_LOCAL_PRECISAO = int(os.getenv("HISTORICO_LOCAL_PRECISAO", "8"))
+# Meses mantidos além do atual (0 = nunca remover)
+HISTORICO_LOCAL_RETENCAO_MESES = int(os.getenv("HISTORICO_LOCAL_RETENCAO_MESES", "12"))
+HISTORICO_LOCAL_ROTACAO_INTERVALO = float(os.getenv("HISTORICO_LOCAL_ROTACAO_INTERVALO", "3600"))
+
+PREFIXO_PARTICAO = "aqi_local_historico_"
+_RAIO_TERRA_M = 6371008.8
+
+logger = logging.getLogger(__name__)
+
+# Partições existentes no banco (atualizado a cada rotação)
+_particoes_existentes = set()
+
+
+def _somar_meses(ano: int, mes: int, meses: int):
+    total = ano * 12 + (mes - 1) + meses
+    return total // 12, total % 12 + 1
+
+
+def nome_particao(data_hora: datetime) -> str:
+    return f"{PREFIXO_PARTICAO}{data_hora.year:04d}{data_hora.month:02d}"
+
+
+def tabela_particao(data_hora: datetime):
+    return definir_tabela_historico_local(nome_particao(data_hora))
+
+
+def particoes_do_periodo(inicio: datetime, fim: datetime) -> List[str]:
+    nomes = []
+    ano, mes = inicio.year, inicio.month
+    while (ano, mes) <= (fim.year, fim.month):
+        nomes.append(f"{PREFIXO_PARTICAO}{ano:04d}{mes:02d}")
+        ano, mes = _somar_meses(ano, mes, 1)
+    return nomes
+
+
+def registrar_historico_local(usuario_id: Optional[int], lat: float, lon: float, aqi_original: int,
+                              aqi_personalizado: int, nivel_alerta: str, data_hora: Optional[datetime] = None):
+    """Enfileira a linha no buffer de histórico, na partição do mês de `data_hora`"""
+    data_hora = data_hora or datetime.utcnow()
+    buffer_historico.adicionar(
+        tabela_particao(data_hora),
+        usuario_id=usuario_id,
+        latitude=lat,
+        longitude=lon,
+        geotile=geotile(lat, lon, HISTORICO_LOCAL_PRECISAO),
+        aqi_original=aqi_original,
+        aqi_personalizado=aqi_personalizado,
+        nivel_alerta=nivel_alerta,
+        data_hora=data_hora
+    )
+
+
+def rotacionar_particoes(agora: Optional[datetime] = None):
+    """Cria as partições do mês atual e do próximo e remove as que passaram da retenção"""
+    global _particoes_existentes
+    agora = agora or datetime.utcnow()
+
+    for meses in (0, 1):
+        ano, mes = _somar_meses(agora.year, agora.month, meses)
+        tabela = definir_tabela_historico_local(f"{PREFIXO_PARTICAO}{ano:04d}{mes:02d}")
+        tabela.create(bind=engine, checkfirst=True)
+
+    existentes = {n for n in inspect(engine).get_table_names() if n.startswith(PREFIXO_PARTICAO)}
+
+    if HISTORICO_LOCAL_RETENCAO_MESES > 0:
+        ano, mes = _somar_meses(agora.year, agora.month, -HISTORICO_LOCAL_RETENCAO_MESES)
+        limite = f"{PREFIXO_PARTICAO}{ano:04d}{mes:02d}"
+        for nome in sorted(existentes):
+            if nome < limite:
+                definir_tabela_historico_local(nome).drop(bind=engine, checkfirst=True)
+                Base.metadata.remove(Base.metadata.tables[nome])
+                existentes.discard(nome)
+                logger.info(f"Partição de histórico removida: {nome}")
+
+    _particoes_existentes = existentes
+
+
+def _distancia_metros(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * _RAIO_TERRA_M * math.asin(math.sqrt(a))
+
+
+def consultar_historico_proximo(db: Session, lat: float, lon: float, raio_em_metros: float,
+                                inicio: datetime, fim: datetime, usuario_id: Optional[int] = None,
+                                limite: int = 500) -> List[dict]:
+    """
+    Registros a até `raio_em_metros` do ponto entre `inicio` e `fim`, do mais
+    recente para o mais antigo. Só lê as partições do período e filtra pelas
+    células de geotile que cobrem o círculo.
+    """
+    precisao = min(precisao_para_raio(raio_em_metros, lat), HISTORICO_LOCAL_PRECISAO)
+    celulas = vizinhos_geotile(geotile(lat, lon, precisao))
+
+    # Caixa envolvente do círculo, aplicada no banco sobre as linhas do índice
+    dlat = math.degrees(raio_em_metros / _RAIO_TERRA_M)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+
+    registros = []
+    # Partições da mais recente para a mais antiga; dentro de cada uma, lotes
+    # por data_hora decrescente até completar o limite (o filtro exato do
+    # círculo descarta os cantos da caixa, então um único LIMIT não basta)
+    for nome in reversed(particoes_do_periodo(inicio, fim)):
+        if nome not in _particoes_existentes:
+            continue
+        tabela = definir_tabela_historico_local(nome)
+        if precisao == HISTORICO_LOCAL_PRECISAO:
+            filtro_geotile = tabela.c.geotile.in_(celulas)
+        else:
+            filtro_geotile = or_(*(tabela.c.geotile.like(f"{c}%") for c in celulas))
+
+        consulta = (
+            select(tabela)
+            .where(filtro_geotile)
+            .where(tabela.c.data_hora >= inicio)
+            .where(tabela.c.latitude.between(lat - dlat, lat + dlat))
+            .where(tabela.c.longitude.between(lon - dlon, lon + dlon))
+            .order_by(tabela.c.data_hora.desc(), tabela.c.id.desc())
+            .limit(limite)
+        )
+        if usuario_id is not None:
+            consulta = consulta.where(tabela.c.usuario_id == usuario_id)
+
+        cursor = (fim, None)
+        while len(registros) < limite:
+            data_cursor, id_cursor = cursor
+            if id_cursor is None:
+                lote = consulta.where(tabela.c.data_hora <= data_cursor)
+            else:
+                lote = consulta.where(or_(
+                    tabela.c.data_hora < data_cursor,
+                    (tabela.c.data_hora == data_cursor) & (tabela.c.id < id_cursor)
+                ))
+            linhas = db.execute(lote).mappings().all()
+
+            for linha in linhas:
+                distancia = _distancia_metros(lat, lon, linha["latitude"], linha["longitude"])
+                if distancia <= raio_em_metros:
+                    registros.append({**linha, "distancia_m": round(distancia, 1)})
+
+            if len(linhas) < limite:
+                break
+            cursor = (linhas[-1]["data_hora"], linhas[-1]["id"])
+
+        if len(registros) >= limite:
+            break
+
+    return registros[:limite]
+
+
+def _tabelas_para_exclusao():
+    """Tabela base e todas as partições existentes no banco, para o expurgo de contas"""
+    nomes = sorted(n for n in inspect(engine).get_table_names()
+                   if n == "aqi_local_historico" or n.startswith(PREFIXO_PARTICAO))
+    return [definir_tabela_historico_local(n) for n in nomes]
+
+
+registrar_fonte_exclusao(_tabelas_para_exclusao)
+
+_tarefa_rotacao = TarefaPeriodica("rotacao-historico-local", rotacionar_particoes, HISTORICO_LOCAL_ROTACAO_INTERVALO)
+
+
+async def iniciar_rotacao_historico_local():
+    try:
+        await asyncio.to_thread(rotacionar_particoes)
+    except Exception as e:
+        logger.error(f"Erro ao criar partições do histórico local: {e}")
+    _tarefa_rotacao.iniciar()
+
+
+async def parar_rotacao_historico_local():
+    await asyncio.to_thread(_tarefa_rotacao.parar, False)
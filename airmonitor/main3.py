@@ -1,23 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional
-import requests
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import json
 import os
 import logging
 
 from airqualityapp.database import get_db
-from airqualityapp.crud import salvar_historico, obter_perfil_usuario
-from airqualityapp.utils import calcular_indice_personalizado
-from .monitor import obter_aqi_nasa_tempo_geo
-from .notifications import enviar_alerta_push
+from airqualityapp.main2 import get_authenticated_user, get_authenticated_user_opcional
+from airqualityapp.perfis import obter_perfil_resumo_async, obter_perfis_resumo, cache_perfis
+from airqualityapp.historico import buffer_historico, registrar_historico
+from airqualityapp.mail_sender import remetente_email
+from airqualityapp.utils import calcular_indice_personalizado, calcular_indices_personalizados_lote
+from .monitor import obter_aqi_por_geotile, cache_aqi, cache_aqi_cidade, voos_aqi, breaker_openaq, AQI_CACHE_PRECISAO
+from .geotile import geotile, centro_geotile
+from .cliente_http import fechar_pool_http
+from .estacoes import catalogo_estacoes, iniciar_atualizacao_catalogo, parar_atualizacao_catalogo
+from .superficie import superficie_aqi
+from .clima import cliente_clima
+from .historico_local import (
+    registrar_historico_local, consultar_historico_proximo,
+    iniciar_rotacao_historico_local, parar_rotacao_historico_local
+)
+from .streaming import gerenciador_assinaturas, normalizar_tiles, parar_streaming, STREAM_MAX_TILES
+from .notifications import enviar_alerta_push, despachante_alertas, iniciar_despachante_alertas, parar_despachante_alertas
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Variável de API
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "d7850b94e00a68bac75067fb77e0b177")
+# Prazos (segundos) de cada dependência consultada por /monitor/aqi
+MONITOR_PRAZO_AQI = float(os.getenv("MONITOR_PRAZO_AQI", "6"))
+MONITOR_PRAZO_PERFIL = float(os.getenv("MONITOR_PRAZO_PERFIL", "2"))
+MONITOR_PRAZO_CLIMA = float(os.getenv("MONITOR_PRAZO_CLIMA", "3"))
+
+# Máximo de pontos aceitos por requisição em lote
+AQI_BATCH_MAX_PONTOS = int(os.getenv("AQI_BATCH_MAX_PONTOS", "1000"))
 
 # --- Modelos Pydantic para resposta ---
 class Clima(BaseModel):
@@ -37,48 +59,57 @@ class AqiResponse(BaseModel):
     nivel_alerta: str
     usuario_id: Optional[int]
     clima: Optional[Clima]
+    dados_desatualizados: bool = False
 
-# --- Função para buscar dados da OpenWeather (incluindo chuva/neve) ---
-def obter_dados_openweather(lat: float, lon: float) -> Optional[dict]:
-    if not OPENWEATHER_API_KEY:
-        logger.error("Chave da OpenWeather não encontrada no ambiente")
-        return None
+# --- Modelos Pydantic para consulta em lote ---
+class PontoAqi(BaseModel):
+    lat: float
+    lon: float
+    usuario_id: Optional[int] = None
 
-    url = (
-        f"https://api.openweathermap.org/data/2.5/weather?"
-        f"lat={lat}&lon={lon}&units=metric&appid={OPENWEATHER_API_KEY}&lang=pt_br"
-    )
-    try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
+class AqiBatchRequest(BaseModel):
+    pontos: List[PontoAqi] = Field(..., min_length=1, max_length=AQI_BATCH_MAX_PONTOS)
+    incluir_clima: bool = False
 
-        # Precipitação: chuva ou neve
-        chuva = 0.0
-        if "rain" in data:
-            chuva = data["rain"].get("1h") or data["rain"].get("3h") or 0.0
+class AqiBatchItem(BaseModel):
+    latitude: float
+    longitude: float
+    geotile: str
+    aqi_original: Optional[float]
+    aqi_personalizado: Optional[float]
+    nivel_alerta: Optional[str]
+    usuario_id: Optional[int]
+    clima: Optional[Clima] = None
+    dados_desatualizados: bool = False
+    erro: Optional[str] = None
 
-        neve = 0.0
-        if "snow" in data:
-            neve = data["snow"].get("1h") or data["snow"].get("3h") or 0.0
+class HistoricoLocalItem(BaseModel):
+    usuario_id: Optional[int]
+    latitude: float
+    longitude: float
+    geotile: Optional[str]
+    aqi_original: int
+    aqi_personalizado: int
+    nivel_alerta: str
+    data_hora: datetime
+    distancia_m: float
 
-        return {
-            "cidade": data.get("name"),
-            "temperatura": data["main"]["temp"],
-            "umidade": data["main"]["humidity"],
-            "vento": data["wind"]["speed"],
-            "descricao": data["weather"][0]["description"],
-            "chuva_mm": chuva,
-            "neve_mm": neve
-        }
+async def com_prazo(aguardavel, prazo: float, nome: str, padrao=None):
+    """Aguarda uma dependência até o prazo; em caso de timeout ou erro retorna `padrao`"""
+    try:
+        return await asyncio.wait_for(aguardavel, timeout=prazo)
+    except asyncio.TimeoutError:
+        logger.warning(f"Prazo de {prazo}s excedido ao obter {nome}")
     except Exception as e:
-        logger.error(f"Erro ao buscar dados do OpenWeather: {e}")
-        return None
+        logger.error(f"Erro ao obter {nome}: {e}")
+    return padrao
+
+async def _valor(valor=None):
+    return valor
 
 # --- Função para processar AQI personalizado ---
-def processar_aqi_para_usuario(db: Session, usuario_id: int, aqi_original: float):
+def processar_aqi_para_usuario(usuario_id: int, aqi_original: float, perfil):
     try:
-        perfil = obter_perfil_usuario(db, usuario_id)
         if perfil:
             perfil_dict = {
                 "possui_asma": perfil.possui_asma,
@@ -89,10 +120,8 @@ def processar_aqi_para_usuario(db: Session, usuario_id: int, aqi_original: float
             }
             aqi_personalizado, nivel_alerta = calcular_indice_personalizado(aqi_original, perfil_dict)
             
-            try:
-                salvar_historico(db, usuario_id, aqi_original, aqi_personalizado, nivel_alerta)
-            except Exception as e:
-                logger.error(f"Erro ao salvar histórico: {e}")
+            # Gravado em segundo plano pelo buffer de histórico
+            registrar_historico(usuario_id, aqi_original, aqi_personalizado, nivel_alerta)
             
             return aqi_personalizado, nivel_alerta
         else:
@@ -105,37 +134,74 @@ def processar_aqi_para_usuario(db: Session, usuario_id: int, aqi_original: float
 # --- Endpoint principal ---
 app = APIRouter()
 
+
+async def iniciar():
+    """Inicia as tarefas em segundo plano do módulo (chamada pelo lifespan de main.py)"""
+    # Catálogo local de estações atualizado em segundo plano
+    await iniciar_atualizacao_catalogo()
+    # Partições mensais do histórico por localização
+    await iniciar_rotacao_historico_local()
+    # Alertas push são entregues em segundo plano, fora do caminho da requisição
+    await iniciar_despachante_alertas()
+
+
+async def encerrar():
+    """Encerra as tarefas do módulo e fecha as conexões persistentes"""
+    await parar_atualizacao_catalogo()
+    await parar_rotacao_historico_local()
+    await parar_despachante_alertas()
+    # Encerrar atualizadores das assinaturas de geotiles
+    await parar_streaming()
+    await fechar_pool_http()
+
+
 @app.get("/monitor/aqi", response_model=AqiResponse)
-def monitor_aqi_live(
+async def monitor_aqi_live(
     lat: float = Query(..., description="Latitude do usuário"),
     lon: float = Query(..., description="Longitude do usuário"),
     usuario_id: Optional[int] = Query(None, description="ID do usuário"),
-    db: Session = Depends(get_db)
+    usuario_autenticado = Depends(get_authenticated_user_opcional)
 ):
     try:
+        if usuario_autenticado is not None and usuario_id is None:
+            usuario_id = usuario_autenticado.id
         logger.info(f"Requisição AQI recebida: lat={lat}, lon={lon}, usuario_id={usuario_id}")
 
-        # Obter AQI da NASA TEMPO
-        aqi_original = obter_aqi_nasa_tempo_geo(lat, lon)
+        # AQI, perfil de saúde e clima são independentes: consultar em paralelo,
+        # cada um com seu prazo. Falha no perfil ou no clima afeta só o próprio campo.
+        # O perfil é lido em thread com sessão própria: a consulta pode continuar
+        # depois do prazo, e a sessão da requisição não pode ser usada entre threads.
+        (aqi_original, desatualizado), perfil, clima = await asyncio.gather(
+            com_prazo(obter_aqi_por_geotile(lat, lon), MONITOR_PRAZO_AQI, "AQI", padrao=(None, False)),
+            com_prazo(obter_perfil_resumo_async(usuario_id), MONITOR_PRAZO_PERFIL, "perfil")
+            if usuario_id else _valor(),
+            # Obter dados meteorológicos da OpenWeather (inclui chuva/neve)
+            com_prazo(cliente_clima.obter_por_coordenadas(lat, lon), MONITOR_PRAZO_CLIMA, "clima"),
+        )
+
         if aqi_original is None:
             logger.error("API NASA TEMPO não retornou dados válidos")
             raise HTTPException(status_code=503, detail="Serviço temporariamente indisponível")
 
+        # Conta excluída com expurgo em andamento: atendida como anônima, sem
+        # personalização, histórico ou alertas vinculados ao usuário
+        if perfil is not None and perfil.excluido:
+            usuario_id, perfil = None, None
+
         # Processar AQI personalizado
         aqi_personalizado, nivel_alerta = (
-            processar_aqi_para_usuario(db, usuario_id, aqi_original)
+            processar_aqi_para_usuario(usuario_id, aqi_original, perfil)
             if usuario_id else (aqi_original, "verde")
         )
 
-        # Enviar alerta push se AQI alto
-        if aqi_personalizado > 100 and usuario_id:
-            try:
-                enviar_alerta_push(usuario_id, f"AQI alto ({aqi_personalizado}) na sua localização!")
-            except Exception as e:
-                logger.error(f"Erro ao enviar alerta push: {e}")
+        # Histórico de localização só do usuário do token: `usuario_id` da query não é
+        # autenticado, e chamadas anônimas não teriam quem as consultasse
+        if usuario_autenticado is not None and usuario_id == usuario_autenticado.id:
+            registrar_historico_local(usuario_id, lat, lon, aqi_original, aqi_personalizado, nivel_alerta)
 
-        # Obter dados meteorológicos da OpenWeather (inclui chuva/neve)
-        clima = obter_dados_openweather(lat, lon)
+        # Enfileirar alerta push se AQI alto (repetidos na janela de supressão são ignorados)
+        if aqi_personalizado > 100 and usuario_id:
+            enviar_alerta_push(usuario_id, f"AQI alto ({aqi_personalizado}) na sua localização!", nivel_alerta)
 
         logger.info(f"Resposta enviada com sucesso: AQI original={aqi_original}, AQI personalizado={aqi_personalizado}")
 
@@ -146,11 +212,212 @@ def monitor_aqi_live(
             "aqi_personalizado": aqi_personalizado,
             "nivel_alerta": nivel_alerta,
             "usuario_id": usuario_id,
-            "clima": clima
+            "clima": clima,
+            "dados_desatualizados": desatualizado
         }
 
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Erro inesperado no endpoint /monitor/aqi: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Erro interno ao processar requisição de qualidade do ar")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Erro interno ao processar requisição de qualidade do ar")
+
+
+@app.post("/monitor/aqi/batch", response_model=List[AqiBatchItem])
+async def monitor_aqi_batch(
+    requisicao: AqiBatchRequest,
+    formato: str = Query("json", pattern="^(json|ndjson)$", description="json ou ndjson (streaming)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Consulta o AQI de vários pontos em uma única requisição.
+    Os pontos são agrupados por geotile: cada geotile distinto é consultado
+    uma única vez (em paralelo) e a personalização é feita em lote.
+    """
+    pontos = requisicao.pontos
+    tiles = [geotile(p.lat, p.lon, AQI_CACHE_PRECISAO) for p in pontos]
+    tiles_unicos = list(dict.fromkeys(tiles))
+    usuario_ids = {p.usuario_id for p in pontos if p.usuario_id}
+
+    async def consultar_tile(tile):
+        return await obter_aqi_por_geotile(*centro_geotile(tile))
+
+    async def consultar_clima():
+        # Uma única carga em lote do clima de todos os geotiles
+        return await cliente_clima.prefetch(tiles_unicos) if requisicao.incluir_clima else {}
+
+    try:
+        resultados_aqi, clima_por_tile, perfis = await asyncio.gather(
+            asyncio.gather(*(consultar_tile(t) for t in tiles_unicos)),
+            consultar_clima(),
+            run_in_threadpool(obter_perfis_resumo, db, usuario_ids),
+        )
+    except Exception as e:
+        logger.error(f"Erro inesperado no endpoint /monitor/aqi/batch: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro interno ao processar requisição de qualidade do ar")
+
+    aqi_por_tile = dict(zip(tiles_unicos, resultados_aqi))
+
+    # Personalização vetorizada de todos os pontos
+    aqi_original = [aqi_por_tile[t][0] if aqi_por_tile[t][0] is not None else float("nan") for t in tiles]
+    # Contas excluídas (expurgo em andamento) não são personalizadas
+    perfis_pontos = [perfis.get(p.usuario_id) for p in pontos]
+    perfis_pontos = [perfil if perfil is not None and not perfil.excluido else None for perfil in perfis_pontos]
+    aqi_personalizado, nivel_alerta = calcular_indices_personalizados_lote(
+        aqi_original, [perfil or {} for perfil in perfis_pontos]
+    )
+
+    def montar_item(i):
+        ponto, tile = pontos[i], tiles[i]
+        aqi, desatualizado = aqi_por_tile[tile]
+        item = {
+            "latitude": ponto.lat,
+            "longitude": ponto.lon,
+            "geotile": tile,
+            "aqi_original": aqi,
+            "aqi_personalizado": None,
+            "nivel_alerta": None,
+            "usuario_id": ponto.usuario_id,
+            "clima": clima_por_tile.get(tile),
+            "dados_desatualizados": desatualizado,
+            "erro": None
+        }
+        if aqi is None:
+            item["erro"] = "Serviço temporariamente indisponível"
+        elif perfis_pontos[i] is not None:
+            item["aqi_personalizado"] = float(aqi_personalizado[i])
+            item["nivel_alerta"] = nivel_alerta[i]
+        else:
+            # Mesmo comportamento de /monitor/aqi para pontos sem perfil
+            item["aqi_personalizado"] = aqi
+            item["nivel_alerta"] = "verde"
+        return item
+
+    logger.info(f"Lote AQI: {len(pontos)} pontos em {len(tiles_unicos)} geotiles")
+
+    if formato == "ndjson":
+        def gerar_linhas():
+            for i in range(len(pontos)):
+                yield json.dumps(montar_item(i), ensure_ascii=False) + "\n"
+        return StreamingResponse(gerar_linhas(), media_type="application/x-ndjson")
+
+    return [montar_item(i) for i in range(len(pontos))]
+
+
+@app.get("/monitor/historico/local", response_model=List[HistoricoLocalItem])
+async def monitor_historico_local(
+    lat: float = Query(..., description="Latitude do centro da busca"),
+    lon: float = Query(..., description="Longitude do centro da busca"),
+    raio: float = Query(1000, gt=0, le=50000, description="Raio em metros"),
+    inicio: Optional[datetime] = Query(None, description="Início do período (padrão: últimas 24h)"),
+    fim: Optional[datetime] = Query(None, description="Fim do período (padrão: agora)"),
+    limite: int = Query(500, ge=1, le=5000),
+    usuario_autenticado = Depends(get_authenticated_user),
+    db: Session = Depends(get_db)
+):
+    """Histórico de AQI do usuário autenticado registrado ao redor de um ponto em um período"""
+    fim = fim or datetime.utcnow()
+    inicio = inicio or fim - timedelta(days=1)
+    if inicio > fim:
+        raise HTTPException(status_code=422, detail="'inicio' deve ser anterior a 'fim'")
+
+    return await run_in_threadpool(
+        consultar_historico_proximo, db, lat, lon, raio, inicio, fim, usuario_autenticado.id, limite
+    )
+
+
+def _tiles_da_requisicao(tiles: str) -> List[str]:
+    try:
+        normalizados = normalizar_tiles(tiles.split(","))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not normalizados or len(normalizados) > STREAM_MAX_TILES:
+        raise HTTPException(status_code=422, detail=f"Informe de 1 a {STREAM_MAX_TILES} geotiles")
+    return normalizados
+
+
+@app.websocket("/monitor/ws")
+async def monitor_aqi_websocket(websocket: WebSocket, tiles: str = ""):
+    """
+    Atualizações de AQI por geotile via WebSocket.
+    Mensagens do cliente: {"assinar": [geotiles]} ou {"cancelar": [geotiles]}.
+    O servidor envia um objeto por atualização, apenas quando o valor muda.
+    """
+    await websocket.accept()
+    fila = gerenciador_assinaturas.nova_fila()
+    assinados = set()
+
+    def assinar(novos: List[str]):
+        for tile in novos:
+            if tile not in assinados and len(assinados) < STREAM_MAX_TILES:
+                assinados.add(tile)
+                gerenciador_assinaturas.assinar(tile, fila)
+
+    async def enviar():
+        while True:
+            await websocket.send_json(await fila.get())
+
+    envio = asyncio.create_task(enviar())
+    try:
+        assinar(normalizar_tiles(tiles.split(",")))
+        while True:
+            mensagem = await websocket.receive_json()
+            try:
+                assinar(normalizar_tiles(mensagem.get("assinar", [])))
+                for tile in normalizar_tiles(mensagem.get("cancelar", [])):
+                    assinados.discard(tile)
+                    gerenciador_assinaturas.cancelar(tile, fila)
+            except (ValueError, AttributeError) as e:
+                await websocket.send_json({"erro": str(e)})
+    except WebSocketDisconnect:
+        pass
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+    finally:
+        envio.cancel()
+        gerenciador_assinaturas.cancelar_todos(fila)
+
+
+@app.get("/monitor/sse")
+async def monitor_aqi_sse(request: Request, tiles: str = Query(..., description="Geotiles separados por vírgula")):
+    """Atualizações de AQI por geotile via Server-Sent Events"""
+    tiles = _tiles_da_requisicao(tiles)
+    fila = gerenciador_assinaturas.nova_fila()
+    for tile in tiles:
+        gerenciador_assinaturas.assinar(tile, fila)
+
+    async def eventos():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    mensagem = await asyncio.wait_for(fila.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comentário SSE para manter a conexão aberta em proxies
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(mensagem, ensure_ascii=False)}\n\n"
+        finally:
+            gerenciador_assinaturas.cancelar_todos(fila)
+
+    return StreamingResponse(
+        eventos(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+@app.get("/monitor/metricas")
+def monitor_metricas():
+    """Métricas internas dos caches do monitor"""
+    return {
+        "cache_aqi": cache_aqi.estatisticas(),
+        "cache_aqi_cidade": cache_aqi_cidade.estatisticas(),
+        "catalogo_estacoes": catalogo_estacoes.estatisticas(),
+        "superficie_aqi": superficie_aqi.estatisticas(),
+        "singleflight_aqi": voos_aqi.estatisticas(),
+        "circuito_openaq": breaker_openaq.estatisticas(),
+        "clima": cliente_clima.estatisticas(),
+        "alertas_push": despachante_alertas.estatisticas(),
+        "buffer_historico": buffer_historico.estatisticas(),
+        "fila_emails": remetente_email.estatisticas(),
+        "streaming": gerenciador_assinaturas.estatisticas(),
+        "cache_perfis": cache_perfis.estatisticas()
+    }
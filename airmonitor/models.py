@@ -1,18 +1,39 @@
-from sqlalchemy import Column, Integer, Float, String, TIMESTAMP, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, TIMESTAMP, ForeignKey, Index, Table, MetaData
 from sqlalchemy.sql import func
 from airqualityapp.database import Base
 
-class AQILocalHistorico(Base):
+
+def definir_tabela_historico_local(nome: str, metadata: MetaData = Base.metadata) -> Table:
     """
-    Histórico de AQI por localização e usuário
+    Define (ou retorna, se já definida) uma tabela com a estrutura do
+    histórico local. Usada para a tabela base e para as partições mensais.
+    """
+    if nome in metadata.tables:
+        return metadata.tables[nome]
+
+    return Table(
+        nome,
+        metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("usuario_id", Integer, ForeignKey("usuario.id", ondelete="CASCADE"), nullable=True),  # opcional
+        Column("latitude", Float, nullable=False),
+        Column("longitude", Float, nullable=False),
+        Column("geotile", String(12), nullable=True),
+        Column("aqi_original", Integer, nullable=False),
+        Column("aqi_personalizado", Integer, nullable=False),
+        Column("nivel_alerta", String(100), nullable=False),
+        Column("data_hora", TIMESTAMP(timezone=True), server_default=func.now()),
+        Index(f"ix_{nome}_usuario_data", "usuario_id", "data_hora"),
+        Index(f"ix_{nome}_geotile_data", "geotile", "data_hora"),
+    )
+
+
+class AQILocalHistorico(Base):
     """
-    __tablename__ = "aqi_local_historico"
+    Histórico de AQI por localização e usuário.
 
-    id = Column(Integer, primary_key=True, index=True)
-    usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=True)  # opcional
-    latitude = Column(Float, nullable=False)
-    longitude = Column(Float, nullable=False)
-    aqi_original = Column(Integer, nullable=False)
-    aqi_personalizado = Column(Integer, nullable=False)
-    nivel_alerta = Column(String, nullable=False)
-    data_hora = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    Registros novos são gravados nas partições mensais
+    (`aqi_local_historico_AAAAMM`, ver airmonitor.historico_local), que têm
+    a mesma estrutura desta tabela.
+    """
+    __table__ = definir_tabela_historico_local("aqi_local_historico")
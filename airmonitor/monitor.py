@@ -1,13 +1,55 @@
 import os
-import requests
+import math
+import asyncio
 import logging
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
 
+from airqualityapp.cache import CacheTTL, CACHE_ACERTO, CACHE_CONSULTA, CACHE_OBSOLETO, CACHE_PADRAO
+from airqualityapp.singleflight import SingleFlight
+from airqualityapp.circuit_breaker import CircuitBreaker, CircuitoAberto
+from .openaq import parametros_busca_estacoes, obter_cliente_openaq
+from .geotile import geotile, centro_geotile
+from .estacoes import catalogo_estacoes
+from .aqi import aqi_das_estacoes, calcular_aqi
+from .superficie import superficie_aqi
+
 load_dotenv()
 
 OPENAQ_API = os.getenv("OPENAQ_API")
 NASA_API_KEY = os.getenv("NASA_API_KEY")
 
+# Cache de AQI por geotile (as estações da OpenAQ atualizam em ciclos de ~1h)
+AQI_CACHE_TTL = float(os.getenv("AQI_CACHE_TTL", "900"))
+AQI_CACHE_PRECISAO = int(os.getenv("AQI_CACHE_PRECISAO", "6"))
+AQI_CACHE_MAX_ENTRADAS = int(os.getenv("AQI_CACHE_MAX_ENTRADAS", "50000"))
+# Por quanto tempo o último valor conhecido pode ser servido se a OpenAQ falhar
+AQI_CACHE_OBSOLETO = float(os.getenv("AQI_CACHE_OBSOLETO", "86400"))
+
+# Cache de AQI por cidade (endpoint /aqi): usuários da mesma cidade compartilham o valor
+AQI_CIDADE_CACHE_TTL = float(os.getenv("AQI_CIDADE_CACHE_TTL", "900"))
+AQI_CIDADE_CACHE_MAX_ENTRADAS = int(os.getenv("AQI_CIDADE_CACHE_MAX_ENTRADAS", "10000"))
+
+cache_aqi = CacheTTL(ttl=AQI_CACHE_TTL, max_entradas=AQI_CACHE_MAX_ENTRADAS, tempo_obsoleto=AQI_CACHE_OBSOLETO)
+cache_aqi_cidade = CacheTTL(ttl=AQI_CIDADE_CACHE_TTL, max_entradas=AQI_CIDADE_CACHE_MAX_ENTRADAS,
+                            tempo_obsoleto=AQI_CACHE_OBSOLETO)
+
+# Circuit breaker da OpenAQ
+breaker_openaq = CircuitBreaker(
+    "openaq",
+    taxa_falha=float(os.getenv("OPENAQ_BREAKER_TAXA_FALHA", "0.5")),
+    min_chamadas=int(os.getenv("OPENAQ_BREAKER_MIN_CHAMADAS", "5")),
+    janela=float(os.getenv("OPENAQ_BREAKER_JANELA", "60")),
+    latencia_lenta=float(os.getenv("OPENAQ_BREAKER_LATENCIA", "3")),
+    timeout=float(os.getenv("OPENAQ_BREAKER_TIMEOUT", "5")),
+    tempo_aberto=float(os.getenv("OPENAQ_BREAKER_TEMPO_ABERTO", "30")),
+)
+# Consultas simultâneas ao mesmo geotile compartilham uma única chamada externa
+voos_aqi = SingleFlight()
+
+# A grade interpolada é reconstruída a cada atualização do catálogo
+catalogo_estacoes.ouvintes.append(superficie_aqi.reconstruir)
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,71 +59,21 @@ def obter_aqi_nasa_tempo_geo(lat: float, lon: float, raio_em_metros: int = 25000
     Consulta AQI da NASA TEMPO usando latitude e longitude.
     Retorna um valor numérico de AQI ou None se houver erro.
     """
+    import requests  # cliente síncrono só desta função; as rotas usam o pool httpx
+
     try:
         headers = {
             "accept": "application/json",
             "X-API-Key": NASA_API_KEY
         }
 
-        # Garantir que coordinates está no formato correto
-        coordinates = f"{lat},{lon}"
-
-        # Garantir que radius é numérico (OpenAQ aceita até 100000m = 100km)
-        raio_valido = min(int(raio_em_metros), 100000)
-
-        params = {
-            "coordinates": coordinates,
-            "radius": raio_valido,
-            "limit": 10
-        }
+        params = parametros_busca_estacoes(lat, lon, raio_em_metros)
 
-        logger.info(f"Buscando estações de qualidade do ar perto de ({lat}, {lon}) com raio {raio_valido}m...")
+        logger.info(f"Buscando estações de qualidade do ar perto de ({lat}, {lon}) com raio {params['radius']}m...")
 
         resp = requests.get(f"{OPENAQ_API}/locations", headers=headers, params=params, timeout=15)
         resp.raise_for_status()
-        data = resp.json()
-
-        num_results = len(data.get("results", []))
-        logger.info(f"API retornou {num_results} estações")
-
-        # Extrair valor AQI da resposta
-        if "results" in data and num_results > 0:
-            # Tentar encontrar PM2.5 em qualquer estação retornada
-            for idx, location in enumerate(data["results"]):
-                location_name = location.get("name", "Unknown")
-                measurements = location.get("measurements", [])
-
-                logger.info(f"Estação {idx+1}: {location_name} - {len(measurements)} medições")
-
-                if len(measurements) > 0:
-                    # Extrair PM2.5 que é o principal indicador de AQI
-                    for measurement in measurements:
-                        param = measurement.get("parameter")
-                        if param in ["pm25", "pm2.5"]:
-                            value = measurement.get("value")
-                            if value is not None:
-                                # Converter PM2.5 em AQI
-                                aqi = pm25_to_aqi(value)
-                                logger.info(f"✓ PM2.5 encontrado na estação '{location_name}': {value} µg/m³ → AQI {aqi}")
-                                return aqi
-
-            # Se não encontrar PM2.5, tentar outros poluentes
-            logger.warning("PM2.5 não encontrado, tentando outros poluentes...")
-            for location in data["results"]:
-                measurements = location.get("measurements", [])
-                for measurement in measurements:
-                    param = measurement.get("parameter")
-                    value = measurement.get("value")
-                    if param in ["pm10", "no2", "o3", "so2", "co"] and value is not None:
-                        logger.info(f"Usando {param}: {value}")
-                        # Conversão simplificada (não é ideal, mas evita fallback)
-                        return min(int(value), 200)
-
-            logger.warning("Nenhum poluente mensurável encontrado")
-            return 50
-
-        logger.warning("Nenhuma estação encontrada próxima às coordenadas")
-        return 50
+        return extrair_aqi_das_estacoes(resp.json())
 
     except requests.exceptions.HTTPError as e:
         logger.error(f"Erro HTTP ao obter AQI da NASA: {e}")
@@ -96,22 +88,197 @@ def obter_aqi_nasa_tempo_geo(lat: float, lon: float, raio_em_metros: int = 25000
         return None
 
 
+async def obter_aqi_nasa_tempo_geo_async(lat: float, lon: float, raio_em_metros: int = 25000):
+    """
+    Versão assíncrona de obter_aqi_nasa_tempo_geo, usando o pool de conexões
+    compartilhado. Retorna um valor numérico de AQI ou None se houver erro.
+    """
+    import httpx  # importação adiada: httpx pesa no tempo de inicialização
+
+    try:
+        logger.info(f"Buscando estações de qualidade do ar perto de ({lat}, {lon}) com raio {raio_em_metros}m...")
+        data = await obter_cliente_openaq().buscar_estacoes(lat, lon, raio_em_metros)
+        return extrair_aqi_das_estacoes(data)
+
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Erro HTTP ao obter AQI da NASA: {e}")
+        logger.error(f"Status code: {e.response.status_code}")
+        logger.error(f"Response: {e.response.text}")
+        return None
+    except httpx.HTTPError as e:
+        logger.error(f"Erro de requisição ao obter AQI da NASA: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Erro inesperado ao obter AQI da NASA: {e}")
+        return None
+
+
+async def obter_aqi_por_geotile(lat: float, lon: float, raio_em_metros: int = 25000):
+    """
+    Consulta AQI com cache por geotile. Coordenadas dentro da mesma célula
+    compartilham o mesmo valor, consultado a partir do centro da célula.
+
+    Retorna (aqi, desatualizado). Se a OpenAQ estiver indisponível (circuito
+    aberto ou falha), serve o último valor conhecido do geotile com
+    desatualizado=True e agenda a atualização em segundo plano.
+    Retorna (None, False) se não houver nenhum valor disponível.
+    """
+    # Pontos cobertos pela grade pré-calculada não precisam de cache nem rede
+    aqi = superficie_aqi.consultar(lat, lon)
+    if aqi is not None:
+        return aqi, False
+
+    tile = geotile(lat, lon, AQI_CACHE_PRECISAO)
+    chave = (tile, raio_em_metros)
+
+    aqi = cache_aqi.obter(chave)
+    if aqi is not None:
+        return aqi, False
+
+    obsoleto = cache_aqi.obter_obsoleto(chave)
+    if obsoleto is not None and breaker_openaq.aberto:
+        _agendar_atualizacao(chave)
+        return obsoleto, True
+
+    try:
+        aqi = await voos_aqi.executar(chave, lambda: _consultar_geotile(chave))
+    except Exception as e:
+        logger.warning(f"Falha ao consultar AQI do geotile {tile}: {e}")
+        aqi = None
+
+    if aqi is None and obsoleto is not None:
+        _agendar_atualizacao(chave)
+        return obsoleto, True
+    return aqi, False
+
+
+async def _consultar_geotile(chave: tuple):
+    """Resolve o AQI do geotile (catálogo local ou OpenAQ) e grava no cache"""
+    tile, raio_em_metros = chave
+    lat_centro, lon_centro = centro_geotile(tile)
+
+    aqi = obter_aqi_catalogo_local(lat_centro, lon_centro, raio_em_metros)
+    if aqi is None:
+        aqi = await breaker_openaq.chamar(
+            lambda: _consultar_openaq(lat_centro, lon_centro, raio_em_metros)
+        )
+    cache_aqi.definir(chave, aqi)
+    return aqi
+
+
+async def _consultar_openaq(lat: float, lon: float, raio_em_metros: int):
+    aqi = await obter_aqi_nasa_tempo_geo_async(lat, lon, raio_em_metros)
+    if aqi is None:
+        # Falhas precisam chegar ao circuit breaker como exceção
+        raise RuntimeError("OpenAQ não retornou dados válidos")
+    return aqi
+
+
+# Atualizações em segundo plano por chave (mantém também a referência às tarefas)
+_atualizacoes_pendentes: Dict[tuple, asyncio.Task] = {}
+
+
+def _agendar_atualizacao(chave: tuple):
+    """Atualiza o geotile em segundo plano (uma única vez por chave)"""
+    if chave in _atualizacoes_pendentes:
+        return
+
+    async def atualizar():
+        try:
+            await voos_aqi.executar(chave, lambda: _consultar_geotile(chave))
+        except CircuitoAberto:
+            pass
+        except Exception as e:
+            logger.warning(f"Falha ao atualizar geotile {chave[0]} em segundo plano: {e}")
+
+    tarefa = asyncio.create_task(atualizar())
+    _atualizacoes_pendentes[chave] = tarefa
+    tarefa.add_done_callback(lambda _: _atualizacoes_pendentes.pop(chave, None))
+
+
+async def obter_aqi_por_cidade(cidade: str, prazo: Optional[float] = None) -> Tuple[Optional[int], str]:
+    """
+    Consulta o AQI da cidade com cache TTL: a OpenAQ é chamada no máximo uma
+    vez por cidade a cada AQI_CIDADE_CACHE_TTL, com chamadas simultâneas
+    agrupadas. Se a consulta falhar ou passar de `prazo` segundos, serve o
+    último valor conhecido.
+
+    Retorna (aqi, status_cache); aqi é None se não houver valor disponível.
+    """
+    chave = cidade.strip().lower()
+
+    aqi = cache_aqi_cidade.obter(chave)
+    if aqi is not None:
+        return aqi, CACHE_ACERTO
+
+    obsoleto = cache_aqi_cidade.obter_obsoleto(chave)
+    if obsoleto is not None and breaker_openaq.aberto:
+        return obsoleto, CACHE_OBSOLETO
+
+    try:
+        # Ao estourar o prazo a consulta continua e preenche o cache
+        aqi = await asyncio.wait_for(
+            voos_aqi.executar(("cidade", chave), lambda: _consultar_cidade(cidade, chave)), timeout=prazo
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"OpenAQ não respondeu em {prazo}s para a cidade '{cidade}'")
+        aqi = None
+    except Exception as e:
+        logger.warning(f"Falha ao consultar AQI da cidade '{cidade}': {e}")
+        aqi = None
+
+    if aqi is not None:
+        return aqi, CACHE_CONSULTA
+    if obsoleto is not None:
+        return obsoleto, CACHE_OBSOLETO
+    return None, CACHE_PADRAO
+
+
+async def _consultar_cidade(cidade: str, chave: str) -> Optional[int]:
+    data = await breaker_openaq.chamar(lambda: obter_cliente_openaq().buscar_por_cidade(cidade))
+    # Sem valor mensurável retorna None (e não o padrão): quem chama decide o
+    # fallback e o valor não é guardado como se fosse uma medição
+    aqi = extrair_aqi_das_estacoes(data, padrao=None)
+    if aqi is not None:
+        cache_aqi_cidade.definir(chave, aqi)
+    return aqi
+
+
+def obter_aqi_catalogo_local(lat: float, lon: float, raio_em_metros: int = 25000):
+    """
+    Resolve o AQI pelas estações do catálogo local, sem acessar a rede.
+    Retorna None se o catálogo não estiver pronto ou não cobrir o ponto.
+    """
+    if not catalogo_estacoes.pronto:
+        return None
+    return catalogo_estacoes.aqi_proximo(lat, lon, raio_em_metros)
+
+
+def extrair_aqi_das_estacoes(data: dict, padrao: Optional[int] = 50) -> Optional[int]:
+    """
+    Extrai o valor de AQI da resposta de /locations da OpenAQ.
+    Usa a primeira estação (na ordem retornada) com alguma medição válida;
+    retorna `padrao` se nenhuma tiver.
+    """
+    estacoes = data.get("results", [])
+    logger.info(f"API retornou {len(estacoes)} estações")
+
+    if not estacoes:
+        logger.warning("Nenhuma estação encontrada próxima às coordenadas")
+        return padrao
+
+    aqis, dominantes = aqi_das_estacoes(estacoes)
+    for location, aqi, dominante in zip(estacoes, aqis, dominantes):
+        if not math.isnan(aqi):
+            logger.info(f"✓ Estação '{location.get('name', 'Unknown')}': AQI {int(aqi)} (poluente dominante: {dominante})")
+            return int(aqi)
+
+    logger.warning("Nenhum poluente mensurável encontrado")
+    return padrao
+
+
 def pm25_to_aqi(pm25):
     """
     Converte concentração de PM2.5 (µg/m³) para AQI usando a fórmula padrão EPA.
     """
-    if pm25 <= 12.0:
-        return int((50 - 0) / (12.0 - 0) * (pm25 - 0) + 0)
-    elif pm25 <= 35.4:
-        return int((100 - 51) / (35.4 - 12.1) * (pm25 - 12.1) + 51)
-    elif pm25 <= 55.4:
-        return int((150 - 101) / (55.4 - 35.5) * (pm25 - 35.5) + 101)
-    elif pm25 <= 150.4:
-        return int((200 - 151) / (150.4 - 55.5) * (pm25 - 55.5) + 151)
-    elif pm25 <= 250.4:
-        return int((300 - 201) / (250.4 - 150.5) * (pm25 - 150.5) + 201)
-    elif pm25 <= 350.4:
-        return int((400 - 301) / (350.4 - 250.5) * (pm25 - 250.5) + 301)
-    else:
-        return int((500 - 401) / (500.4 - 350.5) * (pm25 - 350.5) + 401)
-
+    return int(calcular_aqi("pm25", pm25))
@@ -1,5 +1,227 @@
-def enviar_alerta_push(usuario_id: int, mensagem: str):
+"""
+Fila assíncrona de alertas push.
+
+Os endpoints apenas enfileiram (`enviar_alerta_push`); um despachante em
+segundo plano agrupa os alertas por canal, entrega pelo transporte do canal
+e registra as entregas em `AlertasEnviados` com uma única inserção em lote.
+Alertas repetidos para o mesmo usuário e nível dentro da janela de supressão
+são descartados antes de entrar na fila.
+"""
+import os
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from airqualityapp.extensoes import carregar_implementacao
+
+load_dotenv()
+
+ALERTA_JANELA_SUPRESSAO = float(os.getenv("ALERTA_JANELA_SUPRESSAO", "3600"))
+ALERTA_FILA_MAX = int(os.getenv("ALERTA_FILA_MAX", "10000"))
+ALERTA_LOTE_MAX = int(os.getenv("ALERTA_LOTE_MAX", "100"))
+# Tempo máximo (segundos) esperando mais alertas para completar um lote
+ALERTA_LOTE_ESPERA = float(os.getenv("ALERTA_LOTE_ESPERA", "0.5"))
+# "local" ou caminho "modulo:Classe" de um transporte real
+ALERTA_TRANSPORTE_PUSH = os.getenv("ALERTA_TRANSPORTE_PUSH", "local")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Alerta:
+    usuario_id: int
+    mensagem: str
+    nivel_alerta: Optional[str] = None
+    canal: str = "push"
+    criado_em: float = field(default_factory=time.time)
+
+
+class TransporteAlertas(ABC):
+    """Interface dos transportes: entrega um lote e retorna os alertas entregues"""
+
+    @abstractmethod
+    async def enviar_lote(self, alertas: List[Alerta]) -> List[Alerta]:
+        ...
+
+
+class TransporteLocal(TransporteAlertas):
+    """Transporte de desenvolvimento: apenas registra os alertas no log"""
+
+    async def enviar_lote(self, alertas: List[Alerta]) -> List[Alerta]:
+        for alerta in alertas:
+            logger.info(f"[ALERTA PUSH] Usuário {alerta.usuario_id}: {alerta.mensagem}")
+        return alertas
+
+
+def carregar_transporte(caminho: str) -> TransporteAlertas:
+    return carregar_implementacao(caminho, TransporteAlertas, {"local": TransporteLocal})
+
+
+def registrar_entregas(alertas: List[Alerta]):
+    """Grava as entregas em AlertasEnviados (executado fora do event loop)"""
+    from airqualityapp.database import SessionLocal
+    from airqualityapp.crud import registrar_alertas_lote
+
+    db = SessionLocal()
+    try:
+        registrar_alertas_lote(db, [
+            {"usuario_id": a.usuario_id, "nivel_alerta": a.nivel_alerta, "metodo": a.canal} for a in alertas
+        ])
+    finally:
+        db.close()
+
+
+class DespachanteAlertas:
+    """Consome a fila de alertas em lotes por canal"""
+
+    def __init__(self, transportes: Optional[Dict[str, TransporteAlertas]] = None,
+                 janela_supressao: float = ALERTA_JANELA_SUPRESSAO, lote_max: int = ALERTA_LOTE_MAX,
+                 lote_espera: float = ALERTA_LOTE_ESPERA, fila_max: int = ALERTA_FILA_MAX):
+        self.transportes = transportes if transportes is not None else {}
+        self.janela_supressao = janela_supressao
+        self.lote_max = lote_max
+        self.lote_espera = lote_espera
+        self._fila: asyncio.Queue = asyncio.Queue(maxsize=fila_max)
+        self._ultimos_envios: Dict[tuple, float] = {}
+        self._limpeza_em = time.monotonic()
+        self._tarefa: Optional[asyncio.Task] = None
+        self.enfileirados = 0
+        self.suprimidos = 0
+        self.descartados = 0
+        self.entregues = 0
+        self.falhas = 0
+
+    def registrar_transporte(self, canal: str, transporte: TransporteAlertas):
+        self.transportes[canal] = transporte
+
+    def enfileirar(self, alerta: Alerta) -> bool:
+        """Coloca o alerta na fila sem bloquear. Retorna False se suprimido ou descartado."""
+        chave = (alerta.usuario_id, alerta.canal, alerta.nivel_alerta)
+        agora = time.monotonic()
+        ultimo = self._ultimos_envios.get(chave)
+        if ultimo is not None and agora - ultimo < self.janela_supressao:
+            self.suprimidos += 1
+            return False
+
+        try:
+            self._fila.put_nowait(alerta)
+        except asyncio.QueueFull:
+            self.descartados += 1
+            logger.warning(f"Fila de alertas cheia; alerta do usuário {alerta.usuario_id} descartado")
+            return False
+
+        # Marcado já ao enfileirar para que requisições seguidas não gerem cópias
+        self._ultimos_envios[chave] = agora
+        self.enfileirados += 1
+        return True
+
+    async def _proximo_lote(self) -> List[Alerta]:
+        lote = [await self._fila.get()]
+        limite = time.monotonic() + self.lote_espera
+        while len(lote) < self.lote_max:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(await asyncio.wait_for(self._fila.get(), timeout=restante))
+            except asyncio.TimeoutError:
+                break
+        return lote
+
+    async def _despachar(self, lote: List[Alerta]):
+        por_canal: Dict[str, List[Alerta]] = {}
+        for alerta in lote:
+            por_canal.setdefault(alerta.canal, []).append(alerta)
+
+        entregues = []
+        for canal, alertas in por_canal.items():
+            transporte = self.transportes.get(canal)
+            try:
+                if transporte is None:
+                    raise RuntimeError(f"Nenhum transporte registrado para o canal '{canal}'")
+                entregues.extend(await transporte.enviar_lote(alertas))
+            except Exception as e:
+                self.falhas += len(alertas)
+                logger.error(f"Erro ao enviar {len(alertas)} alertas pelo canal '{canal}': {e}")
+                # Libera a supressão para que o alerta possa ser tentado de novo
+                for alerta in alertas:
+                    self._ultimos_envios.pop((alerta.usuario_id, alerta.canal, alerta.nivel_alerta), None)
+
+        if entregues:
+            self.entregues += len(entregues)
+            try:
+                await asyncio.to_thread(registrar_entregas, entregues)
+            except Exception as e:
+                logger.error(f"Erro ao registrar alertas enviados: {e}")
+
+    def _limpar_supressoes(self):
+        agora = time.monotonic()
+        if agora - self._limpeza_em < self.janela_supressao:
+            return
+        self._limpeza_em = agora
+        self._ultimos_envios = {
+            chave: instante for chave, instante in self._ultimos_envios.items()
+            if agora - instante < self.janela_supressao
+        }
+
+    async def _loop(self):
+        while True:
+            lote = await self._proximo_lote()
+            try:
+                await self._despachar(lote)
+            finally:
+                for _ in lote:
+                    self._fila.task_done()
+            self._limpar_supressoes()
+
+    async def iniciar(self):
+        if self._tarefa is None:
+            self._tarefa = asyncio.create_task(self._loop())
+
+    async def parar(self, prazo: float = 5.0):
+        """Entrega o que restou na fila (até o prazo) e encerra o despachante"""
+        if self._tarefa is None:
+            return
+        try:
+            await asyncio.wait_for(self._fila.join(), timeout=prazo)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._fila.qsize()} alertas não enviados no encerramento")
+        self._tarefa.cancel()
+        try:
+            await self._tarefa
+        except asyncio.CancelledError:
+            pass
+        self._tarefa = None
+
+    def estatisticas(self) -> dict:
+        return {
+            "na_fila": self._fila.qsize(),
+            "enfileirados": self.enfileirados,
+            "suprimidos": self.suprimidos,
+            "descartados": self.descartados,
+            "entregues": self.entregues,
+            "falhas": self.falhas
+        }
+
+
+despachante_alertas = DespachanteAlertas({"push": carregar_transporte(ALERTA_TRANSPORTE_PUSH)})
+
+
+def enviar_alerta_push(usuario_id: int, mensagem: str, nivel_alerta: Optional[str] = None) -> bool:
     """
-    Simula envio de alerta push para o usuário.
+    Enfileira um alerta push para o usuário (não bloqueia a requisição).
     """
-    print(f"[ALERTA PUSH] Usuário {usuario_id}: {mensagem}")
\ No newline at end of file
+    return despachante_alertas.enfileirar(Alerta(usuario_id, mensagem, nivel_alerta))
+
+
+async def iniciar_despachante_alertas():
+    await despachante_alertas.iniciar()
+
+
+async def parar_despachante_alertas():
+    await despachante_alertas.parar()
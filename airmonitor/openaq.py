@@ -0,0 +1,81 @@
+import os
+import logging
+from dotenv import load_dotenv
+
+from .cliente_http import obter_pool_http, PoolHTTP
+
+load_dotenv()
+
+OPENAQ_API = os.getenv("OPENAQ_API")
+NASA_API_KEY = os.getenv("NASA_API_KEY")
+OPENAQ_TIMEOUT = float(os.getenv("OPENAQ_TIMEOUT", "15"))
+
+logger = logging.getLogger(__name__)
+
+
+def parametros_busca_estacoes(lat: float, lon: float, raio_em_metros: int = 25000, limite: int = 10) -> dict:
+    """Monta os parâmetros da busca de estações por raio na OpenAQ"""
+    # OpenAQ aceita raio de até 100000m = 100km
+    raio_valido = min(int(raio_em_metros), 100000)
+    return {
+        "coordinates": f"{lat},{lon}",
+        "radius": raio_valido,
+        "limit": limite
+    }
+
+
+class ClienteOpenAQ:
+    """
+    Cliente assíncrono da OpenAQ que usa o pool HTTP compartilhado.
+    """
+
+    def __init__(self, pool: PoolHTTP, base_url: str = OPENAQ_API, api_key: str = NASA_API_KEY, timeout: float = OPENAQ_TIMEOUT):
+        self.pool = pool
+        self.base_url = base_url
+        self.timeout = timeout
+        self.headers = {
+            "accept": "application/json",
+            "X-API-Key": api_key
+        }
+
+    async def buscar_estacoes(self, lat: float, lon: float, raio_em_metros: int = 25000, limite: int = 10) -> dict:
+        """
+        Busca estações próximas às coordenadas.
+        Levanta httpx.HTTPError em caso de falha.
+        """
+        params = parametros_busca_estacoes(lat, lon, raio_em_metros, limite)
+        resp = await self.pool.get(
+            f"{self.base_url}/locations", params=params, headers=self.headers, timeout=self.timeout
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def buscar_por_cidade(self, cidade: str, limite: int = 10) -> dict:
+        """
+        Busca estações da cidade.
+        Levanta httpx.HTTPError em caso de falha.
+        """
+        resp = await self.pool.get(
+            f"{self.base_url}/locations", params={"city": cidade, "limit": limite},
+            headers=self.headers, timeout=self.timeout
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def listar_estacoes(self, bbox: str = None, pagina: int = 1, limite: int = 1000) -> dict:
+        """
+        Lista estações (com as últimas medições) de forma paginada,
+        opcionalmente restrita a um bbox "min_lon,min_lat,max_lon,max_lat".
+        """
+        params = {"limit": limite, "page": pagina}
+        if bbox:
+            params["bbox"] = bbox
+        resp = await self.pool.get(
+            f"{self.base_url}/locations", params=params, headers=self.headers, timeout=self.timeout
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+
+def obter_cliente_openaq() -> ClienteOpenAQ:
+    return ClienteOpenAQ(obter_pool_http())
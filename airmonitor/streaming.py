@@ -0,0 +1,149 @@
+"""
+Assinaturas de AQI por geotile para WebSocket e SSE.
+
+Cada geotile assinado tem um único atualizador em segundo plano, que consulta
+o AQI (via cache/catálogo/OpenAQ) a cada `STREAM_INTERVALO` segundos e só
+publica quando o valor muda. A publicação é distribuída para as filas de
+todos os assinantes do geotile.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Set
+
+from dotenv import load_dotenv
+
+from .geotile import centro_geotile, geotile_valido
+from .monitor import obter_aqi_por_geotile, AQI_CACHE_PRECISAO
+
+load_dotenv()
+
+STREAM_INTERVALO = float(os.getenv("STREAM_INTERVALO", "60"))
+STREAM_MAX_TILES = int(os.getenv("STREAM_MAX_TILES", "50"))
+STREAM_FILA_MAX = int(os.getenv("STREAM_FILA_MAX", "32"))
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_tiles(tiles: Iterable[str]) -> List[str]:
+    """
+    Valida os geotiles e os leva à precisão do cache de AQI.
+    Levanta ValueError para geotiles inválidos ou menos precisos que o cache.
+    """
+    normalizados = []
+    for tile in tiles:
+        tile = tile.strip().lower()
+        if not tile:
+            continue
+        if len(tile) < AQI_CACHE_PRECISAO or not geotile_valido(tile):
+            raise ValueError(f"Geotile inválido: '{tile}' (mínimo {AQI_CACHE_PRECISAO} caracteres geohash)")
+        tile = tile[:AQI_CACHE_PRECISAO]
+        if tile not in normalizados:
+            normalizados.append(tile)
+    return normalizados
+
+
+def _publicar(fila: asyncio.Queue, mensagem: dict):
+    """Entrega sem bloquear; assinantes lentos perdem as mensagens mais antigas"""
+    if fila.full():
+        try:
+            fila.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+    fila.put_nowait(mensagem)
+
+
+class GerenciadorAssinaturas:
+    """Atualizador único por geotile com distribuição para todos os assinantes"""
+
+    def __init__(self, intervalo: float = STREAM_INTERVALO):
+        self.intervalo = intervalo
+        self._assinantes: Dict[str, Set[asyncio.Queue]] = {}
+        self._atualizadores: Dict[str, asyncio.Task] = {}
+        self._ultimos: Dict[str, dict] = {}
+        self.consultas = 0
+        self.publicacoes = 0
+
+    def nova_fila(self) -> asyncio.Queue:
+        return asyncio.Queue(maxsize=STREAM_FILA_MAX)
+
+    def assinar(self, tile: str, fila: asyncio.Queue):
+        assinantes = self._assinantes.setdefault(tile, set())
+        if fila in assinantes:
+            return
+        assinantes.add(fila)
+
+        # Novo assinante recebe o último valor conhecido imediatamente
+        ultimo = self._ultimos.get(tile)
+        if ultimo is not None:
+            _publicar(fila, ultimo)
+
+        if tile not in self._atualizadores:
+            self._atualizadores[tile] = asyncio.create_task(self._atualizar(tile))
+
+    def cancelar(self, tile: str, fila: asyncio.Queue):
+        assinantes = self._assinantes.get(tile)
+        if not assinantes:
+            return
+        assinantes.discard(fila)
+        if not assinantes:
+            del self._assinantes[tile]
+            self._ultimos.pop(tile, None)
+            tarefa = self._atualizadores.pop(tile, None)
+            if tarefa is not None:
+                tarefa.cancel()
+
+    def cancelar_todos(self, fila: asyncio.Queue):
+        for tile in [t for t, assinantes in self._assinantes.items() if fila in assinantes]:
+            self.cancelar(tile, fila)
+
+    async def _atualizar(self, tile: str):
+        lat, lon = centro_geotile(tile)
+        while True:
+            try:
+                self.consultas += 1
+                aqi, desatualizado = await obter_aqi_por_geotile(lat, lon)
+                ultimo = self._ultimos.get(tile)
+                if aqi is not None and (
+                    ultimo is None or (ultimo["aqi"], ultimo["dados_desatualizados"]) != (aqi, desatualizado)
+                ):
+                    mensagem = {
+                        "geotile": tile,
+                        "aqi": aqi,
+                        "dados_desatualizados": desatualizado,
+                        "atualizado_em": time.time()
+                    }
+                    self._ultimos[tile] = mensagem
+                    self.publicacoes += 1
+                    for fila in list(self._assinantes.get(tile, ())):
+                        _publicar(fila, mensagem)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao atualizar geotile {tile}: {e}")
+            await asyncio.sleep(self.intervalo)
+
+    async def parar(self):
+        tarefas = list(self._atualizadores.values())
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        self._atualizadores.clear()
+        self._assinantes.clear()
+        self._ultimos.clear()
+
+    def estatisticas(self) -> dict:
+        return {
+            "geotiles": len(self._atualizadores),
+            "assinaturas": sum(len(a) for a in self._assinantes.values()),
+            "consultas": self.consultas,
+            "publicacoes": self.publicacoes
+        }
+
+
+gerenciador_assinaturas = GerenciadorAssinaturas()
+
+
+async def parar_streaming():
+    await gerenciador_assinaturas.parar()
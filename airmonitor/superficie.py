@@ -0,0 +1,246 @@
+"""
+Superfície de AQI pré-calculada por interpolação IDW (inverse distance
+weighting) sobre as estações do catálogo.
+
+Cada região configurada vira uma grade float32 salva em disco (.npy) e lida
+com memory-map, de modo que todos os workers compartilham as mesmas páginas.
+Apenas um processo por vez reconstrói a grade (lock de arquivo); os demais
+recarregam quando o manifesto muda.
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+from typing import TYPE_CHECKING, List, Optional
+
+from dotenv import load_dotenv
+
+from .estacoes import para_cartesiano, distancia_para_corda, RAIO_TERRA_M, OPENAQ_CATALOGO_BBOXES
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+if TYPE_CHECKING:
+    import numpy as np
+
+load_dotenv()
+
+# Regiões da grade no formato "min_lon,min_lat,max_lon,max_lat", separadas por ";".
+# Por padrão usa as mesmas regiões do catálogo de estações.
+AQI_GRADE_REGIOES = [
+    b.strip() for b in os.getenv("AQI_GRADE_REGIOES", ";".join(OPENAQ_CATALOGO_BBOXES)).split(";") if b.strip()
+]
+AQI_GRADE_RESOLUCAO = float(os.getenv("AQI_GRADE_RESOLUCAO", "0.01"))  # graus (~1.1km)
+AQI_GRADE_DIR = os.getenv("AQI_GRADE_DIR", "aqi_grade")
+AQI_GRADE_VIZINHOS = int(os.getenv("AQI_GRADE_VIZINHOS", "8"))
+AQI_GRADE_POTENCIA = float(os.getenv("AQI_GRADE_POTENCIA", "2"))
+AQI_GRADE_RAIO = float(os.getenv("AQI_GRADE_RAIO", "25000"))  # metros
+# Grades mais antigas que isso são ignoradas nas consultas
+AQI_GRADE_IDADE_MAXIMA = float(os.getenv("AQI_GRADE_IDADE_MAXIMA", "5400"))
+
+_ARQUIVO_MANIFESTO = "manifesto.json"
+_ARQUIVO_LOCK = "grade.lock"
+# Intervalo mínimo entre verificações do manifesto em disco
+_INTERVALO_VERIFICACAO = 5.0
+# Pontos da grade processados por vez na interpolação
+_TAMANHO_BLOCO = 262144
+
+logger = logging.getLogger(__name__)
+
+
+def interpolar_idw(arvore, valores: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+                   k: int = AQI_GRADE_VIZINHOS, potencia: float = AQI_GRADE_POTENCIA,
+                   raio_em_metros: float = AQI_GRADE_RAIO) -> np.ndarray:
+    """
+    Interpola `valores` (um por estação da árvore) nos pontos informados.
+    Pontos sem nenhuma estação dentro do raio resultam em NaN.
+    """
+    import numpy as np  # importação adiada: numpy pesa no tempo de inicialização
+
+    k = min(k, len(valores))
+    distancias, indices = arvore.query(
+        para_cartesiano(lats, lons), k=k, distance_upper_bound=distancia_para_corda(raio_em_metros)
+    )
+    distancias = distancias.reshape(len(lats), k)
+    indices = indices.reshape(len(lats), k)
+
+    validos = indices < len(valores)
+    # Corda -> metros (aproximação suficiente para distâncias curtas); 1m evita divisão por zero
+    metros = np.maximum(distancias * RAIO_TERRA_M, 1.0)
+    pesos = np.where(validos, 1.0 / metros ** potencia, 0.0)
+    valores_vizinhos = np.where(validos, valores[np.minimum(indices, len(valores) - 1)], 0.0)
+
+    soma_pesos = pesos.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(soma_pesos > 0, (pesos * valores_vizinhos).sum(axis=1) / soma_pesos, np.nan)
+
+
+def _ler_bbox(bbox: str):
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    return min_lon, min_lat, max_lon, max_lat
+
+
+class SuperficieAQI:
+    """Grades de AQI interpoladas com consulta O(1) por ponto"""
+
+    def __init__(self, diretorio: str = AQI_GRADE_DIR, regioes: Optional[List[str]] = None,
+                 resolucao: float = AQI_GRADE_RESOLUCAO):
+        self.diretorio = diretorio
+        self.regioes = AQI_GRADE_REGIOES if regioes is None else regioes
+        self.resolucao = resolucao
+        self._grades = []  # lista de (meta, array)
+        self._gerado_em: Optional[float] = None
+        self._mtime_manifesto: Optional[float] = None
+        self._verificado_em = 0.0
+
+    @property
+    def ativa(self) -> bool:
+        return bool(self.regioes)
+
+    # --- Construção ---
+
+    def reconstruir(self, catalogo):
+        """Reconstrói as grades a partir das estações do catálogo (chamado após cada atualização)"""
+        if not self.ativa:
+            return
+        lats, lons, aqi = catalogo.pontos_com_aqi()
+        if len(aqi) == 0:
+            return
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        with open(os.path.join(self.diretorio, _ARQUIVO_LOCK), "w") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    logger.info("Outro processo está reconstruindo a grade de AQI")
+                    return
+            self._construir(lats, lons, aqi)
+
+    def _construir(self, lats: np.ndarray, lons: np.ndarray, aqi: np.ndarray):
+        import numpy as np
+        from scipy.spatial import cKDTree
+
+        inicio = time.monotonic()
+        arvore = cKDTree(para_cartesiano(lats, lons))
+        valores = aqi.astype(np.float64)
+        metas = []
+
+        for i, bbox in enumerate(self.regioes):
+            min_lon, min_lat, max_lon, max_lat = _ler_bbox(bbox)
+            n_lat = int(np.floor((max_lat - min_lat) / self.resolucao)) + 1
+            n_lon = int(np.floor((max_lon - min_lon) / self.resolucao)) + 1
+
+            grade = np.empty(n_lat * n_lon, dtype=np.float32)
+            grade_lats = min_lat + np.arange(n_lat) * self.resolucao
+            grade_lons = min_lon + np.arange(n_lon) * self.resolucao
+            for bloco in range(0, n_lat * n_lon, _TAMANHO_BLOCO):
+                posicoes = np.arange(bloco, min(bloco + _TAMANHO_BLOCO, n_lat * n_lon))
+                grade[posicoes] = interpolar_idw(
+                    arvore, valores, grade_lats[posicoes // n_lon], grade_lons[posicoes % n_lon]
+                )
+
+            arquivo = f"regiao_{i}.npy"
+            temporario = os.path.join(self.diretorio, f".{arquivo}.tmp")
+            with open(temporario, "wb") as f:
+                np.save(f, grade.reshape(n_lat, n_lon))
+            os.replace(temporario, os.path.join(self.diretorio, arquivo))
+
+            metas.append({
+                "arquivo": arquivo,
+                "min_lat": min_lat,
+                "min_lon": min_lon,
+                "n_lat": n_lat,
+                "n_lon": n_lon,
+                "resolucao": self.resolucao
+            })
+
+        # O manifesto é gravado por último: leitores só veem grades completas
+        temporario = os.path.join(self.diretorio, f".{_ARQUIVO_MANIFESTO}.tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"gerado_em": time.time(), "regioes": metas}, f)
+        os.replace(temporario, os.path.join(self.diretorio, _ARQUIVO_MANIFESTO))
+
+        logger.info(f"Grade de AQI reconstruída em {time.monotonic() - inicio:.1f}s ({len(metas)} regiões)")
+
+    # --- Consulta ---
+
+    def _recarregar_se_necessario(self):
+        import numpy as np
+
+        agora = time.monotonic()
+        if agora - self._verificado_em < _INTERVALO_VERIFICACAO:
+            return
+        self._verificado_em = agora
+
+        caminho = os.path.join(self.diretorio, _ARQUIVO_MANIFESTO)
+        try:
+            mtime = os.path.getmtime(caminho)
+        except OSError:
+            return
+        if mtime == self._mtime_manifesto:
+            return
+
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                manifesto = json.load(f)
+            grades = [
+                (meta, np.load(os.path.join(self.diretorio, meta["arquivo"]), mmap_mode="r"))
+                for meta in manifesto["regioes"]
+            ]
+        except Exception as e:
+            logger.error(f"Erro ao carregar grade de AQI: {e}")
+            return
+
+        self._grades = grades
+        self._gerado_em = manifesto["gerado_em"]
+        self._mtime_manifesto = mtime
+
+    def consultar(self, lat: float, lon: float) -> Optional[int]:
+        """
+        AQI interpolado bilinearmente no ponto. Retorna None se o ponto estiver
+        fora das regiões, sem estações próximas ou se a grade estiver velha.
+        """
+        import numpy as np
+
+        if not self.ativa:
+            return None
+        self._recarregar_se_necessario()
+        if self._gerado_em is None or time.time() - self._gerado_em > AQI_GRADE_IDADE_MAXIMA:
+            return None
+
+        for meta, grade in self._grades:
+            y = (lat - meta["min_lat"]) / meta["resolucao"]
+            x = (lon - meta["min_lon"]) / meta["resolucao"]
+            if not (0 <= y <= meta["n_lat"] - 1 and 0 <= x <= meta["n_lon"] - 1):
+                continue
+
+            i0 = min(int(y), meta["n_lat"] - 2) if meta["n_lat"] > 1 else 0
+            j0 = min(int(x), meta["n_lon"] - 2) if meta["n_lon"] > 1 else 0
+            i1 = min(i0 + 1, meta["n_lat"] - 1)
+            j1 = min(j0 + 1, meta["n_lon"] - 1)
+            dy, dx = y - i0, x - j0
+
+            cantos = np.array([grade[i0, j0], grade[i0, j1], grade[i1, j0], grade[i1, j1]], dtype=np.float64)
+            pesos = np.array([(1 - dy) * (1 - dx), (1 - dy) * dx, dy * (1 - dx), dy * dx])
+            validos = ~np.isnan(cantos)
+            if not validos.any() or pesos[validos].sum() == 0:
+                return None
+            # Cantos sem dados são ignorados e os pesos restantes renormalizados
+            return int(round(float((cantos[validos] * pesos[validos]).sum() / pesos[validos].sum())))
+
+        return None
+
+    def estatisticas(self) -> dict:
+        return {
+            "regioes": len(self._grades),
+            "celulas": int(sum(grade.size for _, grade in self._grades)),
+            "gerado_em": self._gerado_em
+        }
+
+
+superficie_aqi = SuperficieAQI()
@@ -0,0 +1,290 @@
+"""
+Agregados (rollups) do histórico de AQI personalizado.
+
+Uma tarefa periódica incorpora as linhas novas de `aqi_personalizado_historico`
+(id acima da marca gravada em `marca_agregacao`, inseridas há pelo menos
+`AGREGACAO_ATRASO` segundos pelo relógio do banco) aos buckets por hora e por
+dia de `aqi_historico_agregado`, que guardam contagem, mínimo, máximo e soma.
+Consultas por hora/dia leem os buckets e completam com as linhas ainda não
+agregadas do usuário: um ano de histórico diário são ~365 linhas.
+"""
+import os
+import base64
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, or_, and_, select, func
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Usuario, AQIPersonalizadoHistorico, AQIHistoricoAgregado, MarcaAgregacao, ExclusaoPendente
+from .tarefas import TarefaPeriodica
+
+load_dotenv()
+
+AGREGACAO_INTERVALO = float(os.getenv("AGREGACAO_INTERVALO", "300"))
+AGREGACAO_LOTE = int(os.getenv("AGREGACAO_LOTE", "5000"))
+# Linhas inseridas há menos que isto (coluna gravado_em) ficam para a próxima
+# execução, dando tempo a transações concorrentes (outros workers) de
+# confirmarem ids menores. Deve ser bem maior que a duração de uma transação
+# de gravação do histórico.
+AGREGACAO_ATRASO = float(os.getenv("AGREGACAO_ATRASO", "30"))
+
+RESOLUCOES = ("hora", "dia")
+MARCA_HISTORICO = "aqi_personalizado_historico"
+_CAMPOS = ("aqi_original", "aqi_personalizado")
+
+logger = logging.getLogger(__name__)
+
+H = AQIPersonalizadoHistorico
+A = AQIHistoricoAgregado
+
+
+def inicio_do_bucket(data_hora: datetime, resolucao: str) -> datetime:
+    if resolucao == "hora":
+        return data_hora.replace(minute=0, second=0, microsecond=0)
+    return data_hora.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _utc_ingenuo(data_hora: datetime) -> datetime:
+    """O histórico é gravado em UTC sem fuso; converte datas com fuso para o mesmo formato"""
+    if data_hora.tzinfo is not None:
+        return data_hora.astimezone(timezone.utc).replace(tzinfo=None)
+    return data_hora
+
+
+def _novo_bucket() -> dict:
+    bucket = {"amostras": 0}
+    for campo in _CAMPOS:
+        bucket.update({f"{campo}_min": None, f"{campo}_max": None, f"{campo}_soma": 0})
+    return bucket
+
+
+def _bucket_da_linha(linha) -> dict:
+    bucket = {"amostras": 1}
+    for campo in _CAMPOS:
+        valor = getattr(linha, campo)
+        bucket.update({f"{campo}_min": valor, f"{campo}_max": valor, f"{campo}_soma": valor})
+    return bucket
+
+
+def _combinar(destino: dict, origem: dict):
+    destino["amostras"] += origem["amostras"]
+    for campo in _CAMPOS:
+        destino[f"{campo}_soma"] += origem[f"{campo}_soma"]
+        for sufixo, escolher in (("min", min), ("max", max)):
+            chave = f"{campo}_{sufixo}"
+            if destino[chave] is None:
+                destino[chave] = origem[chave]
+            elif origem[chave] is not None:
+                destino[chave] = escolher(destino[chave], origem[chave])
+
+
+def _agrupar(linhas: Iterable, resolucoes: Iterable[str] = RESOLUCOES) -> Dict[Tuple[int, str, datetime], dict]:
+    buckets = {}
+    for linha in linhas:
+        if None in (linha.usuario_id, linha.data_hora, linha.aqi_original, linha.aqi_personalizado):
+            continue
+        for resolucao in resolucoes:
+            chave = (linha.usuario_id, resolucao, inicio_do_bucket(linha.data_hora, resolucao))
+            _combinar(buckets.setdefault(chave, _novo_bucket()), _bucket_da_linha(linha))
+    return buckets
+
+
+def _usuarios_ativos(db: Session, usuario_ids) -> set:
+    """Usuários existentes e sem exclusão pendente (o expurgo remove os agregados deles)"""
+    existentes = {u for (u,) in db.query(Usuario.id).filter(Usuario.id.in_(usuario_ids))}
+    excluidos = {u for (u,) in db.query(ExclusaoPendente.usuario_id).filter(ExclusaoPendente.usuario_id.in_(existentes))}
+    return existentes - excluidos
+
+
+def _gravar_buckets(db: Session, buckets: Dict[Tuple[int, str, datetime], dict]):
+    ativos = _usuarios_ativos(db, {chave[0] for chave in buckets})
+    novos = []
+    for resolucao in RESOLUCOES:
+        chaves = [c for c in buckets if c[1] == resolucao and c[0] in ativos]
+        if not chaves:
+            continue
+        existentes = {
+            (e.usuario_id, e.resolucao, e.inicio): e
+            for e in db.query(A).filter(
+                A.resolucao == resolucao,
+                A.usuario_id.in_({c[0] for c in chaves}),
+                A.inicio.in_({c[2] for c in chaves})
+            )
+        }
+        for chave in chaves:
+            existente = existentes.get(chave)
+            if existente is None:
+                usuario_id, _, inicio = chave
+                novos.append({"usuario_id": usuario_id, "resolucao": resolucao, "inicio": inicio, **buckets[chave]})
+                continue
+            atual = {campo: getattr(existente, campo) for campo in buckets[chave]}
+            _combinar(atual, buckets[chave])
+            for campo, valor in atual.items():
+                setattr(existente, campo, valor)
+    if novos:
+        db.execute(insert(A), novos)
+
+
+def _agregar_lote(db: Session) -> int:
+    """Incorpora um lote de linhas novas aos agregados; retorna quantas linhas foram consumidas"""
+    # A trava na marca serializa a agregação entre workers
+    marca = db.query(MarcaAgregacao).filter(MarcaAgregacao.nome == MARCA_HISTORICO).with_for_update().first()
+    if marca is None:
+        marca = MarcaAgregacao(nome=MARCA_HISTORICO, ultimo_id=0)
+        db.add(marca)
+        db.flush()
+
+    linhas = db.query(H.id, H.usuario_id, H.data_hora, H.aqi_original, H.aqi_personalizado, H.gravado_em)\
+               .filter(H.id > marca.ultimo_id)\
+               .order_by(H.id)\
+               .limit(AGREGACAO_LOTE)\
+               .all()
+
+    # Só avança a marca sobre um prefixo contínuo de ids inseridos há tempo
+    # suficiente. data_hora não serve: é fixada quando a linha entra no buffer,
+    # e a inserção pode acontecer bem depois (ex.: banco fora do ar). O corte usa
+    # o relógio do banco, o mesmo de gravado_em, e não o do worker.
+    corte = db.scalar(select(func.now())) - timedelta(seconds=AGREGACAO_ATRASO)
+    consumidas = []
+    for linha in linhas:
+        # Linhas sem gravado_em são anteriores à coluna
+        if linha.gravado_em is not None and linha.gravado_em >= corte:
+            break
+        consumidas.append(linha)
+
+    if not consumidas:
+        db.rollback()
+        return 0
+
+    _gravar_buckets(db, _agrupar(consumidas))
+    marca.ultimo_id = consumidas[-1].id
+    db.commit()
+    return len(consumidas)
+
+
+def atualizar_agregados():
+    with SessionLocal() as db:
+        total = 0
+        while True:
+            consumidas = _agregar_lote(db)
+            total += consumidas
+            if consumidas < AGREGACAO_LOTE:
+                break
+    if total:
+        logger.info(f"Agregados do histórico atualizados com {total} linhas")
+
+
+def _codificar_cursor(*partes) -> str:
+    return base64.urlsafe_b64encode("|".join(str(p) for p in partes).encode()).decode()
+
+
+def _decodificar_cursor(cursor: str) -> List[str]:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def _consultar_bruto(db: Session, usuario_id: int, inicio: datetime, fim: datetime, limite: int,
+                     cursor: Optional[str]):
+    consulta = db.query(H.id, H.data_hora, H.aqi_original, H.aqi_personalizado, H.nivel_alerta)\
+                 .filter(H.usuario_id == usuario_id, H.data_hora >= inicio, H.data_hora <= fim)
+    if cursor:
+        partes = _decodificar_cursor(cursor)
+        try:
+            data_cursor, id_cursor = datetime.fromisoformat(partes[0]), int(partes[1])
+        except (IndexError, ValueError):
+            raise ValueError("Cursor inválido")
+        consulta = consulta.filter(or_(
+            H.data_hora < data_cursor,
+            and_(H.data_hora == data_cursor, H.id < id_cursor)
+        ))
+
+    linhas = consulta.order_by(H.data_hora.desc(), H.id.desc()).limit(limite + 1).all()
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = _codificar_cursor(linhas[-1].data_hora.isoformat(), linhas[-1].id)
+    return [dict(linha._mapping) for linha in linhas], proximo
+
+
+def _item_agregado(inicio: datetime, bucket: dict) -> dict:
+    item = {"inicio": inicio, "amostras": bucket["amostras"]}
+    for campo in _CAMPOS:
+        item[f"{campo}_min"] = bucket[f"{campo}_min"]
+        item[f"{campo}_medio"] = round(bucket[f"{campo}_soma"] / bucket["amostras"], 1)
+        item[f"{campo}_max"] = bucket[f"{campo}_max"]
+    return item
+
+
+def _consultar_agregado(db: Session, usuario_id: int, resolucao: str, inicio: datetime, fim: datetime,
+                        limite: int, cursor: Optional[str]):
+    inicio = inicio_do_bucket(inicio, resolucao)
+    if cursor:
+        try:
+            fim_exclusivo = datetime.fromisoformat(_decodificar_cursor(cursor)[0])
+        except ValueError:
+            raise ValueError("Cursor inválido")
+    else:
+        fim_exclusivo = None
+
+    consulta = db.query(A).filter(
+        A.usuario_id == usuario_id, A.resolucao == resolucao, A.inicio >= inicio, A.inicio <= fim
+    )
+    if fim_exclusivo is not None:
+        consulta = consulta.filter(A.inicio < fim_exclusivo)
+    armazenados = consulta.order_by(A.inicio.desc()).limit(limite + 1).all()
+    buckets = {
+        a.inicio: {campo: getattr(a, campo) for campo in _novo_bucket()}
+        for a in armazenados
+    }
+
+    # Linhas ainda não agregadas (desde a última execução da tarefa)
+    marca = db.get(MarcaAgregacao, MARCA_HISTORICO)
+    pendentes = db.query(H.usuario_id, H.data_hora, H.aqi_original, H.aqi_personalizado).filter(
+        H.usuario_id == usuario_id, H.id > (marca.ultimo_id if marca else 0),
+        H.data_hora >= inicio, H.data_hora <= fim
+    )
+    if fim_exclusivo is not None:
+        pendentes = pendentes.filter(H.data_hora < fim_exclusivo)
+    for (_, _, inicio_bucket), bucket in _agrupar(pendentes, (resolucao,)).items():
+        _combinar(buckets.setdefault(inicio_bucket, _novo_bucket()), bucket)
+
+    ordenados = sorted(buckets.items(), key=lambda item: item[0], reverse=True)
+    proximo = None
+    if len(ordenados) > limite:
+        ordenados = ordenados[:limite]
+        proximo = _codificar_cursor(ordenados[-1][0].isoformat())
+    return [_item_agregado(inicio_bucket, bucket) for inicio_bucket, bucket in ordenados], proximo
+
+
+def consultar_historico(db: Session, usuario_id: int, resolucao: str, inicio: datetime, fim: datetime,
+                        limite: int = 500, cursor: Optional[str] = None):
+    """
+    Histórico do usuário do mais recente para o mais antigo, em `resolucao`
+    "bruto", "hora" ou "dia". Retorna (itens, proximo_cursor); levanta
+    ValueError para resolução ou cursor inválidos.
+    """
+    inicio, fim = _utc_ingenuo(inicio), _utc_ingenuo(fim)
+    if resolucao == "bruto":
+        return _consultar_bruto(db, usuario_id, inicio, fim, limite, cursor)
+    if resolucao not in RESOLUCOES:
+        raise ValueError(f"Resolução inválida: '{resolucao}'")
+    return _consultar_agregado(db, usuario_id, resolucao, inicio, fim, limite, cursor)
+
+
+_tarefa_agregacao = TarefaPeriodica("agregacao-historico", atualizar_agregados, AGREGACAO_INTERVALO)
+
+
+async def iniciar_agregacao():
+    _tarefa_agregacao.iniciar()
+    _tarefa_agregacao.acordar()
+
+
+async def parar_agregacao():
+    await asyncio.to_thread(_tarefa_agregacao.parar, False)
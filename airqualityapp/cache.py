@@ -0,0 +1,88 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_AUSENTE = object()
+
+# Origem do valor em consultas com cache (campo status_cache das respostas)
+CACHE_ACERTO = "acerto"      # valor válido em cache
+CACHE_CONSULTA = "consulta"  # consultado agora na fonte externa
+CACHE_OBSOLETO = "obsoleto"  # fonte indisponível; último valor conhecido
+CACHE_PADRAO = "padrao"      # sem valor disponível; usado o padrão
+
+
+class CacheTTL:
+    """
+    Cache em memória com expiração por TTL e descarte LRU ao atingir o
+    limite de entradas. Mantém contadores de acertos e erros.
+    Seguro para uso entre threads.
+
+    Com `tempo_obsoleto` > 0, entradas expiradas continuam disponíveis via
+    `obter_obsoleto` por esse tempo adicional (último valor conhecido).
+    """
+
+    def __init__(self, ttl: float, max_entradas: int = 10000, tempo_obsoleto: float = 0):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.tempo_obsoleto = tempo_obsoleto
+        self._dados: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.erros = 0
+        self.descartes = 0
+
+    def obter(self, chave: Hashable, padrao: Any = None) -> Any:
+        """Retorna o valor em cache ou `padrao` se ausente/expirado"""
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave, _AUSENTE)
+            if item is _AUSENTE or item[0] <= agora:
+                if item is not _AUSENTE and item[0] + self.tempo_obsoleto <= agora:
+                    del self._dados[chave]
+                self.erros += 1
+                return padrao
+            self._dados.move_to_end(chave)
+            self.acertos += 1
+            return item[1]
+
+    def obter_obsoleto(self, chave: Hashable, padrao: Any = None) -> Any:
+        """Retorna o último valor conhecido, mesmo expirado, dentro de `tempo_obsoleto`"""
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave, _AUSENTE)
+            if item is _AUSENTE or item[0] + self.tempo_obsoleto <= agora:
+                return padrao
+            return item[1]
+
+    def definir(self, chave: Hashable, valor: Any, ttl: Optional[float] = None):
+        expira_em = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._dados[chave] = (expira_em, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_entradas:
+                self._dados.popitem(last=False)
+                self.descartes += 1
+
+    def invalidar(self, chave: Hashable):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+    def __len__(self):
+        return len(self._dados)
+
+    def estatisticas(self) -> dict:
+        total = self.acertos + self.erros
+        return {
+            "entradas": len(self._dados),
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl,
+            "acertos": self.acertos,
+            "erros": self.erros,
+            "descartes": self.descartes,
+            "taxa_acerto": round(self.acertos / total, 4) if total else 0.0
+        }
@@ -0,0 +1,128 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+
+class CircuitoAberto(Exception):
+    """Chamada recusada porque o circuito está aberto"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker para dependências externas assíncronas.
+
+    Abre quando, dentro da janela de observação, a proporção de falhas
+    (exceções, timeouts ou chamadas mais lentas que `latencia_lenta`) atinge
+    `taxa_falha`. Após `tempo_aberto` segundos permite uma chamada de teste:
+    se ela funcionar o circuito fecha, senão volta a abrir.
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        taxa_falha: float = 0.5,
+        min_chamadas: int = 5,
+        janela: float = 60.0,
+        latencia_lenta: float = 3.0,
+        timeout: Optional[float] = 5.0,
+        tempo_aberto: float = 30.0,
+    ):
+        self.nome = nome
+        self.taxa_falha = taxa_falha
+        self.min_chamadas = min_chamadas
+        self.janela = janela
+        self.latencia_lenta = latencia_lenta
+        self.timeout = timeout
+        self.tempo_aberto = tempo_aberto
+
+        self.estado = FECHADO
+        self._aberto_em = 0.0
+        self._teste_em_andamento = False
+        self._resultados = deque()  # (instante, sucesso)
+        self.recusadas = 0
+
+    def _permitir(self) -> bool:
+        if self.estado == FECHADO:
+            return True
+        if self.estado == ABERTO and time.monotonic() - self._aberto_em >= self.tempo_aberto:
+            self.estado = MEIO_ABERTO
+        if self.estado == MEIO_ABERTO and not self._teste_em_andamento:
+            self._teste_em_andamento = True
+            return True
+        return False
+
+    @property
+    def aberto(self) -> bool:
+        """Indica se chamadas seriam recusadas agora"""
+        if self.estado == FECHADO:
+            return False
+        if self.estado == ABERTO:
+            return time.monotonic() - self._aberto_em < self.tempo_aberto
+        return self._teste_em_andamento
+
+    def _registrar(self, sucesso: bool):
+        agora = time.monotonic()
+
+        if self.estado == MEIO_ABERTO:
+            self._teste_em_andamento = False
+            if sucesso:
+                logger.info(f"Circuito '{self.nome}' fechado")
+                self.estado = FECHADO
+                self._resultados.clear()
+            else:
+                self._abrir(agora)
+            return
+
+        self._resultados.append((agora, sucesso))
+        while self._resultados and agora - self._resultados[0][0] > self.janela:
+            self._resultados.popleft()
+
+        total = len(self._resultados)
+        falhas = sum(1 for _, ok in self._resultados if not ok)
+        if total >= self.min_chamadas and falhas / total >= self.taxa_falha:
+            self._abrir(agora)
+
+    def _abrir(self, agora: float):
+        logger.warning(f"Circuito '{self.nome}' aberto por {self.tempo_aberto}s")
+        self.estado = ABERTO
+        self._aberto_em = agora
+        self._resultados.clear()
+
+    async def chamar(self, funcao: Callable[[], Awaitable]):
+        """
+        Executa a chamada protegida. Levanta CircuitoAberto sem executar
+        quando o circuito está aberto.
+        """
+        if not self._permitir():
+            self.recusadas += 1
+            raise CircuitoAberto(f"Circuito '{self.nome}' aberto")
+
+        inicio = time.monotonic()
+        try:
+            resultado = await asyncio.wait_for(funcao(), timeout=self.timeout)
+        except asyncio.CancelledError:
+            if self.estado == MEIO_ABERTO:
+                self._teste_em_andamento = False
+            raise
+        except Exception:
+            self._registrar(False)
+            raise
+
+        self._registrar(time.monotonic() - inicio <= self.latencia_lenta)
+        return resultado
+
+    def estatisticas(self) -> dict:
+        return {
+            "estado": self.estado,
+            "chamadas_na_janela": len(self._resultados),
+            "falhas_na_janela": sum(1 for _, ok in self._resultados if not ok),
+            "recusadas": self.recusadas
+        }
@@ -1,60 +1,131 @@
+from sqlalchemy import insert
 from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta
+from dataclasses import dataclass
+from typing import Optional
+import os, time, logging
 from fastapi import HTTPException, status
-from passlib.context import CryptContext
+from fastapi.concurrency import run_in_threadpool
 import secrets, hashlib
-from jose import JWTError, jwt
-from .models import Usuario, PerfilSaude, AQIPersonalizadoHistorico, AlertasEnviados
-from .utils import verify_password, hash_senha
-from .mail_utils import enviar_alerta_email
+from .models import Usuario, PerfilSaude, AQIPersonalizadoHistorico, AlertasEnviados, TokenRedefinicao
+from .senhas import hash_senha_async, verificar_senha_async
+from .mail_sender import enfileirar_email
+from .perfis import invalidar_perfil, carregar_canal
+from .exclusao import agendar_exclusao
+from .cache import CacheTTL
 
 # Configurações
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 RESET_TOKEN_EXP_MINUTES = 60  # tempo de validade do token
 
 # Configurações JWT
 SECRET_KEY = "segredo-super-seguro-aura-air"  # Em produção, use uma chave mais segura
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_MAX_ENTRADAS = int(os.getenv("TOKEN_CACHE_MAX_ENTRADAS", "10000"))
+# "local" ou caminho "modulo:Classe" do canal que leva as revogações de tokens a todos os workers
+TOKEN_CANAL_REVOGACAO = os.getenv("TOKEN_CANAL_REVOGACAO", "local")
+
+logger = logging.getLogger(__name__)
 
 # -----------------------------
 # Autenticação JWT
 # -----------------------------
 
+# Tokens já verificados (assinatura e expiração) -> Principal
+cache_tokens = CacheTTL(ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60, max_entradas=TOKEN_CACHE_MAX_ENTRADAS)
+# usuario_id -> instante a partir do qual tokens emitidos antes são recusados
+_tokens_revogados = {}
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Usuário autenticado a partir das claims do token, sem consulta ao banco"""
+    id: int
+    email: str
+    nome: Optional[str] = None
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Cria token JWT de acesso"""
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    agora = datetime.utcnow()
+    expire = agora + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "iat": agora})
+    from jose import jwt  # importação adiada: jose/cryptography pesam no tempo de inicialização
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(db: Session, token: str):
-    """Obtém usuário atual baseado no token JWT"""
-    print(f"🔍 Token recebido: {token[:50]}...")
+def criar_token_usuario(usuario: Usuario):
+    """Token com as claims usadas pelos endpoints (dispensa consulta ao banco)"""
+    return create_access_token(data={"sub": usuario.email, "uid": usuario.id, "nome": usuario.nome})
+
+def _registrar_revogacao(usuario_id: int):
+    agora = time.time()
+    # Revogações mais antigas que a validade máxima de um token não são mais necessárias
+    for uid, instante in list(_tokens_revogados.items()):
+        if agora - instante > ACCESS_TOKEN_EXPIRE_MINUTES * 60:
+            del _tokens_revogados[uid]
+    _tokens_revogados[usuario_id] = agora
+    cache_tokens.limpar()
+
+canal_revogacao = carregar_canal(TOKEN_CANAL_REVOGACAO)
+canal_revogacao.assinar(_registrar_revogacao)
+
+def revogar_tokens_usuario(usuario_id: int):
+    """Recusa, em todos os workers, os tokens já emitidos para o usuário (ex.: conta excluída)"""
+    _registrar_revogacao(usuario_id)
+    try:
+        canal_revogacao.publicar(usuario_id)
+    except Exception as e:
+        logger.error(f"Erro ao publicar revogação dos tokens do usuário {usuario_id}: {e}")
+
+def _verificar_token(token: str) -> dict:
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        print(f"✅ Token decodificado: {payload}")
-        email = payload.get("sub")
-        if email is None:
-            print("❌ Email não encontrado no token")
-            raise HTTPException(status_code=401, detail="Token inválido")
-        
-        usuario = db.query(Usuario).filter(Usuario.email == email).first()
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    return payload
+
+def obter_principal(db: Session, token: str) -> Principal:
+    """
+    Valida o token e retorna o Principal. Tokens com `uid` não acessam o
+    banco; tokens antigos (apenas `sub`) fazem uma consulta na primeira vez.
+    O resultado fica em cache até a expiração do token.
+    """
+    principal = cache_tokens.obter(token)
+    if principal is not None:
+        return principal
+
+    payload = _verificar_token(token)
+    uid = payload.get("uid")
+    if uid is not None:
+        principal = Principal(id=uid, email=payload["sub"], nome=payload.get("nome"))
+    else:
+        usuario = db.query(Usuario).filter(Usuario.email == payload["sub"]).first()
         if not usuario:
-            print(f"❌ Usuário não encontrado: {email}")
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        print(f"✅ Usuário encontrado: {usuario.nome}")
-        return usuario
-    except JWTError as e:
-        print(f"❌ Erro JWT: {e}")
+        principal = Principal(id=usuario.id, email=usuario.email, nome=usuario.nome)
+
+    revogado_em = _tokens_revogados.get(principal.id)
+    if revogado_em is not None and payload.get("iat", 0) <= revogado_em:
         raise HTTPException(status_code=401, detail="Token inválido")
 
-def autenticar_usuario(db: Session, email: str, senha: str):
+    restante = payload["exp"] - time.time()
+    if restante > 0:
+        cache_tokens.definir(token, principal, ttl=restante)
+    return principal
+
+def _buscar_usuario_por_email(db: Session, email: str):
+    return db.query(Usuario).filter(Usuario.email == email).first()
+
+async def autenticar_usuario(db: Session, email: str, senha: str):
     """Autentica usuário com email e senha"""
-    usuario = db.query(Usuario).filter(Usuario.email == email).first()
+    usuario = await run_in_threadpool(_buscar_usuario_por_email, db, email)
     if not usuario:
         return False
-    if not verify_password(senha, usuario.senha_hash):
+    if not await verificar_senha_async(senha, usuario.senha_hash):
         return False
     return usuario
 
@@ -62,36 +133,41 @@ def autenticar_usuario(db: Session, email: str, senha: str):
 # Usuários
 # -----------------------------
 
-def criar_usuario(db: Session, usuario):
-    # Verificar se o email já existe
-    usuario_existente = db.query(Usuario).filter(Usuario.email == usuario.email).first()
-    if usuario_existente:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email já cadastrado"
-        )
-
+def _inserir_usuario(db: Session, usuario, senha_hash: str):
     db_usuario = Usuario(
         nome=usuario.nome,
         email=usuario.email,
         data_nascimento=usuario.data_nascimento,
         cidade=usuario.cidade,
         estado=usuario.estado,
-        senha_hash=hash_senha(usuario.senha)
+        senha_hash=senha_hash
     )
     db.add(db_usuario)
     db.commit()
     db.refresh(db_usuario)
     return db_usuario
 
-def login_usuario(db: Session, email: str, senha: str):
+async def criar_usuario(db: Session, usuario):
+    # Verificar se o email já existe
+    usuario_existente = await run_in_threadpool(_buscar_usuario_por_email, db, usuario.email)
+    if usuario_existente:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email já cadastrado"
+        )
+
+    # Hash calculado no pool de processos, fora do worker da API
+    senha_hash = await hash_senha_async(usuario.senha)
+    return await run_in_threadpool(_inserir_usuario, db, usuario, senha_hash)
+
+async def login_usuario(db: Session, email: str, senha: str):
     """Autentica usuário e retorna token JWT"""
-    usuario = autenticar_usuario(db, email, senha)
+    usuario = await autenticar_usuario(db, email, senha)
     if not usuario:
         raise HTTPException(status_code=401, detail="Email ou senha inválidos")
     
     # Criar token JWT
-    access_token = create_access_token(data={"sub": usuario.email})
+    access_token = criar_token_usuario(usuario)
     
     return {
         "access_token": access_token,
@@ -105,28 +181,20 @@ def login_usuario(db: Session, email: str, senha: str):
         }
     }
 
-def deletar_usuario(db: Session, email: str, senha: str):
+def _excluir_usuario(db: Session, usuario):
+    # Os dados (histórico, alertas, perfil) são expurgados em segundo plano
+    usuario_id = usuario.id
+    agendar_exclusao(db, usuario)
+    invalidar_perfil(usuario_id)
+    revogar_tokens_usuario(usuario_id)
+
+async def deletar_usuario(db: Session, email: str, senha: str):
     """Deleta usuário após verificar credenciais"""
-    usuario = db.query(Usuario).filter(Usuario.email == email).first()
-    if not usuario or not verify_password(senha, usuario.senha_hash):
+    usuario = await run_in_threadpool(_buscar_usuario_por_email, db, email)
+    if not usuario or not await verificar_senha_async(senha, usuario.senha_hash):
         raise HTTPException(status_code=401, detail="Usuário ou senha inválidos")
 
-    # Migrar hash legado para bcrypt automaticamente
-    if usuario.senha_hash.startswith("HASH_"):
-        usuario.senha_hash = hash_senha(senha)
-        db.commit()
-
-    # Deletar registros relacionados primeiro
-    # Deletar perfil de saúde
-    db.query(PerfilSaude).filter(PerfilSaude.usuario_id == usuario.id).delete()
-    # Deletar histórico AQI
-    db.query(AQIPersonalizadoHistorico).filter(AQIPersonalizadoHistorico.usuario_id == usuario.id).delete()
-    # Deletar alertas enviados
-    db.query(AlertasEnviados).filter(AlertasEnviados.usuario_id == usuario.id).delete()
-    
-    # Agora pode deletar o usuário
-    db.delete(usuario)
-    db.commit()
+    await run_in_threadpool(_excluir_usuario, db, usuario)
     return {"msg": "Conta deletada com sucesso!"}
 
 # -----------------------------
@@ -138,6 +206,7 @@ def criar_perfil_saude(db: Session, perfil):
     db.add(db_perfil)
     db.commit()
     db.refresh(db_perfil)
+    invalidar_perfil(db_perfil.usuario_id)
     return db_perfil
 
 def obter_perfil_usuario(db: Session, usuario_id: int):
@@ -173,6 +242,13 @@ def registrar_alerta(db: Session, usuario_id: int, nivel_alerta: str, metodo: st
     db.refresh(alerta)
     return alerta
 
+def registrar_alertas_lote(db: Session, alertas: list):
+    """Registra vários alertas enviados com uma única inserção em lote"""
+    if not alertas:
+        return
+    db.execute(insert(AlertasEnviados), alertas)
+    db.commit()
+
 # -----------------------------
 # Forgot Password / Reset
 # -----------------------------
@@ -185,10 +261,13 @@ def gerar_token_redefinicao(db: Session, email: str):
         token = secrets.token_urlsafe(48)
         token_hash = hashlib.sha256(token.encode()).hexdigest()
         
-        # Salvar no banco
-        usuario.reset_token_hash = token_hash
-        usuario.reset_expires_at = datetime.utcnow() + timedelta(minutes=RESET_TOKEN_EXP_MINUTES)
-        db.add(usuario)
+        # Salvar no banco (um token ativo por usuário: o novo substitui os anteriores)
+        db.query(TokenRedefinicao).filter(TokenRedefinicao.usuario_id == usuario.id).delete()
+        db.add(TokenRedefinicao(
+            usuario_id=usuario.id,
+            token_hash=token_hash,
+            expira_em=datetime.utcnow() + timedelta(minutes=RESET_TOKEN_EXP_MINUTES)
+        ))
         db.commit()
 
         # Preparar e-mail
@@ -210,40 +289,41 @@ def gerar_token_redefinicao(db: Session, email: str):
         Sistema Aura Air - Qualidade do Ar Personalizada
         """
 
-        # Enviar e-mail
-        try:
-            resultado = enviar_alerta_email(usuario.email, assunto, corpo)
-            if resultado:
-                print(f"✅ E-mail de reset enviado para: {usuario.email}")
-            else:
-                print(f"⚠️ E-mail salvo em fallback para: {usuario.email}")
-        except Exception as e:
-            print(f"⚠️ Erro ao enviar e-mail: {e}")
-            # Continuar mesmo se e-mail falhar
+        # Enfileirar e-mail (enviado em segundo plano)
+        if enfileirar_email(usuario.email, assunto, corpo):
+            print(f"✅ E-mail de reset enfileirado para: {usuario.email}")
+        else:
+            print(f"⚠️ E-mail salvo em fallback para: {usuario.email}")
 
     # Resposta genérica para segurança
     return {"msg": "Se o e-mail existir no sistema, você receberá instruções para resetar a senha."}
 
-def redefinir_senha(db: Session, token: str, nova_senha: str):
-    token_hash = hashlib.sha256(token.encode()).hexdigest()
+def _buscar_usuario_por_token(db: Session, token_hash: str):
+    # Busca pelo índice único do hash
     agora = datetime.utcnow()
+    return db.query(Usuario)\
+             .join(TokenRedefinicao, TokenRedefinicao.usuario_id == Usuario.id)\
+             .filter(TokenRedefinicao.token_hash == token_hash, TokenRedefinicao.expira_em >= agora)\
+             .first()
 
-    usuario = db.query(Usuario).filter(
-        Usuario.reset_token_hash == token_hash,
-        Usuario.reset_expires_at != None,
-        Usuario.reset_expires_at >= agora
-    ).first()
-
-    if not usuario:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Token inválido ou expirado")
-
-    # Atualizar senha com bcrypt
-    usuario.senha_hash = pwd_context.hash(nova_senha)
+def _atualizar_senha(db: Session, usuario, senha_hash: str):
+    usuario.senha_hash = senha_hash
 
     # Invalidar token
-    usuario.reset_token_hash = None
-    usuario.reset_expires_at = None
+    db.query(TokenRedefinicao).filter(TokenRedefinicao.usuario_id == usuario.id).delete()
 
     db.add(usuario)
     db.commit()
+
+async def redefinir_senha(db: Session, token: str, nova_senha: str):
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+
+    usuario = await run_in_threadpool(_buscar_usuario_por_token, db, token_hash)
+
+    if not usuario:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Token inválido ou expirado")
+
+    # Atualizar senha com bcrypt (no pool de processos)
+    senha_hash = await hash_senha_async(nova_senha)
+    await run_in_threadpool(_atualizar_senha, db, usuario, senha_hash)
     return {"msg": "Senha redefinida com sucesso!"}
\ No newline at end of file
@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select, delete
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import time
+import threading
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,7 +15,48 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is required")
 
-engine = create_engine(DATABASE_URL)
+# URL do engine assíncrono; por padrão derivada de DATABASE_URL (ver url_assincrona)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Pool de conexões (ignorado pelo SQLite, exceto pre-ping e recycle)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Conexões mais velhas que isto são recriadas (abaixo do wait_timeout do MySQL)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+# Driver assíncrono equivalente a cada driver síncrono
+DRIVERS_ASSINCRONOS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def opcoes_engine(url) -> dict:
+    """Parâmetros de pool e timeout para create_engine/create_async_engine"""
+    url = make_url(url)
+    opcoes = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if url.get_backend_name() != "sqlite":
+        opcoes.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    if url.get_backend_name() == "mysql":
+        chave = "connection_timeout" if url.get_driver_name() == "mysqlconnector" else "connect_timeout"
+        opcoes["connect_args"] = {chave: DB_CONNECT_TIMEOUT}
+    return opcoes
+
+
+def url_assincrona(url: str) -> str:
+    """Troca o driver da URL pelo equivalente assíncrono (ex.: mysql+pymysql -> mysql+aiomysql)"""
+    url = make_url(url)
+    driver = DRIVERS_ASSINCRONOS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"Sem driver assíncrono conhecido para '{url.drivername}'; defina ASYNC_DATABASE_URL")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+engine = create_engine(DATABASE_URL, **opcoes_engine(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -20,4 +65,53 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def excluir_em_lotes(tabela, condicao, lote: int, pausa: float = 0, parar: Optional[threading.Event] = None) -> int:
+    """
+    Apaga as linhas de `tabela` que atendem `condicao` em lotes de até `lote`
+    linhas pela chave primária `id`, cada lote em uma transação curta.
+    Retorna o total removido; interrompe entre lotes se `parar` for sinalizado.
+    """
+    total = 0
+    while parar is None or not parar.is_set():
+        with engine.begin() as conn:
+            ids = conn.execute(select(tabela.c.id).where(condicao).limit(lote)).scalars().all()
+            if ids:
+                conn.execute(delete(tabela).where(tabela.c.id.in_(ids)))
+        total += len(ids)
+        if len(ids) < lote:
+            break
+        if pausa:
+            time.sleep(pausa)
+    return total
+
+# Engine assíncrono, criado no primeiro uso (o driver só é importado se necessário)
+_engine_async = None
+_SessionAsync = None
+
+def obter_engine_async():
+    global _engine_async, _SessionAsync
+    if _engine_async is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        url = ASYNC_DATABASE_URL or url_assincrona(DATABASE_URL)
+        _engine_async = create_async_engine(url, **opcoes_engine(url))
+        _SessionAsync = async_sessionmaker(_engine_async, autoflush=False, expire_on_commit=False)
+    return _engine_async
+
+def AsyncSessionLocal():
+    obter_engine_async()
+    return _SessionAsync()
+
+async def get_async_db():
+    """Dependência com AsyncSession, para endpoints async sem ocupar o threadpool"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def encerrar_engine_async():
+    global _engine_async, _SessionAsync
+    if _engine_async is not None:
+        await _engine_async.dispose()
+        _engine_async = None
+        _SessionAsync = None
\ No newline at end of file
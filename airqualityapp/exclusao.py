@@ -0,0 +1,112 @@
+"""
+Exclusão de contas com expurgo dos dados em segundo plano.
+
+A requisição de exclusão apenas anonimiza o usuário (liberando o e-mail) e
+registra a conta em `exclusao_pendente`. Uma tarefa periódica apaga os dados
+do usuário em lotes de `EXCLUSAO_LOTE` linhas, cada lote em uma transação
+curta, e por fim remove o usuário. Exclusões interrompidas (reinício, erro
+no banco) são retomadas na próxima execução.
+"""
+import os
+import asyncio
+import logging
+import threading
+from typing import Callable, Iterable, List
+
+from dotenv import load_dotenv
+from sqlalchemy import Table, delete
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, engine, excluir_em_lotes
+from .models import (Usuario, PerfilSaude, AQIPersonalizadoHistorico, AQIHistoricoAgregado, AlertasEnviados,
+                     ExclusaoPendente, TokenRedefinicao)
+from .historico import buffer_historico
+from .tarefas import TarefaPeriodica
+
+load_dotenv()
+
+EXCLUSAO_LOTE = int(os.getenv("EXCLUSAO_LOTE", "2000"))
+# Pausa entre lotes, para não monopolizar o banco durante expurgos grandes
+EXCLUSAO_PAUSA = float(os.getenv("EXCLUSAO_PAUSA", "0.05"))
+EXCLUSAO_INTERVALO = float(os.getenv("EXCLUSAO_INTERVALO", "60"))
+
+logger = logging.getLogger(__name__)
+
+# Funções que retornam tabelas adicionais com coluna usuario_id (ex.: partições)
+_fontes: List[Callable[[], Iterable[Table]]] = []
+_parando = threading.Event()
+
+
+def registrar_fonte_exclusao(fonte: Callable[[], Iterable[Table]]):
+    _fontes.append(fonte)
+
+
+def _tabelas() -> List[Table]:
+    tabelas = [AQIPersonalizadoHistorico.__table__, AQIHistoricoAgregado.__table__, AlertasEnviados.__table__]
+    for fonte in _fontes:
+        tabelas.extend(fonte())
+    # Perfil por último: é o que mantém o usuário "visível" no monitoramento
+    tabelas.append(PerfilSaude.__table__)
+    return tabelas
+
+
+def agendar_exclusao(db: Session, usuario: Usuario):
+    """Anonimiza o usuário e agenda o expurgo dos seus dados"""
+    usuario.nome = ""
+    usuario.email = f"excluido-{usuario.id}@exclusao.invalid"
+    usuario.senha_hash = "!"
+    usuario.data_nascimento = None
+    usuario.cidade = None
+    usuario.estado = None
+    db.query(TokenRedefinicao).filter(TokenRedefinicao.usuario_id == usuario.id).delete()
+    db.add(ExclusaoPendente(usuario_id=usuario.id))
+    db.commit()
+    _tarefa_exclusao.acordar()
+
+
+def expurgar_usuario(usuario_id: int) -> bool:
+    """Apaga os dados do usuário em lotes; retorna False se interrompido antes do fim"""
+    # Linhas ainda no buffer de escrita seriam gravadas depois do expurgo
+    buffer_historico.flush()
+
+    for tabela in _tabelas():
+        removidas = excluir_em_lotes(tabela, tabela.c.usuario_id == usuario_id, EXCLUSAO_LOTE,
+                                     pausa=EXCLUSAO_PAUSA, parar=_parando)
+        if _parando.is_set():
+            return False
+        if removidas:
+            logger.info(f"Exclusão do usuário {usuario_id}: {removidas} linhas removidas de {tabela.name}")
+
+    with engine.begin() as conn:
+        conn.execute(delete(Usuario.__table__).where(Usuario.__table__.c.id == usuario_id))
+        conn.execute(delete(ExclusaoPendente.__table__).where(ExclusaoPendente.__table__.c.usuario_id == usuario_id))
+    return True
+
+
+def processar_exclusoes_pendentes():
+    with SessionLocal() as db:
+        pendentes = [u for (u,) in db.query(ExclusaoPendente.usuario_id).order_by(ExclusaoPendente.id)]
+
+    for usuario_id in pendentes:
+        try:
+            if not expurgar_usuario(usuario_id):
+                return
+            logger.info(f"Exclusão do usuário {usuario_id} concluída")
+        except Exception as e:
+            # Fica pendente e é retomada na próxima execução
+            logger.error(f"Erro ao expurgar dados do usuário {usuario_id}: {e}")
+
+
+_tarefa_exclusao = TarefaPeriodica("exclusao-contas", processar_exclusoes_pendentes, EXCLUSAO_INTERVALO)
+
+
+async def iniciar_exclusoes():
+    _parando.clear()
+    _tarefa_exclusao.iniciar()
+    # Retoma exclusões interrompidas por um reinício
+    _tarefa_exclusao.acordar()
+
+
+async def parar_exclusoes():
+    _parando.set()
+    await asyncio.to_thread(_tarefa_exclusao.parar, False)
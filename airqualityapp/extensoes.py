@@ -0,0 +1,26 @@
+"""
+Carregamento de implementações configuráveis por variável de ambiente
+(transportes de alertas, canal de invalidação de cache, ...).
+"""
+import importlib
+from typing import Callable, Dict, Type, TypeVar
+
+T = TypeVar("T")
+
+
+def carregar_implementacao(caminho: str, tipo: Type[T], embutidas: Dict[str, Callable[[], T]]) -> T:
+    """
+    Instancia a implementação indicada por `caminho`: o nome de uma
+    implementação embutida (ex.: "local") ou "modulo:Classe". Levanta
+    TypeError se a classe não implementar `tipo`.
+    """
+    if caminho in embutidas:
+        return embutidas[caminho]()
+
+    modulo, _, nome = caminho.partition(":")
+    if not nome:
+        raise ValueError(f"Implementação inválida '{caminho}': use 'modulo:Classe'")
+    classe = getattr(importlib.import_module(modulo), nome)
+    if not (isinstance(classe, type) and issubclass(classe, tipo)):
+        raise TypeError(f"'{caminho}' não implementa {tipo.__name__}")
+    return classe()
@@ -0,0 +1,183 @@
+"""
+Gravação em segundo plano (write-behind) dos registros de histórico de AQI.
+
+Os endpoints apenas adicionam linhas ao buffer em memória; uma tarefa
+periódica grava tudo com uma inserção em lote por tabela quando o buffer
+atinge `HISTORICO_BUFFER_MAX` linhas ou a cada `HISTORICO_BUFFER_INTERVALO`
+segundos. O buffer é esvaziado também no encerramento da aplicação.
+"""
+import os
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, text
+from sqlalchemy.exc import OperationalError
+
+from .database import SessionLocal
+from .models import AQIPersonalizadoHistorico
+from .tarefas import TarefaPeriodica
+
+load_dotenv()
+
+HISTORICO_BUFFER_MAX = int(os.getenv("HISTORICO_BUFFER_MAX", "500"))
+HISTORICO_BUFFER_INTERVALO = float(os.getenv("HISTORICO_BUFFER_INTERVALO", "2"))
+# Limite de linhas em memória se o banco ficar indisponível (as mais antigas são descartadas)
+HISTORICO_BUFFER_LIMITE = int(os.getenv("HISTORICO_BUFFER_LIMITE", "100000"))
+
+logger = logging.getLogger(__name__)
+
+
+class BufferEscrita:
+    """Buffer de linhas por modelo gravadas em lote em segundo plano"""
+
+    def __init__(self, sessao: Callable = SessionLocal, max_registros: int = HISTORICO_BUFFER_MAX,
+                 intervalo: float = HISTORICO_BUFFER_INTERVALO, limite: int = HISTORICO_BUFFER_LIMITE):
+        self.sessao = sessao
+        self.max_registros = max_registros
+        self.limite = limite
+        self._linhas = deque()  # (modelo, valores)
+        self._lock = threading.Lock()
+        # Evita dois flushes simultâneos (tarefa periódica e flush explícito)
+        self._lock_flush = threading.Lock()
+        self._tarefa = TarefaPeriodica("buffer-historico", self.flush, intervalo)
+        self.gravados = 0
+        self.falhas = 0
+        self.descartados = 0
+        self.lotes = 0
+
+    def adicionar(self, modelo, **valores):
+        """Enfileira uma linha para `modelo` (classe ORM ou Table). `data_hora` é fixada agora, não na gravação."""
+        valores.setdefault("data_hora", datetime.utcnow())
+        with self._lock:
+            self._linhas.append((modelo, valores))
+            if len(self._linhas) > self.limite:
+                self._linhas.popleft()
+                self.descartados += 1
+            cheio = len(self._linhas) >= self.max_registros
+
+        if not self._tarefa.ativa:
+            self._tarefa.iniciar()
+        if cheio:
+            self._tarefa.acordar()
+
+    def _retirar(self):
+        with self._lock:
+            linhas = list(self._linhas)
+            self._linhas.clear()
+        return linhas
+
+    def _devolver(self, linhas):
+        with self._lock:
+            self._linhas.extendleft(reversed(linhas))
+
+    def flush(self):
+        """Grava todas as linhas pendentes"""
+        with self._lock_flush:
+            linhas = self._retirar()
+            if not linhas:
+                return
+
+            por_modelo = {}
+            for modelo, valores in linhas:
+                por_modelo.setdefault(modelo, []).append(valores)
+
+            for modelo, registros in por_modelo.items():
+                self._gravar(modelo, registros)
+
+    def _banco_acessivel(self) -> bool:
+        """Distingue banco fora do ar de erros de esquema (ex.: partição inexistente), ambos OperationalError"""
+        db = self.sessao()
+        try:
+            db.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+        finally:
+            db.close()
+
+    def _gravar(self, modelo, registros):
+        # Aceita modelos ORM ou objetos Table (ex.: partições)
+        tabela = getattr(modelo, "__table__", modelo).name
+        db = self.sessao()
+        try:
+            db.execute(insert(modelo), registros)
+            db.commit()
+            self.gravados += len(registros)
+            self.lotes += 1
+            return
+        except Exception as e:
+            db.rollback()
+            if isinstance(e, OperationalError) and not self._banco_acessivel():
+                # Banco indisponível: devolve o lote ao buffer para a próxima tentativa
+                logger.error(f"Banco indisponível ao gravar histórico: {e}")
+                self._devolver([(modelo, v) for v in registros])
+                return
+            logger.warning(f"Falha na inserção em lote de {len(registros)} linhas em {tabela}: {e}")
+        finally:
+            db.close()
+
+        # Fallback linha a linha: uma linha inválida não derruba o lote inteiro
+        db = self.sessao()
+        try:
+            for i, valores in enumerate(registros):
+                try:
+                    db.execute(insert(modelo), [valores])
+                    db.commit()
+                    self.gravados += 1
+                except OperationalError as e:
+                    db.rollback()
+                    if not self._banco_acessivel():
+                        # Banco indisponível: devolve o restante ao buffer para a próxima tentativa
+                        logger.error(f"Banco indisponível ao gravar histórico: {e}")
+                        self._devolver([(modelo, v) for v in registros[i:]])
+                        return
+                    # Banco no ar: erro da própria linha/tabela, que não se resolve com novas tentativas
+                    self.falhas += 1
+                    logger.error(f"Linha de histórico descartada ({tabela}): {e}")
+                except Exception as e:
+                    db.rollback()
+                    self.falhas += 1
+                    logger.error(f"Linha de histórico descartada ({tabela}): {e}")
+        finally:
+            db.close()
+
+    def parar(self):
+        """Encerra a tarefa periódica gravando o que restou no buffer"""
+        self._tarefa.parar(executar_final=True)
+
+    def __len__(self):
+        return len(self._linhas)
+
+    def estatisticas(self) -> dict:
+        return {
+            "profundidade": len(self._linhas),
+            "gravados": self.gravados,
+            "lotes": self.lotes,
+            "falhas": self.falhas,
+            "descartados": self.descartados
+        }
+
+
+buffer_historico = BufferEscrita()
+
+
+def registrar_historico(usuario_id: int, aqi_original: int, aqi_personalizado: int, nivel_alerta: str,
+                        data_hora: Optional[datetime] = None):
+    """Versão sem espera de `crud.salvar_historico`: a linha é gravada em segundo plano"""
+    buffer_historico.adicionar(
+        AQIPersonalizadoHistorico,
+        usuario_id=usuario_id,
+        aqi_original=aqi_original,
+        aqi_personalizado=aqi_personalizado,
+        nivel_alerta=nivel_alerta,
+        data_hora=data_hora or datetime.utcnow()
+    )
+
+
+async def parar_buffer_historico():
+    await asyncio.to_thread(buffer_historico.parar)
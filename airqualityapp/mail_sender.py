@@ -0,0 +1,443 @@
+"""
+Envio de e-mails em segundo plano.
+
+Os endpoints apenas enfileiram (`enfileirar_email`); `EMAIL_CONEXOES` threads
+mantêm cada uma uma conexão SMTP autenticada e reutilizada entre mensagens
+(sem novo STARTTLS/login por e-mail) e enviam a fila em lotes de até
+`EMAIL_LOTE` mensagens pela mesma conexão.
+
+Cada e-mail é gravado no spool durável (spool_email) ao ser enfileirado,
+reservado enquanto está em memória, e só sai de lá após o envio: uma queda do
+processo não perde a fila nem os reenvios agendados, que voltam a ser
+enviados quando a reserva expira. Falhas temporárias voltam para a fila com
+espera exponencial; após `EMAIL_TENTATIVAS` tentativas, com a fila cheia ou
+no encerramento, as mensagens ficam com a tarefa de reenvio, que devolve o
+spool à fila assim que o servidor SMTP responde.
+
+Para testar sem um provedor real, aponte EMAIL_HOST/EMAIL_PORT para um
+servidor local (ex.: aiosmtpd) com EMAIL_USE_TLS=false.
+"""
+import os
+import time
+import heapq
+import queue
+import random
+import asyncio
+import logging
+import smtplib
+import threading
+import itertools
+from dataclasses import dataclass, field
+from email.mime.text import MIMEText
+from typing import Callable, List, Optional
+
+from dotenv import load_dotenv
+
+from .mail_utils import EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASS, EMAIL_USE_TLS, EMAIL_FROM as _EMAIL_FROM
+from .spool_email import SpoolEmail, spool_email
+from .tarefas import TarefaPeriodica
+
+load_dotenv()
+
+EMAIL_FROM = _EMAIL_FROM or "nao-responda@aura-air.local"
+# Conexões SMTP simultâneas (uma por thread de envio)
+EMAIL_CONEXOES = int(os.getenv("EMAIL_CONEXOES", "4"))
+# Mensagens enviadas por conexão antes de voltar à fila
+EMAIL_LOTE = int(os.getenv("EMAIL_LOTE", "50"))
+EMAIL_FILA_MAX = int(os.getenv("EMAIL_FILA_MAX", "50000"))
+EMAIL_TENTATIVAS = int(os.getenv("EMAIL_TENTATIVAS", "5"))
+EMAIL_BACKOFF_BASE = float(os.getenv("EMAIL_BACKOFF_BASE", "2"))
+EMAIL_BACKOFF_MAX = float(os.getenv("EMAIL_BACKOFF_MAX", "300"))
+EMAIL_TIMEOUT = float(os.getenv("EMAIL_TIMEOUT", "10"))
+# Conexões ociosas por mais que isto são fechadas (os servidores derrubam as antigas)
+EMAIL_CONEXAO_OCIOSA = float(os.getenv("EMAIL_CONEXAO_OCIOSA", "60"))
+# Intervalo da tarefa de reenvio do spool e e-mails reservados por vez
+EMAIL_SPOOL_INTERVALO = float(os.getenv("EMAIL_SPOOL_INTERVALO", "30"))
+EMAIL_SPOOL_LOTE = int(os.getenv("EMAIL_SPOOL_LOTE", "500"))
+
+# Conexões paradas há mais que isto são testadas com NOOP antes do lote
+_VERIFICAR_APOS = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EmailPendente:
+    destino: str
+    assunto: str
+    mensagem: str
+    tentativas: int = 0
+    criado_em: float = field(default_factory=time.time)
+    # Id no spool, de onde é removido após o envio (None se a gravação falhou)
+    id_spool: Optional[str] = None
+    # Veio da tarefa de reenvio: falhas voltam direto ao spool, que tem a própria espera
+    do_reenvio: bool = False
+
+
+class RemetenteEmail:
+    """Fila de e-mails consumida por threads com conexões SMTP persistentes"""
+
+    def __init__(self, host: str = EMAIL_HOST, porta: int = EMAIL_PORT, usuario: Optional[str] = EMAIL_USER,
+                 senha: Optional[str] = EMAIL_PASS, usar_tls: bool = EMAIL_USE_TLS, remetente: str = EMAIL_FROM,
+                 conexoes: int = EMAIL_CONEXOES, lote: int = EMAIL_LOTE, fila_max: int = EMAIL_FILA_MAX,
+                 spool: SpoolEmail = spool_email):
+        self.host = host
+        self.porta = porta
+        self.usuario = usuario
+        self.senha = senha
+        self.usar_tls = usar_tls
+        self.remetente = remetente
+        self.conexoes = conexoes
+        self.lote = lote
+        self.spool = spool
+        self._fila: "queue.Queue[EmailPendente]" = queue.Queue(maxsize=fila_max)
+        # Reenvios agendados: (instante, sequência, e-mail)
+        self._reenvios = []
+        self._sequencia = itertools.count()
+        self._lock = threading.Lock()
+        self._parando = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._falha_conexao = False
+        # Chamados quando o servidor volta a aceitar conexões após uma falha
+        self.ouvintes_recuperacao: List[Callable[[], None]] = []
+        self.enfileirados = 0
+        self.enviados = 0
+        self.reenvios = 0
+        self.descartados = 0
+        self.no_spool = 0
+        self.conexoes_criadas = 0
+
+    @property
+    def ativo(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    @property
+    def em_falha(self) -> bool:
+        """Indica se a última tentativa de conexão ao servidor SMTP falhou"""
+        return self._falha_conexao
+
+    def iniciar(self):
+        with self._lock:
+            if self.ativo:
+                return
+            self._parando.clear()
+            self._threads = [
+                threading.Thread(target=self._trabalhar, name=f"envio-email-{i}", daemon=True)
+                for i in range(self.conexoes)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def enfileirar(self, destino: str, assunto: str, mensagem: str) -> bool:
+        """
+        Grava o e-mail no spool e o enfileira sem esperar o envio; retorna False
+        se ficou só no spool (fila cheia). Bloqueia até a gravação em disco: em
+        código assíncrono, chame em uma thread.
+        """
+        email = EmailPendente(destino, assunto, mensagem)
+        try:
+            email.id_spool = self.spool.gravar(destino, assunto, mensagem, reservar=True)
+        except Exception as e:
+            # Segue apenas em memória: só se perde se o processo cair antes do envio
+            logger.error(f"Falha ao gravar no spool o e-mail para {destino}: {e}")
+        try:
+            self._fila.put_nowait(email)
+        except queue.Full:
+            logger.error(f"Fila de e-mails cheia; e-mail para {destino} fica no spool para reenvio")
+            self._devolver_ao_spool([email])
+            return False
+
+        self.enfileirados += 1
+        if not self.ativo and not self._parando.is_set():
+            self.iniciar()
+        return True
+
+    def reenfileirar(self, id_spool: str, destino: str, assunto: str, mensagem: str, tentativas: int = 0) -> bool:
+        """Coloca na fila um e-mail reservado do spool; retorna False se não houver espaço"""
+        if self._parando.is_set():
+            return False
+        try:
+            self._fila.put_nowait(EmailPendente(destino, assunto, mensagem, tentativas, id_spool=id_spool,
+                                                do_reenvio=True))
+        except queue.Full:
+            return False
+        if not self.ativo:
+            self.iniciar()
+        return True
+
+    def disponivel(self) -> bool:
+        """Testa se o servidor SMTP aceita conexão (e login)"""
+        try:
+            self._fechar(self._conectar())
+            return True
+        except (smtplib.SMTPException, OSError) as e:
+            logger.info(f"Servidor SMTP indisponível ({self.host}:{self.porta}): {e}")
+            return False
+
+    def _retirar_lote(self) -> Optional[List[EmailPendente]]:
+        """Reenvios vencidos e depois a fila, até `lote` e-mails; None ao encerrar com a fila vazia"""
+        lote = []
+        agora = time.monotonic()
+        with self._lock:
+            while self._reenvios and self._reenvios[0][0] <= agora and len(lote) < self.lote:
+                lote.append(heapq.heappop(self._reenvios)[2])
+
+        if not lote:
+            try:
+                lote.append(self._fila.get(timeout=0.5))
+            except queue.Empty:
+                return None if self._parando.is_set() else []
+
+        while len(lote) < self.lote:
+            try:
+                lote.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _trabalhar(self):
+        conexao = None
+        ultimo_uso = 0.0
+        while True:
+            lote = self._retirar_lote()
+            if lote is None:
+                break
+
+            ociosa = time.monotonic() - ultimo_uso
+            if conexao is not None and ociosa > EMAIL_CONEXAO_OCIOSA:
+                conexao = self._fechar(conexao)
+            if not lote:
+                continue
+
+            if conexao is not None and ociosa > _VERIFICAR_APOS and not self._viva(conexao):
+                conexao = self._fechar(conexao)
+            conexao = self._enviar_lote(conexao, lote)
+            ultimo_uso = time.monotonic()
+        self._fechar(conexao)
+
+    def _conectar(self) -> smtplib.SMTP:
+        try:
+            conexao = smtplib.SMTP(self.host, self.porta, timeout=EMAIL_TIMEOUT)
+            try:
+                if self.usar_tls:
+                    conexao.starttls()
+                if self.usuario and self.senha:
+                    conexao.login(self.usuario, self.senha)
+            except Exception:
+                conexao.close()
+                raise
+        except (smtplib.SMTPException, OSError):
+            self._falha_conexao = True
+            raise
+
+        self.conexoes_criadas += 1
+        if self._falha_conexao:
+            self._falha_conexao = False
+            logger.info(f"Servidor SMTP {self.host}:{self.porta} voltou a aceitar conexões")
+            for ouvinte in self.ouvintes_recuperacao:
+                ouvinte()
+        return conexao
+
+    def _viva(self, conexao: smtplib.SMTP) -> bool:
+        try:
+            return conexao.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _fechar(self, conexao: Optional[smtplib.SMTP]) -> None:
+        if conexao is not None:
+            try:
+                conexao.quit()
+            except (smtplib.SMTPException, OSError):
+                conexao.close()
+        return None
+
+    def _montar(self, email: EmailPendente) -> MIMEText:
+        msg = MIMEText(email.mensagem)
+        msg["Subject"] = email.assunto
+        msg["From"] = self.remetente
+        msg["To"] = email.destino
+        return msg
+
+    def _enviar_lote(self, conexao: Optional[smtplib.SMTP], lote: List[EmailPendente]) -> Optional[smtplib.SMTP]:
+        """Envia o lote pela conexão (aberta se preciso); retorna a conexão para o próximo lote"""
+        # E-mails do spool já resolvidos (enviados ou descartados), removidos de lá ao fim do lote
+        resolvidos = []
+        try:
+            for i, email in enumerate(lote):
+                if conexao is None:
+                    try:
+                        conexao = self._conectar()
+                    except (smtplib.SMTPException, OSError) as e:
+                        logger.warning(f"Falha ao conectar em {self.host}:{self.porta}: {e}")
+                        for restante in lote[i:]:
+                            self._reagendar(restante)
+                        return None
+
+                try:
+                    conexao.send_message(self._montar(email))
+                    self.enviados += 1
+                    resolvidos.append(email)
+                except smtplib.SMTPRecipientsRefused as e:
+                    self.descartados += 1
+                    resolvidos.append(email)
+                    logger.error(f"Destinatário recusado ({email.destino}): {e}")
+                except smtplib.SMTPResponseException as e:
+                    # 5xx é permanente para esta mensagem; 4xx tenta de novo
+                    if 500 <= e.smtp_code < 600:
+                        self.descartados += 1
+                        resolvidos.append(email)
+                        logger.error(f"E-mail para {email.destino} recusado pelo servidor: {e.smtp_code} {e.smtp_error}")
+                    else:
+                        self._reagendar(email)
+                except (smtplib.SMTPException, OSError) as e:
+                    # Conexão perdida: a próxima mensagem abre outra
+                    logger.warning(f"Conexão SMTP perdida: {e}")
+                    conexao = self._fechar(conexao)
+                    self._reagendar(email)
+            return conexao
+        finally:
+            self._confirmar_no_spool(resolvidos)
+
+    def _reagendar(self, email: EmailPendente):
+        email.tentativas += 1
+        if email.do_reenvio:
+            self._adiar_no_spool(email)
+            return
+        if email.tentativas >= EMAIL_TENTATIVAS or self._parando.is_set():
+            self._devolver_ao_spool([email])
+            return
+        espera = min(EMAIL_BACKOFF_BASE * 2 ** (email.tentativas - 1), EMAIL_BACKOFF_MAX)
+        espera *= random.uniform(0.5, 1.0)
+        with self._lock:
+            heapq.heappush(self._reenvios, (time.monotonic() + espera, next(self._sequencia), email))
+        self.reenvios += 1
+
+    def _devolver_ao_spool(self, emails: List[EmailPendente]):
+        """Passa os e-mails à tarefa de reenvio: desfaz a reserva dos já gravados e grava os demais"""
+        gravados = [e.id_spool for e in emails if e.id_spool is not None]
+        if gravados:
+            try:
+                self.spool.liberar(gravados)
+            except Exception as e:
+                # A reserva expira e os e-mails são reenviados mesmo assim
+                logger.error(f"Falha ao liberar {len(gravados)} e-mails no spool: {e}")
+        self.no_spool += sum(1 for e in emails if e.id_spool is not None and not e.do_reenvio)
+        nao_gravados = [e for e in emails if e.id_spool is None]
+        if nao_gravados:
+            self._guardar_no_spool(nao_gravados)
+
+    def _guardar_no_spool(self, emails: List[EmailPendente]):
+        try:
+            self.spool.gravar_lote([(e.destino, e.assunto, e.mensagem) for e in emails])
+            self.no_spool += len(emails)
+        except Exception as e:
+            logger.error(f"Falha ao gravar {len(emails)} e-mails no spool: {e}")
+
+    def _adiar_no_spool(self, email: EmailPendente):
+        try:
+            self.spool.adiar(email.id_spool, email.tentativas)
+        except Exception as e:
+            # A reserva expira e o e-mail é reenviado mesmo assim
+            logger.error(f"Falha ao adiar o e-mail {email.id_spool} no spool: {e}")
+
+    def _confirmar_no_spool(self, emails: List[EmailPendente]):
+        ids = [e.id_spool for e in emails if e.id_spool is not None]
+        if not ids:
+            return
+        try:
+            self.spool.confirmar(ids)
+        except Exception as e:
+            # Continuam no spool e serão reenviados (duplicados) quando a reserva expirar
+            logger.error(f"Falha ao remover {len(ids)} e-mails enviados do spool: {e}")
+
+    def parar(self, timeout: Optional[float] = None):
+        """
+        Envia o que estiver na fila até `timeout` (padrão: uma conexão e um
+        envio, 2 × EMAIL_TIMEOUT) e devolve o restante à tarefa de reenvio.
+        Lotes ainda em envio continuam reservados no spool e são reenviados
+        quando a reserva expirar.
+        """
+        self._parando.set()
+        limite = time.monotonic() + (2 * EMAIL_TIMEOUT if timeout is None else timeout)
+        for thread in self._threads:
+            thread.join(max(0.0, limite - time.monotonic()))
+
+        with self._lock:
+            restantes = [email for _, _, email in self._reenvios]
+            self._reenvios.clear()
+        while True:
+            try:
+                restantes.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        if restantes:
+            self._devolver_ao_spool(restantes)
+            logger.warning(f"{len(restantes)} e-mails não enviados mantidos no spool")
+
+    def __len__(self):
+        return self._fila.qsize() + len(self._reenvios)
+
+    def estatisticas(self) -> dict:
+        return {
+            "profundidade": self._fila.qsize(),
+            "reenvios_agendados": len(self._reenvios),
+            "enfileirados": self.enfileirados,
+            "enviados": self.enviados,
+            "reenvios": self.reenvios,
+            "descartados": self.descartados,
+            "no_spool": self.no_spool,
+            "conexoes_criadas": self.conexoes_criadas,
+            "spool": self.spool.estatisticas()
+        }
+
+
+remetente_email = RemetenteEmail()
+_parando = threading.Event()
+
+
+def reenviar_spool():
+    """Devolve os e-mails do spool à fila enquanto o servidor SMTP estiver respondendo"""
+    spool_email.importar_fallback_legado()
+    if spool_email.pendentes() == 0 or not remetente_email.disponivel():
+        return
+
+    total = 0
+    while not _parando.is_set() and not remetente_email.em_falha:
+        # Mantém a fila abastecida sem ocupá-la toda com o spool
+        if len(remetente_email) >= EMAIL_SPOOL_LOTE:
+            _parando.wait(0.05)
+            continue
+        reservados = spool_email.reservar(EMAIL_SPOOL_LOTE)
+        if not reservados:
+            break
+        recusados = [id_email for id_email, *dados in reservados if not remetente_email.reenfileirar(id_email, *dados)]
+        total += len(reservados) - len(recusados)
+        if recusados:
+            spool_email.liberar(recusados)
+            break
+    if total:
+        logger.info(f"{total} e-mails do spool devolvidos à fila de envio")
+
+
+_tarefa_reenvio = TarefaPeriodica("reenvio-spool-email", reenviar_spool, EMAIL_SPOOL_INTERVALO)
+remetente_email.ouvintes_recuperacao.append(_tarefa_reenvio.acordar)
+
+
+def enfileirar_email(destino: str, assunto: str, mensagem: str) -> bool:
+    """Versão sem espera de `mail_utils.enviar_alerta_email`: o envio acontece em segundo plano"""
+    return remetente_email.enfileirar(destino, assunto, mensagem)
+
+
+async def iniciar_envio_emails():
+    remetente_email.iniciar()
+    _parando.clear()
+    _tarefa_reenvio.iniciar()
+    # Importa o fallback antigo e reenvia o que ficou no spool
+    _tarefa_reenvio.acordar()
+
+
+async def parar_envio_emails():
+    _parando.set()
+    await asyncio.to_thread(_tarefa_reenvio.parar, False)
+    await asyncio.to_thread(remetente_email.parar)
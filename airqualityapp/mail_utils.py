@@ -12,6 +12,8 @@ EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "true").lower() == "true"
+# Remetente; sem EMAIL_FROM usa EMAIL_USER (servidores locais/relays podem dispensar login)
+EMAIL_FROM = os.getenv("EMAIL_FROM") or EMAIL_USER
 
 def testar_conectividade_smtp():
     """Testa se é possível conectar ao servidor SMTP"""
@@ -40,22 +42,24 @@ def enviar_alerta_email(destino, assunto, mensagem):
     """
     Envia e-mail com tratamento robusto de erros e fallback
     """
-    if not EMAIL_USER or not EMAIL_PASS:
+    if not EMAIL_FROM:
         print("❌ Configurações de e-mail não encontradas")
-        print("   Configure EMAIL_USER e EMAIL_PASS no arquivo .env")
+        print("   Configure EMAIL_USER e EMAIL_PASS (ou EMAIL_FROM, para servidores sem login) no arquivo .env")
         return False
     
     try:
         # Criar mensagem simples (como no código que funciona)
         msg = MIMEText(mensagem)
         msg['Subject'] = assunto
-        msg['From'] = EMAIL_USER
+        msg['From'] = EMAIL_FROM
         msg['To'] = destino
         
-        # Conectar e enviar usando Gmail SMTP (código que funciona)
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASS)
+        # Conectar e enviar pelo servidor configurado (EMAIL_HOST/EMAIL_PORT)
+        server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=10)
+        if EMAIL_USE_TLS:
+            server.starttls()
+        if EMAIL_USER and EMAIL_PASS:
+            server.login(EMAIL_USER, EMAIL_PASS)
         server.send_message(msg)
         server.quit()
         
@@ -85,44 +89,20 @@ def enviar_alerta_email(destino, assunto, mensagem):
 
 def enviar_email_fallback(destino, assunto, mensagem):
     """
-    Sistema de fallback quando SMTP falha
+    Sistema de fallback quando SMTP falha: guarda o e-mail no spool durável,
+    de onde é reenviado automaticamente quando o servidor voltar
     """
-    print("📧 FALLBACK: Salvando e-mail para envio posterior")
-    print("💡 Configure Gmail corretamente para envio automático")
-    
-    # Criar diretório de fallback se não existir
-    fallback_dir = "email_fallback"
-    if not os.path.exists(fallback_dir):
-        os.makedirs(fallback_dir)
-    
-    # Salvar e-mail em arquivo
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{fallback_dir}/email_{timestamp}.txt"
-    
+    from .spool_email import spool_email
+
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(f"E-MAIL DE FALLBACK - AURA AIR\n")
-            f.write(f"Data: {datetime.now()}\n")
-            f.write(f"Para: {destino}\n")
-            f.write(f"Assunto: {assunto}\n")
-            f.write("="*50 + "\n")
-            f.write(mensagem)
-            f.write("\n" + "="*50 + "\n")
-            f.write("Este e-mail foi salvo porque o SMTP não está funcionando.\n")
-            f.write("Configure Gmail corretamente para envio automático.\n")
-        
-        print(f"✅ E-mail salvo em: {filename}")
-        print("💡 Para configurar Gmail:")
-        configurar_gmail_alternativo()
+        id_email = spool_email.gravar(destino, assunto, mensagem)
+        print(f"📧 FALLBACK: E-mail {id_email} guardado no spool para reenvio automático")
         return True
-        
+
     except Exception as e:
         print(f"❌ Erro ao salvar fallback: {e}")
         return False
 
-# Importar datetime para fallback
-from datetime import datetime
-
 def testar_configuracao_email():
     """
     Função para testar se a configuração de e-mail está funcionando
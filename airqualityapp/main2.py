@@ -1,39 +1,75 @@
-from fastapi import APIRouter, Depends, HTTPException, Form
+from fastapi import APIRouter, Depends, HTTPException, Form, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from .database import get_db, Base, engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_db, get_async_db, encerrar_engine_async
+from .models import Usuario
 from .schemas import UsuarioCreate, PerfilSaudeCreate, PerfilSaudeCreateAuth, AQIResponse, LoginRequest, LoginResponse, UsuarioResponse
-from .crud import criar_usuario, criar_perfil_saude, obter_perfil_usuario, salvar_historico, login_usuario, get_current_user
+from .crud import criar_usuario, criar_perfil_saude, login_usuario, obter_principal
+from .perfis import obter_perfil_resumo, obter_perfil_resumo_async
+from .historico import registrar_historico, parar_buffer_historico
+from .senhas import encerrar_pool_senhas
+from .exclusao import iniciar_exclusoes, parar_exclusoes
+from .agregados import consultar_historico, iniciar_agregacao, parar_agregacao
+from .tokens_redefinicao import iniciar_limpeza_tokens, parar_limpeza_tokens
 from .utils import calcular_indice_personalizado, ajustar_aqi_com_meteorologia
-from .mail_utils import enviar_alerta_email
-import requests
+from .mail_sender import enfileirar_email, iniciar_envio_emails, parar_envio_emails
 import os
 from dotenv import load_dotenv
 from ml.predict import prever_proximos_15_dias
-import pandas as pd
 from datetime import datetime, timedelta
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from chatbot.context import ConversaContexto
 import random
+import asyncio
 import json
+from functools import lru_cache
 from .crud import gerar_token_redefinicao
 from .crud import redefinir_senha
 from . import crud
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
+from airmonitor.clima import cliente_clima
+from airmonitor.monitor import obter_aqi_por_cidade
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
-print("Aplicativo iniciado!")
-
-# Criação das tabelas (executa apenas uma vez)
-Base.metadata.create_all(bind=engine)
-
 app = APIRouter()
 
+# O esquema do banco é criado/atualizado por `python -m airqualityapp.migracoes`,
+# não na importação. `iniciar` e `encerrar` são chamados pelo lifespan de main.py.
+
+async def iniciar():
+    """Inicia as tarefas em segundo plano do módulo"""
+    # Expurgo dos dados de contas excluídas (retoma pendências)
+    await iniciar_exclusoes()
+    # Agregados por hora/dia do histórico de AQI
+    await iniciar_agregacao()
+    # Remoção dos tokens de redefinição de senha expirados
+    await iniciar_limpeza_tokens()
+    # Envio de e-mails pela fila com conexões SMTP persistentes
+    await iniciar_envio_emails()
+
+async def encerrar():
+    """Encerra as tarefas do módulo e libera conexões e processos"""
+    await parar_exclusoes()
+    await parar_agregacao()
+    await parar_limpeza_tokens()
+    # Envia os e-mails ainda na fila (o restante vai para o fallback)
+    await parar_envio_emails()
+    # Grava o histórico pendente no buffer
+    await parar_buffer_historico()
+    # Encerra o pool de processos de hash de senhas
+    await encerrar_pool_senhas()
+    # Fecha as conexões do engine assíncrono
+    await encerrar_engine_async()
+
 # Configuração OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/airquality/token")
+# Mesmo esquema, para endpoints que também atendem chamadas anônimas
+oauth2_scheme_opcional = OAuth2PasswordBearer(tokenUrl="/airquality/token", auto_error=False)
 
 # =============================================================================
 # FUNÇÕES DE AUTENTICAÇÃO
@@ -48,14 +84,29 @@ def get_authenticated_user(token: str = Depends(oauth2_scheme), db: Session = De
         def meu_endpoint(usuario = Depends(get_authenticated_user)):
             # usuario já está autenticado
             return {"user_id": usuario.id}
+
+    Retorna um Principal (id, email, nome) obtido das claims do token, sem
+    consulta ao banco. Use `get_authenticated_usuario` quando o endpoint
+    precisar do registro completo de Usuario.
     """
-    return get_current_user(db, token)
+    return obter_principal(db, token)
+
+def get_authenticated_user_opcional(token: Optional[str] = Depends(oauth2_scheme_opcional), db: Session = Depends(get_db)):
+    """Como `get_authenticated_user`, mas retorna None se a requisição não tiver token"""
+    if token is None:
+        return None
+    return obter_principal(db, token)
 
-# APIs
-OPENAQ_API = os.getenv("OPENAQ_API")
-NASA_API_KEY = os.getenv("NASA_API_KEY")
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
-OPENWEATHER_API_URL = os.getenv("OPENWEATHER_API_URL")
+async def get_authenticated_usuario(principal = Depends(get_authenticated_user), db: AsyncSession = Depends(get_async_db)):
+    """Dependência que retorna o registro completo de Usuario autenticado (sessão assíncrona)"""
+    usuario = await db.get(Usuario, principal.id)
+    if not usuario:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    return usuario
+
+# Prazos (s) das consultas externas do /aqi; ao estourar, usa o último valor conhecido
+AQI_PRAZO_OPENAQ = float(os.getenv("AQI_PRAZO_OPENAQ", "3"))
+AQI_PRAZO_CLIMA = float(os.getenv("AQI_PRAZO_CLIMA", "2"))
 
 # =============================================================================
 # CONFIGURAÇÃO DO CHATBOT
@@ -69,6 +120,8 @@ class AQIResponse(BaseModel):
     aqi_original: int
     aqi_personalizado: int
     nivel_alerta: str
+    # Origem de cada dado externo: acerto, consulta, obsoleto ou padrao
+    status_cache: Dict[str, str] = {}
     
 class PrevisaoDia(BaseModel):
     data: str
@@ -79,14 +132,38 @@ class PrevisaoAQIResponse(BaseModel):
     usuario: str
     previsoes: List[PrevisaoDia]
 
-# Carregar intents
+class HistoricoAQIItem(BaseModel):
+    data_hora: datetime
+    aqi_original: int
+    aqi_personalizado: int
+    nivel_alerta: Optional[str]
+
+class HistoricoAQIAgregadoItem(BaseModel):
+    inicio: datetime
+    amostras: int
+    aqi_original_min: int
+    aqi_original_medio: float
+    aqi_original_max: int
+    aqi_personalizado_min: int
+    aqi_personalizado_medio: float
+    aqi_personalizado_max: int
+
+class HistoricoAQIResponse(BaseModel):
+    resolucao: str
+    itens: List[Union[HistoricoAQIAgregadoItem, HistoricoAQIItem]]
+    proximo_cursor: Optional[str] = None
+
+# Intents do chatbot (lidos no primeiro uso, não na importação)
 intents_path = os.path.join(os.path.dirname(__file__), "..", "chatbot", "intents.json")
-try:
-    with open(intents_path, "r", encoding="utf-8") as f:
-        INTENTS = json.load(f)
-except FileNotFoundError:
-    print(f"⚠️ Arquivo intents.json não encontrado em: {intents_path}")
-    INTENTS = {"intents": []}
+
+@lru_cache(maxsize=1)
+def obter_intents() -> Dict:
+    try:
+        with open(intents_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"⚠️ Arquivo intents.json não encontrado em: {intents_path}")
+        return {"intents": []}
 
 # Contexto global do chatbot
 contexto = ConversaContexto()
@@ -189,6 +266,8 @@ def obter_modelo_gemini():
 
 # Função para gerar df_ultimo_dia simulado por cidade
 def gerar_df_cidade(cidade: str):
+    import pandas as pd  # importação adiada: pandas pesa no tempo de inicialização
+
     hoje = pd.Timestamp.now()
     return pd.DataFrame([{
         "data": hoje,
@@ -316,7 +395,7 @@ def responder_fallback(mensagem: str) -> str:
     msg_lower = mensagem.lower()
 
     # Checar intents predefinidos
-    for intent in INTENTS.get("intents", []):
+    for intent in obter_intents().get("intents", []):
         for keyword in intent.get("keywords", []):
             if keyword in msg_lower:
                 return intent.get("response", "Desculpe, não entendi.")
@@ -431,56 +510,50 @@ def chat(mensagem: Mensagem):
 # FUNÇÕES AUXILIARES
 # =============================================================================
 
-def obter_dados_meteorologia(cidade: str):
-    try:
-        params = {
-            "q": cidade,
-            "appid": OPENWEATHER_API_KEY,
-            "units": "metric"
-        }
-        resp = requests.get(OPENWEATHER_API_URL, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-
-        return {
-            "vento": data.get("wind_speed", 0),
-            "umidade": data.get("humidity", 50),
-            "temperatura": data.get("temperature", 25)
-        }
+async def obter_dados_meteorologia(cidade: str):
+    """Vento, umidade e temperatura da cidade (cliente de clima compartilhado, com cache)"""
+    return resumir_meteorologia(await cliente_clima.obter_por_cidade(cidade))
 
-    except Exception as e:
-        print(f"Erro NASA TEMPO: {e}")
+def resumir_meteorologia(clima: Optional[dict]):
+    """Campos usados no ajuste do AQI, com valores padrão se não houver clima"""
+    if clima is None:
         return {
             "vento": 4.5,
             "umidade": 65,
             "temperatura": 28
         }
 
+    return {
+        "vento": clima["vento"],
+        "umidade": clima["umidade"],
+        "temperatura": clima["temperatura"]
+    }
+
 # =============================================================================
 # ENDPOINTS DE USUÁRIO
 # =============================================================================
 
 @app.post("/usuario", summary="Criar novo usuário")
-def criar_usuario_endpoint(usuario: UsuarioCreate, db: Session = Depends(get_db)):
-    return criar_usuario(db, usuario)
+async def criar_usuario_endpoint(usuario: UsuarioCreate, db: Session = Depends(get_db)):
+    return await criar_usuario(db, usuario)
 
 @app.post("/token", response_model=LoginResponse, summary="OAuth2 Token (para Swagger)")
-def token_endpoint(
+async def token_endpoint(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     """Endpoint OAuth2 para autenticação no Swagger"""
-    return login_usuario(db, form_data.username, form_data.password)
+    return await login_usuario(db, form_data.username, form_data.password)
 
 @app.post("/login", response_model=LoginResponse, summary="Fazer login (JSON)")
-def login_endpoint(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login_endpoint(login_data: LoginRequest, db: Session = Depends(get_db)):
     """Autentica usuário e retorna token JWT (JSON)"""
-    return login_usuario(db, login_data.email, login_data.senha)
+    return await login_usuario(db, login_data.email, login_data.senha)
 
 @app.get("/me", response_model=UsuarioResponse, summary="Obter perfil do usuário logado")
-def get_me_endpoint(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_me_endpoint(usuario = Depends(get_authenticated_usuario)):
     """Retorna dados do usuário autenticado"""
-    return get_current_user(db, token)
+    return usuario
 
 @app.post("/perfil", summary="Criar perfil de saúde (requer autenticação)")
 def criar_perfil_endpoint(
@@ -516,7 +589,7 @@ def forgot_password(email: str = Form(...), db: Session = Depends(get_db)):
     return gerar_token_redefinicao(db, email)
 
 @app.post("/reset-password", summary="Redefinir senha com token de verificação")
-def reset_password(
+async def reset_password(
     token: str = Form(...),
     nova_senha: str = Form(...),
     db: Session = Depends(get_db)
@@ -524,20 +597,20 @@ def reset_password(
     """
     Permite redefinir a senha de um usuário com base no token enviado por e-mail.
     """
-    return redefinir_senha(db, token, nova_senha)
+    return await redefinir_senha(db, token, nova_senha)
 
 # =============================================================================
 # DELETAR USUÁRIO
 # =============================================================================
 
 @app.delete("/delete-account")
-def delete_account(
+async def delete_account(
     email: str = Form(...),
     senha: str = Form(...),
     db: Session = Depends(get_db)
 ):
     """Deleta conta do usuário após verificar credenciais"""
-    return crud.deletar_usuario(db, email, senha)
+    return await crud.deletar_usuario(db, email, senha)
 
 # =============================================================================
 # PREVISÃO DE AQI
@@ -553,11 +626,13 @@ def previsao_aqi_15_dias(
     Requer Bearer Token no header: Authorization: Bearer <token>
     """
     # 1. Busca perfil do usuário autenticado
-    perfil = obter_perfil_usuario(db, usuario_autenticado.id)
-    if not perfil:
+    perfil = obter_perfil_resumo(db, usuario_autenticado.id)
+    if not perfil or perfil.excluido:
         raise HTTPException(status_code=404, detail="Perfil de saúde não encontrado. Crie um perfil primeiro.")
     
     # 2. Criar DataFrame com dados do usuário
+    import pandas as pd
+
     df_ultimo_dia = pd.DataFrame([{
         "data": pd.Timestamp.today(),
         "T2M": 25,  # temperatura média
@@ -588,7 +663,7 @@ def previsao_aqi_15_dias(
 
     # 5. Retornar objeto Pydantic completo
     return PrevisaoAQIResponse(
-        usuario=perfil.usuario.nome,
+        usuario=perfil.nome,
         previsoes=previsoes
     )
 
@@ -597,36 +672,33 @@ def previsao_aqi_15_dias(
 # =============================================================================
 
 @app.get("/aqi", response_model=AQIResponse, summary="Obter AQI personalizado (requer autenticação)")
-def obter_aqi_personalizado(
-    usuario_autenticado = Depends(get_authenticated_user),
-    db: Session = Depends(get_db)
+async def obter_aqi_personalizado(
+    usuario_autenticado = Depends(get_authenticated_user)
 ):
     """
     Retorna AQI personalizado do usuário autenticado.
     Requer Bearer Token no header: Authorization: Bearer <token>
     """
     # Busca perfil do usuário autenticado
-    perfil = obter_perfil_usuario(db, usuario_autenticado.id)
-    if not perfil:
+    perfil = await obter_perfil_resumo_async(usuario_autenticado.id)
+    if not perfil or perfil.excluido:
         raise HTTPException(status_code=404, detail="Perfil de saúde não encontrado. Crie um perfil primeiro.")
 
-    cidade = perfil.usuario.cidade or "São Paulo"
+    cidade = perfil.cidade or "São Paulo"
 
-    # Obter AQI original da OpenAQ
-    try:
-        headers = {"X-API-Key": NASA_API_KEY}
-        params = {"city": cidade}
-        resp = requests.get(f"{OPENAQ_API}/locations", params=params, headers=headers)
-        dados = resp.json()
-        aqi_original = int(dados['results'][0]['measurements'][0]['value'])
-    except Exception:
-        aqi_original = 50  # valor default se API falhar
+    # AQI (OpenAQ) e clima da cidade em paralelo, com cache por cidade e prazo próprio
+    (aqi_original, status_aqi), (clima, status_clima) = await asyncio.gather(
+        obter_aqi_por_cidade(cidade, prazo=AQI_PRAZO_OPENAQ),
+        cliente_clima.obter_por_cidade_com_status(cidade, prazo=AQI_PRAZO_CLIMA)
+    )
+    if aqi_original is None:
+        aqi_original = 50  # valor default se a OpenAQ não tiver dados
 
     # Calcula AQI personalizado
     aqi_personalizado, nivel_alerta = calcular_indice_personalizado(aqi_original, perfil)
 
     # Ajusta AQI com meteorologia
-    meteorologia = obter_dados_meteorologia(cidade)
+    meteorologia = resumir_meteorologia(clima)
     aqi_personalizado = ajustar_aqi_com_meteorologia(
         aqi_personalizado,
         meteorologia["vento"],
@@ -644,21 +716,51 @@ def obter_aqi_personalizado(
     else:
         nivel_alerta = "vermelho"
 
-    # Salva histórico no banco
-    salvar_historico(db, usuario_id, aqi_original, aqi_personalizado, nivel_alerta)
+    # Salva histórico no banco (em segundo plano, gravado em lote)
+    registrar_historico(usuario_autenticado.id, aqi_original, aqi_personalizado, nivel_alerta)
 
-    # Envia alerta por email se AQI for alto
+    # Envia alerta por email se AQI for alto (enfileirado, enviado em segundo plano).
+    # Em thread: com a fila cheia o e-mail é gravado no spool (fsync), fora do event loop
     if nivel_alerta in ["laranja", "vermelho"]:
         assunto = f"Alerta de qualidade do ar: {nivel_alerta.upper()}"
-        mensagem_email = f"Olá {perfil.usuario.nome}, a qualidade do ar em {cidade} está {nivel_alerta}. AQI personalizado: {aqi_personalizado}"
-        try:
-            enviar_alerta_email(perfil.usuario.email, assunto, mensagem_email)
-        except Exception as e:
-            print(f"⚠️ Aviso: Não foi possível enviar alerta por e-mail: {e}")
+        mensagem_email = f"Olá {perfil.nome}, a qualidade do ar em {cidade} está {nivel_alerta}. AQI personalizado: {aqi_personalizado}"
+        await asyncio.to_thread(enfileirar_email, perfil.email, assunto, mensagem_email)
 
     # Retorna *objeto Pydantic*, que será convertido automaticamente em JSON
     return AQIResponse(
         aqi_original=int(aqi_original),
         aqi_personalizado=int(aqi_personalizado),
-        nivel_alerta=nivel_alerta
-    )
\ No newline at end of file
+        nivel_alerta=nivel_alerta,
+        status_cache={"openaq": status_aqi, "clima": status_clima}
+    )
+
+# =============================================================================
+# HISTÓRICO DE AQI
+# =============================================================================
+
+@app.get("/historico", response_model=HistoricoAQIResponse, summary="Histórico de AQI personalizado (requer autenticação)")
+async def historico_aqi(
+    resolucao: str = Query("bruto", pattern="^(bruto|hora|dia)$", description="bruto, hora ou dia"),
+    inicio: Optional[datetime] = Query(None, description="Início do período (padrão: 30 dias antes do fim)"),
+    fim: Optional[datetime] = Query(None, description="Fim do período (padrão: agora)"),
+    limite: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = Query(None, description="`proximo_cursor` da página anterior"),
+    usuario_autenticado = Depends(get_authenticated_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Histórico de AQI do usuário autenticado, do mais recente para o mais antigo.
+    Em "hora" e "dia" cada item traz mínimo, média e máximo do período.
+    """
+    fim = fim or datetime.utcnow()
+    inicio = inicio or fim - timedelta(days=30)
+    if inicio > fim:
+        raise HTTPException(status_code=422, detail="'inicio' deve ser anterior a 'fim'")
+
+    try:
+        itens, proximo_cursor = await run_in_threadpool(
+            consultar_historico, db, usuario_autenticado.id, resolucao, inicio, fim, limite, cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return HistoricoAQIResponse(resolucao=resolucao, itens=itens, proximo_cursor=proximo_cursor)
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Migrações simples do esquema.
+
+`Base.metadata.create_all` cria as tabelas que faltam, mas não altera as
+que já existem. `garantir_colunas` adiciona as colunas anuláveis declaradas
+nos modelos e ausentes no banco, e `garantir_indices` cria os índices.
+
+Uso:
+    python -m airqualityapp.migracoes
+"""
+import logging
+from typing import List
+
+from sqlalchemy import inspect, text
+
+from .database import Base, engine
+
+logger = logging.getLogger(__name__)
+
+
+def garantir_colunas(bind=engine) -> List[str]:
+    """Adiciona as colunas anuláveis declaradas que ainda não existem; retorna "tabela.coluna" das criadas"""
+    inspetor = inspect(bind)
+    tabelas_existentes = set(inspetor.get_table_names())
+    criadas = []
+    for tabela in Base.metadata.sorted_tables:
+        if tabela.name not in tabelas_existentes:
+            continue
+        existentes = {coluna["name"] for coluna in inspetor.get_columns(tabela.name)}
+        for coluna in tabela.columns:
+            if coluna.name in existentes:
+                continue
+            if not coluna.nullable or coluna.server_default is not None:
+                logger.warning(f"Coluna {tabela.name}.{coluna.name} ausente: requer migração manual")
+                continue
+            logger.info(f"Adicionando coluna {coluna.name} em {tabela.name}")
+            tipo = coluna.type.compile(dialect=bind.dialect)
+            with bind.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}"))
+            criadas.append(f"{tabela.name}.{coluna.name}")
+    return criadas
+
+
+def garantir_indices(bind=engine) -> List[str]:
+    """Cria os índices declarados que ainda não existem; retorna os nomes criados"""
+    inspetor = inspect(bind)
+    tabelas_existentes = set(inspetor.get_table_names())
+    criados = []
+    for tabela in Base.metadata.sorted_tables:
+        if tabela.name not in tabelas_existentes:
+            continue
+        existentes = {indice["name"] for indice in inspetor.get_indexes(tabela.name)}
+        for indice in tabela.indexes:
+            if indice.name not in existentes:
+                logger.info(f"Criando índice {indice.name} em {tabela.name}")
+                indice.create(bind=bind)
+                criados.append(indice.name)
+    return criados
+
+
+def _registrar_modelos():
+    """Importa os modelos dos dois apps para que todas as tabelas estejam no metadata"""
+    from . import models  # noqa: F401
+    import airmonitor.models  # noqa: F401
+
+
+def migrar(bind=engine) -> List[str]:
+    """Cria tabelas, colunas e índices ausentes; retorna os índices criados"""
+    _registrar_modelos()
+    Base.metadata.create_all(bind=bind)
+    garantir_colunas(bind)
+    return garantir_indices(bind)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    criados = migrar()
+    print(f"Migração concluída ({len(criados)} índice(s) criado(s))")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, TIMESTAMP
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, ForeignKey, TIMESTAMP, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from .database import Base  # <-- use ponto para importação relativa
 
@@ -14,8 +14,6 @@ class Usuario(Base):
     data_nascimento = Column(Date, nullable=True)
     cidade = Column(String(255), nullable=True)
     estado = Column(String(255), nullable=True)
-    reset_token_hash = Column(String(255), nullable=True)
-    reset_expires_at = Column(TIMESTAMP, nullable=True)
 
 
 class PerfilSaude(Base):
@@ -23,7 +21,7 @@ class PerfilSaude(Base):
     __table_args__ = {"extend_existing": True}  # <-- importante
 
     id = Column(Integer, primary_key=True, index=True)
-    usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False)
+    usuario_id = Column(Integer, ForeignKey("usuario.id", ondelete="CASCADE"), nullable=False)
     possui_asma = Column(Boolean, default=False)
     possui_dpoc = Column(Boolean, default=False)
     possui_alergias = Column(Boolean, default=False)
@@ -34,17 +32,64 @@ class PerfilSaude(Base):
 
 class AQIPersonalizadoHistorico(Base):
     __tablename__ = "aqi_personalizado_historico"
+    __table_args__ = (
+        Index("ix_aqi_personalizado_historico_usuario_data", "usuario_id", "data_hora"),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    usuario_id = Column(Integer, ForeignKey("usuario.id"))
+    usuario_id = Column(Integer, ForeignKey("usuario.id", ondelete="CASCADE"))
     data_hora = Column(TIMESTAMP, server_default=func.now())
     aqi_original = Column(Integer)
     aqi_personalizado = Column(Integer)
     nivel_alerta = Column(String(100))
+    # Instante da inserção pelo relógio do banco (data_hora é fixada quando a linha entra no buffer)
+    gravado_em = Column(TIMESTAMP, default=func.now())
 
 class AlertasEnviados(Base):
     __tablename__ = "alertas_enviados"
     id = Column(Integer, primary_key=True)
-    usuario_id = Column(Integer, ForeignKey("usuario.id"))
+    usuario_id = Column(Integer, ForeignKey("usuario.id", ondelete="CASCADE"))
     nivel_alerta = Column(String(100))
     data_hora = Column(TIMESTAMP, server_default=func.now())
-    metodo = Column(String(50))
\ No newline at end of file
+    metodo = Column(String(50))
+
+class ExclusaoPendente(Base):
+    """Contas excluídas cujos dados ainda estão sendo expurgados (ver exclusao.py)"""
+    __tablename__ = "exclusao_pendente"
+    id = Column(Integer, primary_key=True)
+    usuario_id = Column(Integer, unique=True, nullable=False)
+    solicitado_em = Column(TIMESTAMP, server_default=func.now())
+
+class TokenRedefinicao(Base):
+    """Tokens de redefinição de senha (apenas o hash SHA-256 é guardado)"""
+    __tablename__ = "token_redefinicao"
+    id = Column(Integer, primary_key=True)
+    usuario_id = Column(Integer, ForeignKey("usuario.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    expira_em = Column(TIMESTAMP, nullable=False, index=True)
+    criado_em = Column(TIMESTAMP, server_default=func.now())
+
+
+class AQIHistoricoAgregado(Base):
+    """Mínimo/média/máximo do histórico de AQI por usuário, em buckets de hora ou dia (UTC)"""
+    __tablename__ = "aqi_historico_agregado"
+    __table_args__ = (
+        UniqueConstraint("usuario_id", "resolucao", "inicio", name="uq_aqi_historico_agregado_bucket"),
+    )
+    id = Column(Integer, primary_key=True)
+    usuario_id = Column(Integer, ForeignKey("usuario.id", ondelete="CASCADE"), nullable=False)
+    resolucao = Column(String(10), nullable=False)
+    inicio = Column(TIMESTAMP, nullable=False)
+    amostras = Column(Integer, nullable=False, default=0)
+    aqi_original_min = Column(Integer)
+    aqi_original_max = Column(Integer)
+    aqi_original_soma = Column(BigInteger, default=0)
+    aqi_personalizado_min = Column(Integer)
+    aqi_personalizado_max = Column(Integer)
+    aqi_personalizado_soma = Column(BigInteger, default=0)
+
+
+class MarcaAgregacao(Base):
+    """Último id do histórico já incorporado aos agregados"""
+    __tablename__ = "marca_agregacao"
+    nome = Column(String(50), primary_key=True)
+    ultimo_id = Column(Integer, nullable=False, default=0)
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+Cache em memória dos perfis de saúde.
+
+Os endpoints leem `PerfilResumo` (campos do perfil e do usuário usados na
+personalização) de um cache LRU+TTL por usuario_id. Alterações no perfil ou
+exclusão do usuário chamam `invalidar_perfil`, que publica no canal de
+invalidação para que todos os workers descartem a entrada.
+"""
+import os
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session, joinedload
+
+from .cache import CacheTTL
+from .database import SessionLocal
+from .extensoes import carregar_implementacao
+from .models import PerfilSaude, ExclusaoPendente
+
+load_dotenv()
+
+PERFIL_CACHE_TTL = float(os.getenv("PERFIL_CACHE_TTL", "600"))
+PERFIL_CACHE_MAX_ENTRADAS = int(os.getenv("PERFIL_CACHE_MAX_ENTRADAS", "100000"))
+# Usuários sem perfil também são lembrados, por menos tempo
+PERFIL_CACHE_TTL_AUSENTE = float(os.getenv("PERFIL_CACHE_TTL_AUSENTE", "60"))
+# "local" ou caminho "modulo:Classe" de um canal entre workers (ex.: Redis pub/sub)
+PERFIL_CANAL_INVALIDACAO = os.getenv("PERFIL_CANAL_INVALIDACAO", "local")
+
+logger = logging.getLogger(__name__)
+
+_SEM_PERFIL = object()
+
+
+@dataclass(frozen=True)
+class PerfilResumo:
+    usuario_id: int
+    possui_asma: bool
+    possui_dpoc: bool
+    possui_alergias: bool
+    fumante: bool
+    sensibilidade_alta: bool
+    nome: Optional[str] = None
+    email: Optional[str] = None
+    cidade: Optional[str] = None
+    # Conta excluída cujos dados ainda estão sendo expurgados: não personalizar nem registrar histórico
+    excluido: bool = False
+
+    @classmethod
+    def de_modelo(cls, perfil: PerfilSaude, excluido: bool = False) -> "PerfilResumo":
+        usuario = perfil.usuario
+        return cls(
+            usuario_id=perfil.usuario_id,
+            possui_asma=bool(perfil.possui_asma),
+            possui_dpoc=bool(perfil.possui_dpoc),
+            possui_alergias=bool(perfil.possui_alergias),
+            fumante=bool(perfil.fumante),
+            sensibilidade_alta=bool(perfil.sensibilidade_alta),
+            nome=usuario.nome if usuario else None,
+            email=usuario.email if usuario else None,
+            cidade=usuario.cidade if usuario else None,
+            excluido=excluido
+        )
+
+
+class CanalInvalidacao(ABC):
+    """Interface do canal de invalidação entre workers"""
+
+    @abstractmethod
+    def publicar(self, usuario_id: int):
+        ...
+
+    @abstractmethod
+    def assinar(self, callback: Callable[[int], None]):
+        ...
+
+
+class CanalInvalidacaoLocal(CanalInvalidacao):
+    """Canal dentro do próprio processo (um único worker ou desenvolvimento)"""
+
+    def __init__(self):
+        self._callbacks: List[Callable[[int], None]] = []
+
+    def publicar(self, usuario_id: int):
+        for callback in self._callbacks:
+            callback(usuario_id)
+
+    def assinar(self, callback: Callable[[int], None]):
+        self._callbacks.append(callback)
+
+
+def carregar_canal(caminho: str) -> CanalInvalidacao:
+    return carregar_implementacao(caminho, CanalInvalidacao, {"local": CanalInvalidacaoLocal})
+
+
+cache_perfis = CacheTTL(ttl=PERFIL_CACHE_TTL, max_entradas=PERFIL_CACHE_MAX_ENTRADAS)
+canal_invalidacao = carregar_canal(PERFIL_CANAL_INVALIDACAO)
+canal_invalidacao.assinar(cache_perfis.invalidar)
+
+
+def invalidar_perfil(usuario_id: int):
+    """Descarta o perfil em cache em todos os workers"""
+    cache_perfis.invalidar(usuario_id)
+    try:
+        canal_invalidacao.publicar(usuario_id)
+    except Exception as e:
+        logger.error(f"Erro ao publicar invalidação do perfil {usuario_id}: {e}")
+
+
+def _guardar(usuario_id: int, perfil: Optional[PerfilResumo]):
+    if perfil is None:
+        cache_perfis.definir(usuario_id, _SEM_PERFIL, ttl=PERFIL_CACHE_TTL_AUSENTE)
+    else:
+        cache_perfis.definir(usuario_id, perfil)
+
+
+def perfil_em_cache(usuario_id: int):
+    """Retorna (encontrado, perfil) sem acessar o banco"""
+    valor = cache_perfis.obter(usuario_id)
+    if valor is None:
+        return False, None
+    return True, None if valor is _SEM_PERFIL else valor
+
+
+def _consultar_perfis(db: Session):
+    # O perfil é o último dado expurgado: até lá, a exclusão pendente marca a conta como excluída
+    return db.query(PerfilSaude, ExclusaoPendente.id)\
+             .options(joinedload(PerfilSaude.usuario))\
+             .outerjoin(ExclusaoPendente, ExclusaoPendente.usuario_id == PerfilSaude.usuario_id)
+
+
+def _carregar_perfil(db: Session, usuario_id: int) -> Optional[PerfilResumo]:
+    linha = _consultar_perfis(db).filter(PerfilSaude.usuario_id == usuario_id).first()
+    perfil = PerfilResumo.de_modelo(linha[0], excluido=linha[1] is not None) if linha else None
+    _guardar(usuario_id, perfil)
+    return perfil
+
+
+def obter_perfil_resumo(db: Session, usuario_id: int) -> Optional[PerfilResumo]:
+    encontrado, perfil = perfil_em_cache(usuario_id)
+    if encontrado:
+        return perfil
+    return _carregar_perfil(db, usuario_id)
+
+
+def _carregar_perfil_sessao_propria(usuario_id: int) -> Optional[PerfilResumo]:
+    # A Session não é thread-safe: a thread usa a sua, e não a da requisição, que
+    # pode ser fechada enquanto a consulta ainda roda (ex.: prazo estourado)
+    with SessionLocal() as db:
+        return _carregar_perfil(db, usuario_id)
+
+
+async def obter_perfil_resumo_async(usuario_id: int) -> Optional[PerfilResumo]:
+    """Como `obter_perfil_resumo`, indo ao banco (em thread, com sessão própria) apenas se não estiver em cache"""
+    encontrado, perfil = perfil_em_cache(usuario_id)
+    if encontrado:
+        return perfil
+    return await asyncio.to_thread(_carregar_perfil_sessao_propria, usuario_id)
+
+
+def obter_perfis_resumo(db: Session, usuario_ids: Iterable[int]) -> Dict[int, PerfilResumo]:
+    """Perfis de vários usuários: acertos do cache e uma única consulta para o restante"""
+    perfis = {}
+    faltantes = []
+    for usuario_id in set(usuario_ids):
+        encontrado, perfil = perfil_em_cache(usuario_id)
+        if not encontrado:
+            faltantes.append(usuario_id)
+        elif perfil is not None:
+            perfis[usuario_id] = perfil
+
+    if faltantes:
+        linhas = _consultar_perfis(db).filter(PerfilSaude.usuario_id.in_(faltantes)).all()
+        encontrados = {m.usuario_id: PerfilResumo.de_modelo(m, excluido=exclusao is not None)
+                       for m, exclusao in linhas}
+        for usuario_id in faltantes:
+            _guardar(usuario_id, encontrados.get(usuario_id))
+        perfis.update(encontrados)
+
+    return perfis
@@ -0,0 +1,85 @@
+"""
+Hash e verificação de senhas (bcrypt) em um pool de processos dedicado.
+
+O bcrypt consome ~250ms de CPU por chamada; executá-lo nos workers da API
+bloqueia as demais rotas durante picos de login. Aqui as chamadas vão para
+um ProcessPoolExecutor de tamanho fixo, com no máximo `SENHA_POOL_PENDENTES`
+chamadas aguardando — as seguintes esperam a vez sem ocupar threads. Se um
+processo do pool morrer (ex.: OOM), o pool quebrado é descartado e a chamada
+é repetida uma vez em um pool novo.
+"""
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from .utils import hash_senha, verify_password, hash_senha_legacy
+
+load_dotenv()
+
+SENHA_POOL_PROCESSOS = int(os.getenv("SENHA_POOL_PROCESSOS", str(max(1, (os.cpu_count() or 2) // 2))))
+SENHA_POOL_PENDENTES = int(os.getenv("SENHA_POOL_PENDENTES", str(SENHA_POOL_PROCESSOS * 4)))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_limite: Optional[asyncio.Semaphore] = None
+
+logger = logging.getLogger(__name__)
+
+
+def obter_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # "spawn" evita herdar o event loop e conexões abertas do processo da API
+        _executor = ProcessPoolExecutor(
+            max_workers=SENHA_POOL_PROCESSOS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def _descartar_executor(quebrado: ProcessPoolExecutor):
+    global _executor
+    # Várias chamadas podem falhar com o mesmo pool: só a primeira o substitui
+    if _executor is quebrado:
+        _executor = None
+    quebrado.shutdown(wait=False, cancel_futures=True)
+
+
+async def _executar(funcao, *args):
+    global _limite
+    if _limite is None:
+        _limite = asyncio.Semaphore(SENHA_POOL_PENDENTES)
+    async with _limite:
+        loop = asyncio.get_running_loop()
+        executor = obter_executor()
+        try:
+            return await loop.run_in_executor(executor, funcao, *args)
+        except BrokenProcessPool as e:
+            logger.error(f"Pool de senhas quebrado ({e}); recriando e repetindo a chamada")
+            _descartar_executor(executor)
+            return await loop.run_in_executor(obter_executor(), funcao, *args)
+
+
+async def hash_senha_async(senha: str) -> str:
+    return await _executar(hash_senha, senha)
+
+
+async def verificar_senha_async(senha: str, senha_hash: Optional[str]) -> bool:
+    if senha_hash is None:
+        return False
+    # Hash legado não usa bcrypt: comparação direta, sem passar pelo pool
+    if senha_hash.startswith("HASH_"):
+        return senha_hash == hash_senha_legacy(senha)
+    return await _executar(verify_password, senha, senha_hash)
+
+
+async def encerrar_pool_senhas():
+    global _executor, _limite
+    if _executor is not None:
+        await asyncio.to_thread(_executor.shutdown, True)
+        _executor = None
+    _limite = None
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas assíncronas concorrentes com a mesma chave: apenas a
+    primeira executa a função, as demais aguardam e recebem o mesmo
+    resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._em_andamento: Dict[Hashable, asyncio.Task] = {}
+        self.executadas = 0
+        self.compartilhadas = 0
+
+    async def executar(self, chave: Hashable, funcao: Callable[[], Awaitable]):
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is None:
+            # A chamada roda em uma tarefa própria para não ser cancelada
+            # junto com o primeiro chamador
+            tarefa = asyncio.ensure_future(funcao())
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda t: self._finalizar(chave, t))
+            self.executadas += 1
+        else:
+            self.compartilhadas += 1
+        return await asyncio.shield(tarefa)
+
+    def _finalizar(self, chave: Hashable, tarefa: asyncio.Task):
+        if self._em_andamento.get(chave) is tarefa:
+            del self._em_andamento[chave]
+        # Marca a exceção como consumida mesmo se todos os chamadores desistirem
+        if not tarefa.cancelled():
+            tarefa.exception()
+
+    def estatisticas(self) -> dict:
+        return {
+            "em_andamento": len(self._em_andamento),
+            "executadas": self.executadas,
+            "compartilhadas": self.compartilhadas
+        }
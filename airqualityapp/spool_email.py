@@ -0,0 +1,230 @@
+"""
+Spool durável dos e-mails que não puderam ser enviados.
+
+Os e-mails ficam em um banco SQLite local (`EMAIL_SPOOL_PATH`, modo WAL com
+synchronous=FULL), cada um com um id uuid4. `gravar` só retorna depois que
+o e-mail está no disco; gravações simultâneas são confirmadas juntas (group
+commit): quem chega enquanto um grupo está sendo gravado entra no próximo,
+e uma única transação (um fsync) cobre o grupo inteiro.
+
+Todo e-mail enfileirado pelo mail_sender é gravado aqui já reservado
+(`EMAIL_SPOOL_RESERVA` segundos) enquanto está na fila em memória; o reenvio
+reserva lotes de e-mails vencidos da mesma forma. Os e-mails são removidos
+apenas após o envio confirmado; reservas de um processo que caiu expiram e os
+e-mails voltam a ser enviados.
+"""
+import os
+import glob
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMAIL_FALLBACK_DIR = os.getenv("EMAIL_FALLBACK_DIR", "email_fallback")
+EMAIL_SPOOL_PATH = os.getenv("EMAIL_SPOOL_PATH") or os.path.join(EMAIL_FALLBACK_DIR, "spool.db")
+# Por quanto tempo um e-mail reservado (na fila em memória ou em reenvio) fica fora
+# das próximas reservas; deve cobrir a espera na fila e as novas tentativas em memória
+EMAIL_SPOOL_RESERVA = float(os.getenv("EMAIL_SPOOL_RESERVA", "300"))
+EMAIL_SPOOL_BACKOFF_BASE = float(os.getenv("EMAIL_SPOOL_BACKOFF_BASE", "30"))
+EMAIL_SPOOL_BACKOFF_MAX = float(os.getenv("EMAIL_SPOOL_BACKOFF_MAX", "3600"))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS spool_email (
+    id TEXT PRIMARY KEY,
+    destino TEXT NOT NULL,
+    assunto TEXT NOT NULL,
+    mensagem TEXT NOT NULL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    criado_em REAL NOT NULL,
+    proxima_em REAL NOT NULL,
+    reservado_ate REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_spool_email_proxima_em ON spool_email (proxima_em);
+"""
+
+# Separador dos arquivos .txt do fallback antigo
+_SEPARADOR_LEGADO = "=" * 50
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Grupo:
+    registros: list = field(default_factory=list)
+    gravado: bool = False
+    erro: Optional[Exception] = None
+
+
+class SpoolEmail:
+    """Fila durável de e-mails em SQLite com group commit"""
+
+    def __init__(self, caminho: str = EMAIL_SPOOL_PATH):
+        self.caminho = caminho
+        self._conexao: Optional[sqlite3.Connection] = None
+        self._lock_db = threading.Lock()
+        self._cond = threading.Condition()
+        self._grupo = _Grupo()
+        self._gravando = False
+        self.gravados = 0
+        self.grupos = 0
+        self.confirmados = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, check_same_thread=False, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=FULL")
+            conexao.executescript(_ESQUEMA)
+            self._conexao = conexao
+        return self._conexao
+
+    @contextmanager
+    def _transacao(self):
+        with self._lock_db:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def gravar(self, destino: str, assunto: str, mensagem: str, reservar: bool = False) -> str:
+        """
+        Grava o e-mail no spool e retorna o id; só retorna após a gravação em
+        disco. Com `reservar`, o e-mail fica fora do reenvio por EMAIL_SPOOL_RESERVA.
+        """
+        return self.gravar_lote([(destino, assunto, mensagem)], reservar)[0]
+
+    def gravar_lote(self, emails: Iterable[Tuple[str, str, str]], reservar: bool = False) -> List[str]:
+        agora = time.time()
+        reservado_ate = agora + EMAIL_SPOOL_RESERVA if reservar else 0
+        registros = [(uuid.uuid4().hex, destino, assunto, mensagem, agora, agora, reservado_ate)
+                     for destino, assunto, mensagem in emails]
+
+        with self._cond:
+            grupo = self._grupo
+            grupo.registros.extend(registros)
+            while not grupo.gravado:
+                if self._gravando:
+                    self._cond.wait()
+                    continue
+                # Sem gravação em andamento: esta thread grava o grupo em formação,
+                # incluindo os registros das threads que estão esperando
+                self._gravando = True
+                lote, self._grupo = self._grupo, _Grupo()
+                self._cond.release()
+                try:
+                    self._inserir(lote.registros)
+                except Exception as e:
+                    lote.erro = e
+                finally:
+                    self._cond.acquire()
+                lote.gravado = True
+                self._gravando = False
+                self._cond.notify_all()
+
+        if grupo.erro is not None:
+            raise grupo.erro
+        return [registro[0] for registro in registros]
+
+    def _inserir(self, registros: list):
+        with self._transacao() as db:
+            db.executemany(
+                "INSERT INTO spool_email (id, destino, assunto, mensagem, criado_em, proxima_em, reservado_ate) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", registros
+            )
+        self.gravados += len(registros)
+        self.grupos += 1
+
+    def reservar(self, limite: int) -> List[tuple]:
+        """Reserva até `limite` e-mails vencidos: [(id, destino, assunto, mensagem, tentativas)]"""
+        agora = time.time()
+        with self._transacao() as db:
+            linhas = db.execute(
+                "SELECT id, destino, assunto, mensagem, tentativas FROM spool_email "
+                "WHERE proxima_em <= ? AND reservado_ate <= ? ORDER BY proxima_em LIMIT ?",
+                (agora, agora, limite)
+            ).fetchall()
+            db.executemany("UPDATE spool_email SET reservado_ate = ? WHERE id = ?",
+                           [(agora + EMAIL_SPOOL_RESERVA, linha[0]) for linha in linhas])
+        return linhas
+
+    def confirmar(self, ids: List[str]):
+        """Remove os e-mails enviados (ou descartados definitivamente)"""
+        with self._transacao() as db:
+            db.executemany("DELETE FROM spool_email WHERE id = ?", [(i,) for i in ids])
+        self.confirmados += len(ids)
+
+    def adiar(self, id_email: str, tentativas: int):
+        """Devolve o e-mail ao spool após uma falha, com espera exponencial"""
+        espera = min(EMAIL_SPOOL_BACKOFF_BASE * 2 ** max(tentativas - 1, 0), EMAIL_SPOOL_BACKOFF_MAX)
+        with self._transacao() as db:
+            db.execute("UPDATE spool_email SET tentativas = ?, proxima_em = ?, reservado_ate = 0 WHERE id = ?",
+                       (tentativas, time.time() + espera, id_email))
+
+    def liberar(self, ids: List[str]):
+        """Desfaz reservas de e-mails que não serão enviados por este processo (vão para o reenvio)"""
+        with self._transacao() as db:
+            db.executemany("UPDATE spool_email SET reservado_ate = 0 WHERE id = ?", [(i,) for i in ids])
+
+    def pendentes(self) -> int:
+        with self._lock_db:
+            return self._db().execute("SELECT COUNT(*) FROM spool_email").fetchone()[0]
+
+    def importar_fallback_legado(self, diretorio: str = EMAIL_FALLBACK_DIR) -> int:
+        """Move para o spool os e-mails salvos em .txt pelo fallback antigo"""
+        arquivos = sorted(glob.glob(os.path.join(diretorio, "email_*.txt")))
+        emails, importados = [], []
+        for arquivo in arquivos:
+            try:
+                emails.append(_ler_fallback_legado(arquivo))
+                importados.append(arquivo)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Arquivo de fallback ignorado ({arquivo}): {e}")
+        if not emails:
+            return 0
+
+        self.gravar_lote(emails)
+        for arquivo in importados:
+            os.remove(arquivo)
+        logger.info(f"{len(emails)} e-mails do fallback antigo importados para o spool")
+        return len(emails)
+
+    def fechar(self):
+        with self._lock_db:
+            if self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
+
+    def estatisticas(self) -> dict:
+        return {
+            "pendentes": self.pendentes(),
+            "gravados": self.gravados,
+            "grupos": self.grupos,
+            "confirmados": self.confirmados
+        }
+
+
+def _ler_fallback_legado(arquivo: str) -> Tuple[str, str, str]:
+    with open(arquivo, encoding="utf-8") as f:
+        linhas = f.read().split("\n")
+    inicio = linhas.index(_SEPARADOR_LEGADO)
+    fim = linhas.index(_SEPARADOR_LEGADO, inicio + 1)
+    cabecalho = dict(linha.split(": ", 1) for linha in linhas[:inicio] if ": " in linha)
+    return cabecalho["Para"], cabecalho["Assunto"], "\n".join(linhas[inicio + 1:fim])
+
+
+spool_email = SpoolEmail()
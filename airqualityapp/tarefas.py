@@ -0,0 +1,62 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TarefaPeriodica:
+    """
+    Executa `funcao` em uma thread própria a cada `intervalo` segundos.
+    `acordar()` antecipa a próxima execução; `parar()` encerra a thread
+    (por padrão executando a função uma última vez).
+    """
+
+    def __init__(self, nome: str, funcao: Callable[[], None], intervalo: float):
+        self.nome = nome
+        self.funcao = funcao
+        self.intervalo = intervalo
+        self._evento = threading.Event()
+        self._parando = False
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ativa(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        with self._lock:
+            if self.ativa:
+                return
+            self._parando = False
+            self._evento.clear()
+            self._thread = threading.Thread(target=self._loop, name=self.nome, daemon=True)
+            self._thread.start()
+
+    def acordar(self):
+        self._evento.set()
+
+    def _executar(self):
+        try:
+            self.funcao()
+        except Exception as e:
+            logger.error(f"Erro na tarefa periódica '{self.nome}': {e}")
+
+    def _loop(self):
+        while not self._parando:
+            self._evento.wait(self.intervalo)
+            self._evento.clear()
+            if self._parando:
+                break
+            self._executar()
+
+    def parar(self, executar_final: bool = True, timeout: Optional[float] = 10.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._parando = True
+            self._evento.set()
+        if thread is not None:
+            thread.join(timeout)
+        if executar_final:
+            self._executar()
@@ -0,0 +1,42 @@
+"""
+Limpeza periódica dos tokens de redefinição de senha expirados.
+
+Tokens usados são removidos na própria redefinição; os que expiram sem uso
+são apagados aqui, em lotes curtos pelo índice de `expira_em`.
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from .database import excluir_em_lotes
+from .models import TokenRedefinicao
+from .tarefas import TarefaPeriodica
+
+load_dotenv()
+
+TOKEN_LIMPEZA_INTERVALO = float(os.getenv("TOKEN_LIMPEZA_INTERVALO", "900"))
+TOKEN_LIMPEZA_LOTE = int(os.getenv("TOKEN_LIMPEZA_LOTE", "1000"))
+
+logger = logging.getLogger(__name__)
+
+
+def limpar_tokens_expirados() -> int:
+    tabela = TokenRedefinicao.__table__
+    total = excluir_em_lotes(tabela, tabela.c.expira_em < datetime.utcnow(), TOKEN_LIMPEZA_LOTE)
+    if total:
+        logger.info(f"{total} tokens de redefinição expirados removidos")
+    return total
+
+
+_tarefa_limpeza = TarefaPeriodica("limpeza-tokens-redefinicao", limpar_tokens_expirados, TOKEN_LIMPEZA_INTERVALO)
+
+
+async def iniciar_limpeza_tokens():
+    _tarefa_limpeza.iniciar()
+
+
+async def parar_limpeza_tokens():
+    await asyncio.to_thread(_tarefa_limpeza.parar, False)
@@ -1,6 +1,7 @@
 import random
 import os
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 # ==============================
 # 🔐 Configurações de segurança
@@ -15,14 +16,15 @@ ALGORITHM = "HS256"
 # ==============================
 # 🔑 Segurança e autenticação
 # ==============================
-from passlib.context import CryptContext
-
-# CryptContext para bcrypt (padrão moderno)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache(maxsize=None)
+def _contexto_senhas():
+    """CryptContext para bcrypt (padrão moderno), criado no primeiro uso: passlib pesa na importação"""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def hash_senha_bcrypt(senha: str) -> str:
     """Gera hash bcrypt (usa truncamento para 72 bytes)."""
-    return pwd_context.hash(senha[:72])
+    return _contexto_senhas().hash(senha[:72])
 
 # compatibilidade com o hash antigo "HASH_<senha>"
 def hash_senha_legacy(senha: str) -> str:
@@ -48,9 +50,9 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     if isinstance(hashed_password, str) and hashed_password.startswith("HASH_"):
         return hashed_password == hash_senha_legacy(plain_password)
 
-    # Caso normal: bcrypt (ou outros suportados pelo pwd_context)
+    # Caso normal: bcrypt (ou outros suportados pelo CryptContext)
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return _contexto_senhas().verify(plain_password, hashed_password)
     except Exception:
         # se o formato do hash for desconhecido, retorna False
         return False
@@ -75,19 +77,25 @@ def obter_dados_meteorologia(lat, lon):
 # ==============================
 # 📊 Cálculos de qualidade do ar
 # ==============================
-def calcular_indice_personalizado(aqi_original, perfil):
-    ajuste = 0
-
-    def get_attr(obj, key):
-        if isinstance(obj, dict):
-            return obj.get(key, False)
-        return getattr(obj, key, False)
+# Acréscimo ao AQI por condição de saúde
+PESOS_PERFIL = {
+    "possui_asma": 20,
+    "possui_dpoc": 15,
+    "possui_alergias": 10,
+    "fumante": 10,
+    "sensibilidade_alta": 5,
+}
+
+NIVEIS_ALERTA = ["verde", "amarelo", "laranja", "vermelho"]
+LIMITES_NIVEIS = [50, 100, 150]
+
+def _get_attr(obj, key):
+    if isinstance(obj, dict):
+        return obj.get(key, False)
+    return getattr(obj, key, False)
 
-    if get_attr(perfil, "possui_asma"): ajuste += 20
-    if get_attr(perfil, "possui_dpoc"): ajuste += 15
-    if get_attr(perfil, "possui_alergias"): ajuste += 10
-    if get_attr(perfil, "fumante"): ajuste += 10
-    if get_attr(perfil, "sensibilidade_alta"): ajuste += 5
+def calcular_indice_personalizado(aqi_original, perfil):
+    ajuste = sum(peso for campo, peso in PESOS_PERFIL.items() if _get_attr(perfil, campo))
 
     aqi_personalizado = aqi_original + ajuste
     if aqi_personalizado <= 50:
@@ -101,6 +109,25 @@ def calcular_indice_personalizado(aqi_original, perfil):
 
     return aqi_personalizado, nivel_alerta
 
+def calcular_indices_personalizados_lote(aqi_original, perfis):
+    """
+    Versão vetorizada de calcular_indice_personalizado.
+    `aqi_original` é uma sequência de N valores e `perfis` uma lista de N
+    perfis (dict ou objeto). Retorna arrays (aqi_personalizado, nivel_alerta).
+    """
+    import numpy as np
+
+    aqi = np.asarray(aqi_original, dtype=np.float64)
+    condicoes = np.array(
+        [[bool(_get_attr(perfil, campo)) for campo in PESOS_PERFIL] for perfil in perfis],
+        dtype=np.float64
+    ).reshape(len(perfis), len(PESOS_PERFIL))
+
+    aqi_personalizado = aqi + condicoes @ np.array(list(PESOS_PERFIL.values()), dtype=np.float64)
+    faixa = np.searchsorted(LIMITES_NIVEIS, aqi_personalizado, side="left")
+    nivel_alerta = np.array(NIVEIS_ALERTA, dtype=object)[np.minimum(faixa, len(NIVEIS_ALERTA) - 1)]
+    return aqi_personalizado, nivel_alerta
+
 def ajustar_aqi_com_meteorologia(aqi, vento, umidade, temperatura):
     if vento > 5: aqi -= 5
     if umidade > 70: aqi += 5
@@ -1,7 +1,7 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-import pandas as pd
+from functools import lru_cache
 import json
 import random
 import os
@@ -19,15 +19,21 @@ app = APIRouter()
 class Mensagem(BaseModel):
     texto: str
 
-# Carregar intents
-with open("chatbot/intents.json", "r", encoding="utf-8") as f:
-    INTENTS = json.load(f)
+# Intents predefinidos (lidos no primeiro uso, não na importação)
+INTENTS_PATH = os.path.join(os.path.dirname(__file__), "intents.json")
+
+@lru_cache(maxsize=1)
+def obter_intents() -> Dict:
+    with open(INTENTS_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 # Contexto global
 contexto = ConversaContexto()
 
 # Função para gerar df_ultimo_dia simulado por cidade
 def gerar_df_cidade(cidade: str):
+    import pandas as pd  # importação adiada: pandas pesa no tempo de inicialização
+
     hoje = pd.Timestamp.now()
     return pd.DataFrame([{
         "data": hoje,
@@ -268,7 +274,7 @@ def responder_fallback(mensagem: str) -> str:
     msg_lower = mensagem.lower()
 
     # Checar intents predefinidos
-    for intent in INTENTS["intents"]:
+    for intent in obter_intents()["intents"]:
         for keyword in intent["keywords"]:
             if keyword in msg_lower:
                 return intent["response"]
@@ -1,11 +1,63 @@
-import uvicorn
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from sqlalchemy import text
 from chatbot.bot import app as chatbot_app
-from airqualityapp.main2 import app as airquality_app
-from airmonitor.main3 import app as airmonitor_app
+from airqualityapp import main2 as airquality
+from airmonitor import main3 as airmonitor
+from airqualityapp.database import engine
+from ml.ml_model import obter_modelo
 from fastapi.middleware.cors import CORSMiddleware  
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Módulos com tarefas em segundo plano, na ordem de inicialização. O encerramento
+# segue a ordem inversa: o monitor para de produzir histórico e alertas antes de
+# o buffer de histórico e as conexões do airqualityapp serem fechados.
+MODULOS = (airquality, airmonitor)
+
+
+def _aquecer_banco():
+    """Abre a primeira conexão do pool antes da primeira requisição"""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def _em_segundo_plano(nome: str, funcao):
+    try:
+        await asyncio.to_thread(funcao)
+        logger.info(f"{nome}: pronto")
+    except Exception as e:
+        logger.error(f"{nome}: falhou ({e})")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Conexão com o banco e modelo de previsão são preparados em segundo plano;
+    # a API já atende enquanto isso (o primeiro uso aguarda o que faltar)
+    preparos = [
+        asyncio.create_task(_em_segundo_plano("Conexão com o banco", _aquecer_banco)),
+        asyncio.create_task(_em_segundo_plano("Modelo de previsão", obter_modelo)),
+    ]
+    # Apenas os módulos que chegaram a iniciar são encerrados (ex.: falha no segundo)
+    iniciados = []
+    try:
+        for modulo in MODULOS:
+            await modulo.iniciar()
+            iniciados.append(modulo)
+        logger.info("Aplicativo iniciado!")
+        yield
+    finally:
+        await asyncio.gather(*preparos, return_exceptions=True)
+        for modulo in reversed(iniciados):
+            try:
+                await modulo.encerrar()
+            except Exception as e:
+                logger.error(f"Erro ao encerrar {modulo.__name__}: {e}")
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -35,9 +87,11 @@ def root():
     }
 
 app.include_router(chatbot_app, prefix="/chatbot", tags=["Chatbot"])
-app.include_router(airquality_app, prefix="/airquality", tags=["Air Quality"])
-app.include_router(airmonitor_app, prefix="/airmonitor", tags=["Air Monitor"])
+app.include_router(airquality.app, prefix="/airquality", tags=["Air Quality"])
+app.include_router(airmonitor.app, prefix="/airmonitor", tags=["Air Monitor"])
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,13 +1,28 @@
-from xgboost import XGBRegressor
-import joblib
+import threading
+
+# xgboost e joblib são importados apenas quando usados (importá-los custa ~200ms)
+_modelo = None
+_lock_modelo = threading.Lock()
 
 def treinar_modelo(X_train, y_train):
+    from xgboost import XGBRegressor
     model = XGBRegressor(n_estimators=200, learning_rate=0.1, max_depth=5, random_state=42)
     model.fit(X_train, y_train)
     return model
 
 def salvar_modelo(model, caminho="ml/modelo_aqi.pkl"):
+    import joblib
     joblib.dump(model, caminho)
 
 def carregar_modelo(caminho="ml/modelo_aqi.pkl"):
-    return joblib.load(caminho)
\ No newline at end of file
+    import joblib
+    return joblib.load(caminho)
+
+def obter_modelo():
+    """Modelo padrão, carregado do disco uma única vez por processo"""
+    global _modelo
+    if _modelo is None:
+        with _lock_modelo:
+            if _modelo is None:
+                _modelo = carregar_modelo()
+    return _modelo
\ No newline at end of file
@@ -1,11 +1,10 @@
-from .ml_model import carregar_modelo
-import pandas as pd
+from .ml_model import obter_modelo
 from datetime import timedelta
 
 FEATURES = ["T2M", "WS10M", "ALLSKY_SFC_SW_DWN", "dia_ano", "mes", "possui_asma", "fumante", "sensibilidade_alta"]
 
 def prever_proximos_15_dias(df_ultimo_dia):
-    model = carregar_modelo()
+    model = obter_modelo()
     previsoes = []
     ultimo_dia = df_ultimo_dia["data"].max()
     X_last = df_ultimo_dia[FEATURES].iloc[-1:]
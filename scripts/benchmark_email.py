@@ -0,0 +1,61 @@
+"""
+Benchmark do envio de e-mails pela fila com conexões SMTP persistentes.
+
+Enfileira N e-mails e mede quanto tempo o remetente leva para enviá-los
+com cada número de conexões. Use um servidor SMTP local, por exemplo:
+
+    python -m aiosmtpd -n -l localhost:8025
+
+Uso:
+    python scripts/benchmark_email.py --emails 10000 --conexoes 1 4 8 --porta 8025
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from airqualityapp.mail_sender import RemetenteEmail  # noqa: E402
+from airqualityapp.spool_email import SpoolEmail  # noqa: E402
+
+
+def medir(host: str, porta: int, conexoes: int, emails: int, lote: int) -> tuple:
+    remetente = RemetenteEmail(host=host, porta=porta, usuario=None, senha=None, usar_tls=False,
+                               conexoes=conexoes, lote=lote, fila_max=emails,
+                               spool=SpoolEmail(os.path.join(tempfile.gettempdir(), "benchmark_email_spool.db")))
+    inicio = time.perf_counter()
+    # Enfileiramento concorrente, como nas requisições: as gravações no spool são confirmadas em grupo
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(
+            lambda i: remetente.enfileirar(f"usuario{i}@exemplo.com", "Alerta de qualidade do ar",
+                                           f"Mensagem de teste {i}"),
+            range(emails)
+        ))
+    while remetente.enviados + remetente.descartados + remetente.no_spool < emails:
+        time.sleep(0.05)
+    duracao = time.perf_counter() - inicio
+    remetente.parar()
+    return duracao, remetente.estatisticas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--porta", type=int, default=8025)
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--conexoes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--lote", type=int, default=50)
+    args = parser.parse_args()
+
+    for conexoes in args.conexoes:
+        duracao, estatisticas = medir(args.host, args.porta, conexoes, args.emails, args.lote)
+        print(f"{conexoes} conexões: {args.emails} e-mails em {duracao:.2f}s "
+              f"({args.emails / duracao:.0f}/s), {estatisticas['conexoes_criadas']} conexões criadas, "
+              f"{estatisticas['no_spool']} no spool")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark de verificação de senhas (custo dominante do login).
+
+Mede verificações bcrypt por segundo para cada tamanho do pool de processos
+e o maior atraso observado no event loop durante a rajada, comparando com a
+verificação feita diretamente no worker da API.
+
+Uso:
+    python scripts/benchmark_login.py --logins 64 --pools 1 2 4
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from airqualityapp import senhas  # noqa: E402
+from airqualityapp.utils import hash_senha, verify_password  # noqa: E402
+
+SENHA = "senha-de-teste-123"
+
+
+async def _medir_atraso_loop(parar: asyncio.Event, intervalo: float = 0.01) -> float:
+    """Maior atraso (s) de um timer de `intervalo` enquanto a rajada roda"""
+    maior = 0.0
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        maior = max(maior, time.perf_counter() - inicio - intervalo)
+    return maior
+
+
+async def _rajada(logins: int, senha_hash: str, verificar) -> tuple:
+    parar = asyncio.Event()
+    medidor = asyncio.create_task(_medir_atraso_loop(parar))
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(verificar(SENHA, senha_hash) for _ in range(logins)))
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    atraso = await medidor
+    assert all(resultados)
+    return logins / duracao, atraso
+
+
+async def _verificar_inline(senha: str, senha_hash: str) -> bool:
+    return verify_password(senha, senha_hash)
+
+
+async def main(logins: int, pools):
+    senha_hash = hash_senha(SENHA)
+    print(f"{'modo':<12}{'processos':>10}{'logins/s':>12}{'atraso máx. do loop':>22}")
+
+    rps, atraso = await _rajada(logins, senha_hash, _verificar_inline)
+    print(f"{'inline':<12}{'-':>10}{rps:>12.1f}{atraso * 1000:>19.0f} ms")
+
+    for processos in pools:
+        await senhas.encerrar_pool_senhas()
+        senhas.SENHA_POOL_PROCESSOS = processos
+        senhas.SENHA_POOL_PENDENTES = processos * 4
+        # Aquecimento: sobe os processos antes de medir
+        await asyncio.gather(*(senhas.verificar_senha_async(SENHA, senha_hash) for _ in range(processos)))
+        rps, atraso = await _rajada(logins, senha_hash, senhas.verificar_senha_async)
+        print(f"{'pool':<12}{processos:>10}{rps:>12.1f}{atraso * 1000:>19.0f} ms")
+
+    await senhas.encerrar_pool_senhas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64, help="verificações por rodada")
+    parser.add_argument("--pools", type=int, nargs="+", default=[1, 2, 4], help="tamanhos de pool a testar")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.pools))
@@ -0,0 +1,85 @@
+"""
+Verificação do tempo de importação da aplicação (cold start).
+
+Executa `python -X importtime -c "import main"` em processos novos, lê o
+tempo acumulado de importação de `main` e termina com código 1 se a rodada
+mais rápida passar do limite — o mínimo é a medida menos afetada por ruído da
+máquina (outros processos, disco frio), que só consegue deixar a importação
+mais lenta, nunca mais rápida. Mostra também as importações diretas de
+`main` que mais pesam, para achar a regressão.
+
+Uso:
+    python scripts/verificar_tempo_import.py --limite 1.0 --rodadas 5
+"""
+import os
+import re
+import sys
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "import time:   self [us] | cumulative | nome" (nome indentado pela profundidade)
+_LINHA = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def medir(modulo: str):
+    """Retorna (segundos acumulados de `modulo`, [(segundos, importação direta)])"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = RAIZ + os.pathsep + env.get("PYTHONPATH", "")
+    if "DATABASE_URL" not in env and not os.path.exists(os.path.join(RAIZ, ".env")):
+        # A importação não acessa o banco; qualquer URL válida serve
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.gettempdir(), 'verificar_import.db')}"
+
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ, env=env, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {modulo}:\n{resultado.stderr[-2000:]}")
+
+    linhas = []
+    for linha in resultado.stderr.splitlines():
+        encontrado = _LINHA.match(linha)
+        if encontrado:
+            cumulativo, recuo, nome = int(encontrado.group(2)), len(encontrado.group(3)), encontrado.group(4)
+            linhas.append((cumulativo / 1e6, recuo, nome))
+
+    # O módulo medido aparece por último, sem recuo extra; as importações diretas
+    # dele são as linhas com um nível de recuo a mais
+    total = next(seg for seg, recuo, nome in reversed(linhas) if nome == modulo and recuo == 1)
+    diretas = sorted(((seg, nome) for seg, recuo, nome in linhas if recuo == 3), reverse=True)
+    return total, diretas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modulo", default="main", help="módulo a importar")
+    parser.add_argument("--limite", type=float, default=1.0, help="tempo máximo de importação (s)")
+    parser.add_argument("--rodadas", type=int, default=5, help="processos medidos (após um de aquecimento)")
+    parser.add_argument("--top", type=int, default=10, help="importações diretas mais lentas a listar")
+    args = parser.parse_args()
+
+    # Aquecimento: compila os .pyc para não contar na medição
+    medir(args.modulo)
+
+    medicoes = [medir(args.modulo) for _ in range(args.rodadas)]
+    tempos = [total for total, _ in medicoes]
+    minimo = min(tempos)
+
+    print(f"import {args.modulo}: mín {minimo:.3f}s (mediana {statistics.median(tempos):.3f}s, "
+          f"máx {max(tempos):.3f}s, {args.rodadas} rodadas) — limite {args.limite:.3f}s")
+    print("Importações diretas mais lentas (última rodada):")
+    for segundos, nome in medicoes[-1][1][:args.top]:
+        print(f"  {segundos:8.3f}s  {nome}")
+
+    if minimo > args.limite:
+        print(f"FALHOU: importação acima do limite em {minimo - args.limite:.3f}s")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()